@@ -0,0 +1,385 @@
+# audit_archive.py
+"""
+Archivo del registro de auditoría.
+
+Los registros más viejos que el horizonte configurado se mueven de data.db a
+un archivo SQLite por mes (archivo_auditoria/auditoria_AAAA_MM.db), con el
+nombre y rol del usuario ya copiados para que el archivo se lea solo. Cada
+mes se copia, se verifica la cantidad de filas y recién entonces se borra de
+la base principal; si algo se interrumpe, volver a correrlo es seguro (los
+ids ya copiados se ignoran).
+
+obtener_registro_completo() sigue la misma paginación por (fecha_hora, id)
+que obtener_registro_auditoria: primero la base principal y, al agotarse,
+los meses archivados del más nuevo al más viejo. Cada archivo tiene su propio
+índice FTS5, así el texto se busca igual que en la base principal.
+"""
+import json
+import os
+import re
+import sqlite3
+from datetime import date
+import database
+from database import (
+    db_read_connection, marcar_cambios, obtener_registro_auditoria, consulta_fts, TOKENIZADOR_FTS
+)
+
+CARPETA_ARCHIVO = "archivo_auditoria"
+MESES_A_CONSERVAR = 12
+TAMANO_LOTE = 5000
+
+_COLUMNAS = (
+    "id, usuario_id, nombre_usuario, rol, fecha_hora, accion, descripcion, "
+    "entidad_tipo, entidad_id, monto, datos"
+)
+
+
+def obtener_carpeta_archivo():
+    """Carpeta de los archivos mensuales, junto a la base de datos en uso."""
+    return os.path.join(os.path.dirname(os.path.abspath(database.DB_PATH)), CARPETA_ARCHIVO)
+
+
+def _ruta_mes(mes):
+    return os.path.join(obtener_carpeta_archivo(), f"auditoria_{mes.replace('-', '_')}.db")
+
+
+def meses_archivados():
+    """Meses ('AAAA-MM') con archivo, del más nuevo al más viejo."""
+    carpeta = obtener_carpeta_archivo()
+    if not os.path.isdir(carpeta):
+        return []
+    meses = []
+    for nombre in os.listdir(carpeta):
+        encontrado = re.fullmatch(r"auditoria_(\d{4})_(\d{2})\.db", nombre)
+        if encontrado:
+            meses.append(f"{encontrado.group(1)}-{encontrado.group(2)}")
+    return sorted(meses, reverse=True)
+
+
+def _abrir_mes(mes, solo_lectura=False):
+    ruta = _ruta_mes(mes)
+    if solo_lectura:
+        return sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+    os.makedirs(obtener_carpeta_archivo(), exist_ok=True)
+    conn = sqlite3.connect(ruta)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS registro_auditoria (
+            id INTEGER PRIMARY KEY,
+            usuario_id INTEGER NOT NULL,
+            nombre_usuario TEXT,
+            rol TEXT,
+            fecha_hora TEXT NOT NULL,
+            accion TEXT NOT NULL,
+            descripcion TEXT,
+            entidad_tipo TEXT,
+            entidad_id INTEGER,
+            monto REAL,
+            datos TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archivo_fecha ON registro_auditoria(fecha_hora)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_archivo_entidad ON registro_auditoria(entidad_tipo, entidad_id)")
+    _crear_indice_fts(conn)
+    return conn
+
+
+def _crear_indice_fts(conn):
+    """
+    El mismo índice que auditoria_fts de la base principal (accion,
+    descripcion y tokenizador). Los archivos solo reciben INSERT, así que
+    alcanza con un trigger. Los archivos creados antes del índice lo
+    reconstruyen la primera vez que se abren para escribir.
+    """
+    if _tiene_fts(conn):
+        return True
+    try:
+        conn.execute(f"""
+            CREATE VIRTUAL TABLE auditoria_fts USING fts5(
+                accion, descripcion,
+                content = 'registro_auditoria', content_rowid = 'id',
+                tokenize = '{TOKENIZADOR_FTS}', prefix = '2 3'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 no disponible, el archivo de auditoría se buscará con LIKE: {e}")
+        return False
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS auditoria_fts_ai AFTER INSERT ON registro_auditoria BEGIN
+            INSERT INTO auditoria_fts(rowid, accion, descripcion)
+            VALUES (new.id, new.accion, new.descripcion);
+        END
+    """)
+    conn.execute("INSERT INTO auditoria_fts(auditoria_fts) VALUES ('rebuild')")
+    conn.commit()
+    return True
+
+
+def _tiene_fts(conn):
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'auditoria_fts'"
+    ).fetchone() is not None
+
+
+def _abrir_mes_para_buscar(mes, texto):
+    """Abre el mes en solo lectura; si se busca texto y le falta el índice FTS, lo agrega antes."""
+    conn = _abrir_mes(mes, solo_lectura=True)
+    if texto and not _tiene_fts(conn):
+        conn.close()
+        try:
+            _abrir_mes(mes).close()
+        except sqlite3.Error as e:
+            print(f"No se pudo indexar el archivo de auditoría {mes}: {e}")
+        conn = _abrir_mes(mes, solo_lectura=True)
+    return conn
+
+
+# ============================================================================
+# MOVER REGISTROS AL ARCHIVO
+# ============================================================================
+def _mes_limite(meses_a_conservar):
+    """Primer mes ('AAAA-MM') que se conserva en la base principal."""
+    hoy = date.today()
+    total = hoy.year * 12 + (hoy.month - 1) - meses_a_conservar
+    return f"{total // 12:04d}-{total % 12 + 1:02d}"
+
+
+@db_read_connection
+def _meses_a_archivar(cursor, limite):
+    cursor.execute(
+        "SELECT substr(fecha_hora, 1, 7) AS mes, COUNT(*) FROM registro_auditoria "
+        "WHERE fecha_hora < ? GROUP BY mes ORDER BY mes",
+        (limite,)
+    )
+    return cursor.fetchall()
+
+
+@db_read_connection
+def _leer_mes(cursor, desde, hasta, despues_de_id, limite):
+    cursor.execute("""
+        SELECT ra.id, ra.usuario_id, u.nombre_usuario, u.rol, ra.fecha_hora, ra.accion,
+               ra.descripcion, ra.entidad_tipo, ra.entidad_id, ra.monto, ra.datos
+        FROM registro_auditoria ra
+        LEFT JOIN usuarios u ON ra.usuario_id = u.id
+        WHERE ra.fecha_hora >= ? AND ra.fecha_hora < ? AND ra.id > ?
+        ORDER BY ra.id
+        LIMIT ?
+    """, (desde, hasta, despues_de_id, limite))
+    return cursor.fetchall()
+
+
+def _siguiente_mes(mes):
+    anio, numero = int(mes[:4]), int(mes[5:7])
+    return f"{anio + numero // 12:04d}-{numero % 12 + 1:02d}"
+
+
+@database.db_connection
+def _borrar_mes(cursor, desde, hasta, esperados):
+    marcar_cambios("auditoria")
+    cursor.execute(
+        "DELETE FROM registro_auditoria WHERE fecha_hora >= ? AND fecha_hora < ?",
+        (desde, hasta)
+    )
+    if cursor.rowcount != esperados:
+        # Llegaron registros nuevos al mes mientras se copiaba: no se borra nada
+        raise sqlite3.IntegrityError(
+            f"se iban a borrar {cursor.rowcount} registros y se copiaron {esperados}"
+        )
+    return True
+
+
+def archivar_mes(mes, esperados):
+    """
+    Copia el mes ('AAAA-MM') a su archivo, verifica la cantidad y lo borra de
+    la base principal. Devuelve la cantidad movida o un texto "Error: ...".
+    """
+    desde, hasta = mes, _siguiente_mes(mes)
+    conn = _abrir_mes(mes)
+    try:
+        ultimo_id = 0
+        while True:
+            filas = _leer_mes(desde, hasta, ultimo_id, TAMANO_LOTE)
+            if filas is None:
+                return f"Error: No se pudo leer la auditoría de {mes}."
+            if not filas:
+                break
+            conn.executemany(
+                f"INSERT OR IGNORE INTO registro_auditoria ({_COLUMNAS}) VALUES ({', '.join('?' * 11)})",
+                filas
+            )
+            ultimo_id = filas[-1][0]
+        conn.commit()
+
+        archivados = conn.execute(
+            "SELECT COUNT(*) FROM registro_auditoria WHERE fecha_hora >= ? AND fecha_hora < ?",
+            (desde, hasta)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+
+    if archivados != esperados:
+        return f"Error: El archivo de {mes} tiene {archivados} registros y la base {esperados}; no se borró nada."
+    if not _borrar_mes(desde, hasta, esperados):
+        return f"Error: No se pudo borrar {mes} de la base principal (quedó copiado en el archivo)."
+    return esperados
+
+
+def archivar_auditoria(meses_a_conservar=MESES_A_CONSERVAR):
+    """
+    Mueve al archivo los meses anteriores a los últimos `meses_a_conservar`.
+    Devuelve una lista de (mes, resultado), donde resultado es la cantidad
+    movida o un texto "Error: ...".
+    """
+    limite = _mes_limite(meses_a_conservar)
+    resultados = []
+    for mes, cantidad in _meses_a_archivar(limite) or []:
+        resultados.append((mes, archivar_mes(mes, cantidad)))
+    return resultados
+
+
+# ============================================================================
+# CONSULTA SOBRE BASE PRINCIPAL + ARCHIVO
+# ============================================================================
+def _filtros_archivo(conn, texto=None, categoria=None, usuario=None, rol=None,
+                     fecha_desde=None, fecha_hasta=None, entidad_tipo=None, entidad_id=None):
+    # Mismos filtros que _filtros_auditoria de database.py, incluida la
+    # búsqueda de texto con FTS5 más el nombre de usuario (LIKE solo si el
+    # archivo no tiene índice).
+    condiciones, params = [], []
+    if entidad_tipo:
+        condiciones.append("entidad_tipo = ?")
+        params.append(entidad_tipo)
+        if entidad_id is not None:
+            condiciones.append("entidad_id = ?")
+            params.append(entidad_id)
+    consulta = consulta_fts(texto) if texto else ""
+    if consulta and _tiene_fts(conn):
+        condiciones.append(
+            "(id IN (SELECT rowid FROM auditoria_fts WHERE auditoria_fts MATCH ?) OR nombre_usuario LIKE ?)"
+        )
+        params += [consulta, f"%{texto}%"]
+    elif texto:
+        patron = f"%{texto}%"
+        condiciones.append("(accion LIKE ? OR descripcion LIKE ? OR nombre_usuario LIKE ?)")
+        params += [patron, patron, patron]
+    if categoria:
+        condiciones.append("accion GLOB ?")
+        params.append(f"{categoria}*")
+    if usuario:
+        condiciones.append("nombre_usuario = ?")
+        params.append(usuario)
+    if rol:
+        condiciones.append("rol = ?")
+        params.append(rol)
+    if fecha_desde:
+        condiciones.append("fecha_hora >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta:
+        condiciones.append("fecha_hora < date(?, '+1 day')")
+        params.append(fecha_hasta)
+    return condiciones, params
+
+
+def _consultar_archivo(limite, despues_de=None, incluir_id=False, **filtros):
+    campos = "id, fecha_hora, nombre_usuario, rol, accion, descripcion"
+    if not incluir_id:
+        campos = campos[len("id, "):]
+
+    fecha_desde = filtros.get("fecha_desde")
+    fecha_hasta = filtros.get("fecha_hasta")
+    filas = []
+    for mes in meses_archivados():
+        if len(filas) >= limite:
+            break
+        # Meses fuera del rango pedido o posteriores a la última fila vista
+        if fecha_desde and mes < fecha_desde[:7]:
+            break
+        if (fecha_hasta and mes > fecha_hasta[:7]) or (despues_de and mes > despues_de[0][:7]):
+            continue
+        try:
+            conn = _abrir_mes_para_buscar(mes, filtros.get("texto"))
+        except sqlite3.Error as e:
+            print(f"No se pudo abrir el archivo de auditoría {mes}: {e}")
+            continue
+        try:
+            condiciones, params = _filtros_archivo(conn, **filtros)
+            if despues_de is not None:
+                fecha_hora, id_registro = despues_de
+                condiciones.append("fecha_hora <= ? AND (fecha_hora < ? OR id < ?)")
+                params += [fecha_hora, fecha_hora, id_registro]
+            where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+            filas += conn.execute(
+                f"SELECT {campos} FROM registro_auditoria {where} "
+                f"ORDER BY fecha_hora DESC, id DESC LIMIT ?",
+                params + [limite - len(filas)]
+            ).fetchall()
+        except sqlite3.Error as e:
+            print(f"Error al leer el archivo de auditoría {mes}: {e}")
+        finally:
+            conn.close()
+    return filas
+
+
+def iterar_archivo(tamano_lote=5000, **filtros):
+    """
+    Lotes de los meses archivados (del más nuevo al más viejo) con los filtros
+    de obtener_registro_auditoria; columnas como las de la base sin id.
+    """
+    fecha_desde, fecha_hasta = filtros.get("fecha_desde"), filtros.get("fecha_hasta")
+    for mes in meses_archivados():
+        if (fecha_desde and mes < fecha_desde[:7]) or (fecha_hasta and mes > fecha_hasta[:7]):
+            continue
+        conn = _abrir_mes_para_buscar(mes, filtros.get("texto"))
+        try:
+            condiciones, params = _filtros_archivo(conn, **filtros)
+            where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+            cursor = conn.execute(
+                f"SELECT fecha_hora, nombre_usuario, rol, accion, descripcion FROM registro_auditoria "
+                f"{where} ORDER BY fecha_hora DESC, id DESC",
+                params
+            )
+            while True:
+                lote = cursor.fetchmany(tamano_lote)
+                if not lote:
+                    break
+                yield lote
+        finally:
+            conn.close()
+
+
+def obtener_registro_completo(limite=500, despues_de=None, incluir_id=False, **filtros):
+    """
+    Igual que obtener_registro_auditoria, pero al terminarse la base principal
+    sigue con los meses archivados (que son siempre más viejos).
+    """
+    filas = obtener_registro_auditoria(
+        limite, despues_de=despues_de, incluir_id=incluir_id, **filtros
+    )
+    if filas is None:
+        return None
+    if len(filas) < limite and meses_archivados():
+        filas = list(filas) + _consultar_archivo(
+            limite - len(filas), despues_de=despues_de, incluir_id=incluir_id, **filtros
+        )
+    return filas
+
+
+def obtener_evento_archivado(id_registro, fecha_hora):
+    """Como obtener_evento_auditoria, para un registro que ya está en el archivo."""
+    mes = fecha_hora[:7]
+    if mes not in meses_archivados():
+        return None
+    conn = _abrir_mes(mes, solo_lectura=True)
+    try:
+        fila = conn.execute(
+            "SELECT fecha_hora, nombre_usuario, accion, descripcion, entidad_tipo, entidad_id, monto, datos "
+            "FROM registro_auditoria WHERE id = ?",
+            (id_registro,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Error al leer el archivo de auditoría {mes}: {e}")
+        return None
+    finally:
+        conn.close()
+    if fila is None:
+        return None
+    return fila[:7] + (json.loads(fila[7]) if fila[7] else {},)
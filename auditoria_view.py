@@ -4,17 +4,29 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from ttkbootstrap.dialogs import Querybox
 from tkinter import messagebox, filedialog
-from database import obtener_registro_auditoria
-from datetime import datetime, timedelta
-import csv
+from database import (contar_registro_auditoria, buscar_registro_auditoria,
+                      obtener_evento_auditoria, obtener_usuarios)
+from audit_archive import obtener_registro_completo, obtener_evento_archivado, meses_archivados
+from export_engine import ExportJob, formatos_disponibles
+from virtual_treeview import VirtualTreeview
+from debounced_search import DebouncedSearch
+from datetime import date, datetime, timedelta
+import re
 
 class AuditoriaView:
+    MAX_RESULTADOS_RELEVANCIA = 500
+    # "venta #4812" busca por entidad (columna indexada) en lugar de por texto
+    PATRON_ENTIDAD = re.compile(
+        r"^(venta|compra|producto|cierre|usuario|deudor|proveedor|categoria)\s*#\s*(\d+)$", re.IGNORECASE
+    )
+
     def __init__(self, master):
         self.master = master
         self.frame = ttk.Frame(master, padding=15)
         self.frame.pack(fill=BOTH, expand=True)
 
-        self.datos_completos = []
+        self.total_registros = 0
+        self.exportacion = None
         
         self.categorias_acciones = {
             "TODAS": "Todas las Acciones",
@@ -47,7 +59,7 @@ class AuditoriaView:
         
         ttk.Button(
             header_frame,
-            text="📊 Exportar a CSV",
+            text="📊 Exportar",
             command=self.exportar_csv,
             bootstyle="success-outline"
         ).pack(side=RIGHT, padx=5)
@@ -70,8 +82,11 @@ class AuditoriaView:
         ttk.Label(row1, text="Buscar:", font=("Helvetica", 10, "bold")).pack(side=LEFT, padx=(0, 5))
         self.search_var = ttk.StringVar()
         search_entry = ttk.Entry(row1, textvariable=self.search_var, width=40)
-        search_entry.pack(side=LEFT, padx=(0, 20))
-        search_entry.bind("<KeyRelease>", lambda e: self.aplicar_filtros())
+        search_entry.pack(side=LEFT, padx=(0, 5))
+        ttk.Label(row1, text="(ej.: venta #4812)", font=("Helvetica", 8)).pack(side=LEFT, padx=(0, 20))
+        search_entry.bind("<KeyRelease>", lambda e: self.aplicar_filtros(esperar=True))
+        # Filtros y paginación se resuelven en SQL, en segundo plano.
+        self.buscador = DebouncedSearch(search_entry, self._consultar, self._mostrar_resultado)
         
         ttk.Label(row1, text="Categoría:", font=("Helvetica", 10, "bold")).pack(side=LEFT, padx=(0, 5))
         self.categoria_var = ttk.StringVar(value="TODAS")
@@ -85,6 +100,16 @@ class AuditoriaView:
         categoria_combo.pack(side=LEFT)
         categoria_combo.bind("<<ComboboxSelected>>", lambda e: self.aplicar_filtros())
 
+        # Con texto: los más relevantes primero (acepta "frases entre comillas")
+        self.relevancia_var = ttk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            row1,
+            text="Ordenar por relevancia",
+            variable=self.relevancia_var,
+            command=self.aplicar_filtros,
+            bootstyle="round-toggle"
+        ).pack(side=LEFT, padx=(20, 0))
+
         # FILA 2: Usuario y Rol
         row2 = ttk.Frame(filtros_frame)
         row2.pack(fill=X, pady=(0, 10))
@@ -168,7 +193,7 @@ class AuditoriaView:
 
         self.stats_label = ttk.Label(
             stats_frame,
-            text="📊 Total de registros: 0 | Mostrando: 0",
+            text="📊 Total de registros: 0 | Coinciden: 0",
             font=("Helvetica", 10, "bold"),
             bootstyle="info"
         )
@@ -182,7 +207,7 @@ class AuditoriaView:
         scrollbar_x = ttk.Scrollbar(table_frame, orient=HORIZONTAL)
 
         self.columns = ("fecha_hora", "usuario", "rol", "accion", "descripcion")
-        self.tree = ttk.Treeview(
+        self.tree = VirtualTreeview(
             table_frame,
             columns=self.columns,
             show="headings",
@@ -216,128 +241,138 @@ class AuditoriaView:
 
         self.tree.tag_configure('selected', foreground='black')
         self.tree.tag_bind('<<TreeviewSelect>>', lambda e: None)
+        self.tree.bind("<Double-1>", self.mostrar_detalle_evento)
         
         scrollbar_y.pack(side=RIGHT, fill=Y)
         scrollbar_x.pack(side=BOTTOM, fill=X)
         self.tree.pack(side=LEFT, fill=BOTH, expand=True)
 
     def cargar_datos_auditoria(self):
-        """Carga todos los registros de auditoría desde la base de datos."""
-        try:
-            registros = obtener_registro_auditoria(limite=1000)
-            
-            if not registros:
-                self.datos_completos = []
-                self.mostrar_en_tabla([])
-                messagebox.showinfo("Sin Registros", "No hay registros de auditoría disponibles.", parent=self.frame.winfo_toplevel())
-                return
-
-            self.datos_completos = []
-            usuarios_unicos = set()
-            roles_unicos = set()
-
-            # ✅ CORRECCIÓN CRÍTICA: Ahora desempaquetamos 5 valores (con rol)
-            for registro in registros:
-                fecha_hora, usuario, rol, accion, descripcion = registro
-                
-                usuarios_unicos.add(usuario)
-                roles_unicos.add(rol)
-                
-                self.datos_completos.append((fecha_hora, usuario, rol, accion, descripcion))
-
-            usuarios_lista = ["Todos"] + sorted(list(usuarios_unicos))
-            self.usuario_combo.config(values=usuarios_lista)
-
-            self.limpiar_fecha_desde()
-            self.limpiar_fecha_hasta()
-            
-            self.aplicar_filtros()
-
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cargar los registros de auditoría:\n{e}", parent=self.frame.winfo_toplevel())
-
-    def aplicar_filtros(self):
-        """Aplica todos los filtros activos a los datos."""
-        if not self.datos_completos:
-            self.mostrar_en_tabla([])
-            return
+        """Recarga la lista de usuarios y vuelve a consultar con los filtros actuales."""
+        usuarios = obtener_usuarios() or []
+        self.usuario_combo.config(values=["Todos"] + [u[1] for u in usuarios])
+        self.fecha_desde_entry.entry.delete(0, 'end')
+        self.fecha_hasta_entry.entry.delete(0, 'end')
+        self.aplicar_filtros()
 
-        busqueda = self.search_var.get().lower().strip()
-        categoria_seleccionada = self.categoria_var.get()
-        usuario_seleccionado = self.usuario_var.get()
-        rol_seleccionado = self.rol_var.get()
-        fecha_desde = self.fecha_desde_entry.entry.get().strip()
-        fecha_hasta = self.fecha_hasta_entry.entry.get().strip()
+    def refrescar(self):
+        """Al volver a la vista: nuevos eventos o usuarios, conservando los filtros."""
+        usuarios = obtener_usuarios() or []
+        self.usuario_combo.config(values=["Todos"] + [u[1] for u in usuarios])
+        self.aplicar_filtros()
 
+    @staticmethod
+    def _fecha_valida(texto):
+        """La fecha escrita (AAAA-MM-DD) o None si está vacía o mal formada."""
+        try:
+            return date.fromisoformat(texto.strip()).isoformat()
+        except ValueError:
+            return None
+
+    def _filtros_actuales(self):
         categoria_clave = next(
-            (k for k, v in self.categorias_acciones.items() if v == categoria_seleccionada),
+            (k for k, v in self.categorias_acciones.items() if v == self.categoria_var.get()),
             "TODAS"
         )
+        texto = self.search_var.get().strip() or None
+        entidad = self.PATRON_ENTIDAD.match(texto) if texto else None
+        return {
+            "texto": None if entidad else texto,
+            "entidad_tipo": entidad.group(1).lower() if entidad else None,
+            "entidad_id": int(entidad.group(2)) if entidad else None,
+            "categoria": None if categoria_clave == "TODAS" else categoria_clave,
+            "usuario": None if self.usuario_var.get() == "Todos" else self.usuario_var.get(),
+            "rol": None if self.rol_var.get() == "Todos" else self.rol_var.get(),
+            "fecha_desde": self._fecha_valida(self.fecha_desde_entry.entry.get()),
+            "fecha_hasta": self._fecha_valida(self.fecha_hasta_entry.entry.get()),
+        }
 
-        datos_filtrados = []
-        for fecha_hora, usuario, rol, accion, descripcion in self.datos_completos:
-            
-            if busqueda:
-                texto_completo = f"{fecha_hora} {usuario} {accion} {descripcion}".lower()
-                if busqueda not in texto_completo:
-                    continue
-
-            if categoria_clave != "TODAS":
-                if not accion.startswith(categoria_clave):
-                    continue
-
-            if usuario_seleccionado != "Todos":
-                if usuario != usuario_seleccionado:
-                    continue
-
-            if rol_seleccionado != "Todos":
-                if rol != rol_seleccionado:
-                    continue
-
-            if fecha_desde:
-                try:
-                    fecha_registro = datetime.strptime(fecha_hora.split()[0], "%Y-%m-%d")
-                    fecha_filtro_desde = datetime.strptime(fecha_desde, "%Y-%m-%d")
-                    if fecha_registro < fecha_filtro_desde:
-                        continue
-                except ValueError:
-                    pass
-
-            if fecha_hasta:
-                try:
-                    fecha_registro = datetime.strptime(fecha_hora.split()[0], "%Y-%m-%d")
-                    fecha_filtro_hasta = datetime.strptime(fecha_hasta, "%Y-%m-%d")
-                    if fecha_registro > fecha_filtro_hasta:
-                        continue
-                except ValueError:
-                    pass
-
-            datos_filtrados.append((fecha_hora, usuario, rol, accion, descripcion))
-
-        self.mostrar_en_tabla(datos_filtrados)
-
-    def mostrar_en_tabla(self, datos):
-        """Muestra los datos en el Treeview."""
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-
-        for idx, (fecha_hora, usuario, rol, accion, descripcion) in enumerate(datos):
-            tags = ["oddrow" if idx % 2 == 0 else "evenrow"]
-            
-            if "CREADO" in accion or "AGREGADO" in accion:
-                tags.append("CREADO")
-            elif "ACTUALIZADO" in accion or "MODIFICADO" in accion:
-                tags.append("ACTUALIZADO")
-            elif "ELIMINADO" in accion:
-                tags.append("ELIMINADO")
-            elif "DESACTIVADO" in accion:
-                tags.append("DESACTIVADO")
-
-            self.tree.insert("", END, values=(fecha_hora, usuario, rol, accion, descripcion), tags=tags)
-
-        total = len(self.datos_completos)
-        mostrados = len(datos)
-        self.stats_label.config(text=f"📊 Total de registros: {total} | Mostrando: {mostrados}")
+    def aplicar_filtros(self, esperar=False):
+        """Consulta con los filtros activos (al escribir, con debounce)."""
+        filtros = self._filtros_actuales()
+        relevancia = self.relevancia_var.get() and bool(filtros["texto"])
+        if esperar:
+            self.buscador.solicitar(filtros, relevancia)
+        else:
+            self.buscador.ejecutar_ahora(filtros, relevancia)
+
+    def _consultar(self, filtros, relevancia):
+        # Hilo de búsqueda: primera página y cantidades, sin tocar widgets.
+        if relevancia:
+            otros = {k: v for k, v in filtros.items() if k != "texto"}
+            primera = buscar_registro_auditoria(
+                filtros["texto"], self.MAX_RESULTADOS_RELEVANCIA, **otros
+            )
+        else:
+            primera = obtener_registro_completo(
+                VirtualTreeview.TAMANO_PAGINA, incluir_id=True, **filtros
+            )
+        if primera is None:
+            return None
+        coincidencias = contar_registro_auditoria(**filtros)
+        total = coincidencias if not any(filtros.values()) else contar_registro_auditoria()
+        return filtros, relevancia, primera, coincidencias, total, len(meses_archivados())
+
+    def _mostrar_resultado(self, resultado):
+        filtros, relevancia, primera, coincidencias, total, meses = resultado
+        self.total_registros = total or 0
+        texto = f"📊 Total de registros: {self.total_registros} | Coinciden: {coincidencias or 0}"
+        if meses:
+            texto += f" | Archivo: {meses} meses (se cargan al final)"
+        self.stats_label.config(text=texto)
+
+        if relevancia:
+            # Ranking: solo los mejores resultados, sin paginar por fecha
+            self.tree.cargar_filas(primera, formatear=lambda fila: fila[1:], etiquetas=self._etiquetas_fila)
+            return
+
+        def fuente(ultima):
+            if ultima is None:
+                return primera
+            # Keyset: la página siguiente empieza después del (fecha_hora, id) de la última fila
+            # (al agotarse la base principal sigue con los meses archivados)
+            return obtener_registro_completo(
+                VirtualTreeview.TAMANO_PAGINA, incluir_id=True,
+                despues_de=(ultima[1], ultima[0]), **filtros
+            )
+
+        self.tree.cargar_fuente(fuente, formatear=lambda fila: fila[1:], etiquetas=self._etiquetas_fila)
+
+    def mostrar_detalle_evento(self, event=None):
+        """Muestra los datos estructurados del evento seleccionado."""
+        seleccion = self.tree.focus()
+        if not seleccion:
+            return
+        fila = self.tree.fila(seleccion)
+        evento = obtener_evento_auditoria(fila[0]) or obtener_evento_archivado(fila[0], fila[1])
+        if not evento:
+            return
+        fecha_hora, usuario, accion, descripcion, entidad_tipo, entidad_id, monto, datos = evento
+
+        lineas = [f"Fecha: {fecha_hora}", f"Usuario: {usuario}", f"Acción: {accion}"]
+        if entidad_tipo:
+            lineas.append(f"Entidad: {entidad_tipo} #{entidad_id}")
+        if monto is not None:
+            lineas.append(f"Monto: ${monto:.2f}")
+        lineas += [f"{clave}: {valor}" for clave, valor in datos.items()]
+        lineas += ["", descripcion or ""]
+        messagebox.showinfo("Detalle del Evento", "\n".join(lineas), parent=self.frame.winfo_toplevel())
+
+    @staticmethod
+    def _etiquetas_fila(idx, fila):
+        accion = fila[4]  # fila = (id, fecha_hora, usuario, rol, accion, descripcion)
+        tags = ["oddrow" if idx % 2 == 0 else "evenrow"]
+
+        if "CREADO" in accion or "AGREGADO" in accion:
+            tags.append("CREADO")
+        elif "ACTUALIZADO" in accion or "MODIFICADO" in accion:
+            tags.append("ACTUALIZADO")
+        elif "ELIMINADO" in accion:
+            tags.append("ELIMINADO")
+        elif "DESACTIVADO" in accion:
+            tags.append("DESACTIVADO")
+
+        return tags
 
     def filtro_rapido(self, tipo):
         """Aplica filtros de fecha rápidos."""
@@ -384,14 +419,12 @@ class AuditoriaView:
         self.aplicar_filtros()
 
     def exportar_csv(self):
-        """Exporta los registros visibles a un archivo CSV."""
-        datos_visibles = []
-        for item in self.tree.get_children():
-            valores = self.tree.item(item, "values")
-            datos_visibles.append(valores)
-
-        if not datos_visibles:
-            messagebox.showwarning("Sin Datos", "No hay registros para exportar.", parent=self.frame.winfo_toplevel())
+        """
+        Exporta todos los registros que cumplen los filtros (no solo los
+        cargados en la tabla), en segundo plano, a CSV o XLSX.
+        """
+        if self.exportacion is not None:
+            messagebox.showwarning("Exportación en curso", "Espere a que termine la exportación actual.", parent=self.frame.winfo_toplevel())
             return
 
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
@@ -399,7 +432,7 @@ class AuditoriaView:
         
         ruta_archivo = filedialog.asksaveasfilename(
             defaultextension=".csv",
-            filetypes=[("Archivos CSV", "*.csv"), ("Todos los archivos", "*.*")],
+            filetypes=formatos_disponibles() + [("Todos los archivos", "*.*")],
             initialfile=nombre_archivo,
             parent=self.frame.winfo_toplevel()
         )
@@ -407,13 +440,21 @@ class AuditoriaView:
         if not ruta_archivo:
             return
 
-        try:
-            with open(ruta_archivo, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(["Fecha y Hora", "Usuario", "Rol", "Acción", "Descripción"])
-                writer.writerows(datos_visibles)
-            
-            messagebox.showinfo("Éxito", f"Registros exportados exitosamente a:\n{ruta_archivo}", parent=self.frame.winfo_toplevel())
-        
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al exportar:\n{e}", parent=self.frame.winfo_toplevel())
\ No newline at end of file
+        self.stats_label.config(text="📤 Exportando registros...")
+        self.exportacion = ExportJob(
+            self.frame, "auditoria", ruta_archivo,
+            self._progreso_exportacion,
+            lambda resultado: self._fin_exportacion(resultado, ruta_archivo),
+            **self._filtros_actuales()
+        )
+
+    def _progreso_exportacion(self, filas):
+        self.stats_label.config(text=f"📤 Exportando... {filas} registros")
+
+    def _fin_exportacion(self, resultado, ruta_archivo):
+        self.exportacion = None
+        self.stats_label.config(text=f"📊 Total de registros: {self.total_registros}")
+        if isinstance(resultado, str):
+            messagebox.showerror("Error", f"Error al exportar:\n{resultado}", parent=self.frame.winfo_toplevel())
+            return
+        messagebox.showinfo("Éxito", f"{resultado} registros exportados exitosamente a:\n{ruta_archivo}", parent=self.frame.winfo_toplevel())
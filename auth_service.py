@@ -0,0 +1,88 @@
+# auth_service.py
+"""
+Operaciones de contraseñas (login, alta de usuario, cambio de contraseña)
+fuera del hilo de Tk.
+
+El KDF (scrypt / PBKDF2) tarda decenas de milisegundos por intento; corriendo
+en el hilo de la interfaz congela la ventana. hashlib libera el GIL mientras
+calcula, así que un hilo alcanza para que Tk siga respondiendo.
+"""
+import queue
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import TclError
+from database import verificar_credenciales, agregar_usuario, actualizar_contrasena
+
+# Un solo hilo compartido: los intentos se atienden en orden y nunca hay más
+# de un KDF (con su memoria) a la vez.
+_ejecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="autenticacion")
+
+
+def preparar_base(setup):
+    """
+    Corre `setup` (setup_database) en el hilo de autenticación. Las
+    operaciones encoladas después, como el primer login, esperan a que termine.
+    """
+    return _ejecutor.submit(setup)
+
+
+class AuthService:
+    """
+    Corre las operaciones de autenticación en segundo plano y entrega el
+    resultado con `al_terminar(resultado)` en el hilo de Tk, con el mismo
+    valor que devolvería la función de database.py.
+
+    Mientras una operación está en curso las siguientes se ignoran
+    (doble clic / Enter repetido) y `ocupado` es True.
+    """
+
+    INTERVALO_SONDEO_MS = 50
+
+    def __init__(self, widget):
+        self.widget = widget
+        self._resultados = queue.Queue()
+        self._al_terminar = None
+
+    @property
+    def ocupado(self):
+        return self._al_terminar is not None
+
+    def iniciar_sesion(self, nombre_usuario, contrasena, al_terminar):
+        """Resultado: (id, rol, debe_cambiar_contrasena) o None."""
+        return self._ejecutar(verificar_credenciales, al_terminar, nombre_usuario, contrasena)
+
+    def crear_usuario(self, usuario_admin_id, nombre_usuario, contrasena, rol, al_terminar):
+        """Resultado: True o un texto "Error: ..."."""
+        return self._ejecutar(agregar_usuario, al_terminar, usuario_admin_id, nombre_usuario, contrasena, rol)
+
+    def cambiar_contrasena(self, id_usuario, nueva_contrasena, al_terminar, usuario_admin_id=None):
+        """Resultado: True, un texto "Error: ..." o None si falló la base."""
+        return self._ejecutar(actualizar_contrasena, al_terminar, id_usuario, nueva_contrasena, usuario_admin_id)
+
+    def _ejecutar(self, tarea, al_terminar, *args):
+        if self.ocupado:
+            return False
+        self._al_terminar = al_terminar
+        _ejecutor.submit(self._correr, tarea, args)
+        self.widget.after(self.INTERVALO_SONDEO_MS, self._sondear)
+        return True
+
+    def _correr(self, tarea, args):
+        # Hilo de autenticación: no toca widgets.
+        try:
+            resultado = tarea(*args)
+        except Exception as e:
+            print(f"Error en la autenticación: {e}")
+            resultado = None
+        self._resultados.put(resultado)
+
+    def _sondear(self):
+        try:
+            resultado = self._resultados.get_nowait()
+        except queue.Empty:
+            try:
+                self.widget.after(self.INTERVALO_SONDEO_MS, self._sondear)
+            except TclError:
+                self._al_terminar = None  # El widget ya no existe
+            return
+        al_terminar, self._al_terminar = self._al_terminar, None
+        al_terminar(resultado)
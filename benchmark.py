@@ -0,0 +1,386 @@
+# benchmark.py
+"""
+Genera un comercio sintético (determinístico) y mide las consultas y
+escrituras más usadas de database.py.
+
+    python benchmark.py [--ruta bench.db] [--productos N] [--dias N]
+                        [--ventas-por-dia N] [--semilla N] [--repeticiones N]
+                        [--salida resultados.json]
+
+Con los mismos parámetros y semilla los datos son idénticos en cada corrida,
+así que los JSON de distintas versiones del programa se pueden comparar. La
+base se genera una vez y se reutiliza mientras los parámetros no cambien
+(--regenerar la fuerza). registrar_venta escribe en esa base.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+import database
+from database import (
+    setup_database,
+    usar_base_de_datos,
+    cerrar_conexiones,
+    reconstruir_resumenes,
+    generar_hash_contrasena,
+    obtener_productos,
+    registrar_venta,
+    obtener_ventas_por_rango,
+    obtener_compras_por_rango,
+    obtener_productos_mas_vendidos,
+    obtener_reporte_ganancias,
+    obtener_ganancias_por_producto,
+    obtener_registro_auditoria,
+    contar_registro_auditoria,
+    buscar_registro_auditoria,
+)
+
+VERSION_FORMATO = 1
+
+PARAMETROS_POR_DEFECTO = {
+    "productos": 5000,
+    "categorias": 40,
+    "proveedores": 60,
+    "deudores": 300,
+    "cajeros": 8,
+    "dias": 730,
+    "ventas_por_dia": 150,
+    "compras_por_dia": 3,
+    "fecha_fin": "2024-12-31",
+    "semilla": 1234,
+}
+
+_TIPOS = ["Arroz", "Fideos", "Aceite", "Azúcar", "Café", "Yerba", "Leche", "Queso",
+          "Galletitas", "Jabón", "Detergente", "Harina", "Gaseosa", "Agua", "Cerveza",
+          "Vino", "Atún", "Puré", "Mermelada", "Shampoo", "Papel", "Pan", "Salsa", "Sal"]
+_VARIANTES = ["Clásico", "Light", "Integral", "Premium", "Económico", "Familiar",
+              "Natural", "Dulce", "Extra", "Sin TACC", "Orgánico", "Suave"]
+_MARCAS = ["La Serenísima", "Don Pedro", "Marolio", "Arcor", "Molinos", "Ledesma",
+           "Cañuelas", "Taragüí", "Knorr", "Bagley", "Quilmes", "Sancor", "Ilolay"]
+_TAMANOS = ["250g", "500g", "1kg", "1L", "1.5L", "2L", "750ml", "x6", "x12", "200g"]
+
+
+# ============================================================================
+# GENERACIÓN DE DATOS
+# ============================================================================
+def _fecha_hora(dia, rng):
+    segundos = rng.randint(8 * 3600, 21 * 3600)
+    return (datetime.combine(dia, datetime.min.time()) + timedelta(seconds=segundos)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def generar_datos(ruta, parametros):
+    """Crea en `ruta` una base nueva con los datos sintéticos de `parametros`."""
+    for sufijo in ("", "-wal", "-shm"):
+        if os.path.exists(ruta + sufijo):
+            os.remove(ruta + sufijo)
+    usar_base_de_datos(ruta)
+    setup_database()
+
+    p = parametros
+    rng = random.Random(p["semilla"])
+    fecha_fin = date.fromisoformat(p["fecha_fin"])
+    fecha_inicio = fecha_fin - timedelta(days=p["dias"] - 1)
+
+    conn = sqlite3.connect(ruta)
+    conn.execute("PRAGMA foreign_keys = ON")
+    cursor = conn.cursor()
+
+    # --- Usuarios (admin y cajero ya los crea setup_database) ---
+    contrasena_hash, salt, esquema = generar_hash_contrasena("Cajero2024!")
+    cursor.executemany(
+        "INSERT INTO usuarios (nombre_usuario, contrasena_hash, contrasena_salt, contrasena_esquema, rol, debe_cambiar_contrasena) "
+        "VALUES (?, ?, ?, ?, 'usuario', 0)",
+        [(f"cajero{n:02d}", contrasena_hash, salt, esquema) for n in range(1, p["cajeros"] + 1)]
+    )
+    usuarios = [fila[0] for fila in cursor.execute("SELECT id FROM usuarios ORDER BY id")]
+
+    # --- Catálogo ---
+    cursor.executemany("INSERT INTO categorias (id, nombre) VALUES (?, ?)",
+                       [(n, f"Categoría {n:03d}") for n in range(1, p["categorias"] + 1)])
+    cursor.executemany(
+        "INSERT INTO proveedores (id, nombre, telefono, email) VALUES (?, ?, ?, ?)",
+        [(n, f"Proveedor {rng.choice(_MARCAS)} {n:03d}", f"11-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+          f"ventas{n}@proveedor.com") for n in range(1, p["proveedores"] + 1)]
+    )
+    productos = []
+    for n in range(1, p["productos"] + 1):
+        costo = round(rng.uniform(100, 20000), 2)
+        precio = round(costo * rng.uniform(1.2, 1.8), 2)
+        nombre = f"{rng.choice(_TIPOS)} {rng.choice(_MARCAS)} {rng.choice(_VARIANTES)} {rng.choice(_TAMANOS)}"
+        productos.append((n, f"{7790000000000 + n}", nombre, costo, precio, 1_000_000,
+                          rng.randint(1, p["proveedores"]), rng.randint(1, p["categorias"])))
+    cursor.executemany(
+        "INSERT INTO productos (id, codigo, nombre, costo, precio, stock, proveedor_id, categoria_id) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        productos
+    )
+    cursor.executemany(
+        "INSERT INTO deudores (id, nombre, telefono) VALUES (?, ?, ?)",
+        [(n, f"Cliente {n:04d}", f"11-{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}")
+         for n in range(1, p["deudores"] + 1)]
+    )
+
+    # --- Movimientos, día por día ---
+    venta_id = compra_id = 0
+    saldos = {}
+    dia = fecha_inicio
+    while dia <= fecha_fin:
+        ventas, detalles, pagos, auditoria = [], [], [], []
+        for fecha_hora in sorted(_fecha_hora(dia, rng) for _ in range(p["ventas_por_dia"])):
+            venta_id += 1
+            usuario_id = rng.choice(usuarios)
+            total = 0.0
+            for producto in rng.sample(productos, rng.randint(1, 6)):
+                cantidad = rng.randint(1, 4)
+                detalles.append((venta_id, producto[0], cantidad, producto[4], producto[3]))
+                total += cantidad * producto[4]
+            total = round(total, 2)
+            deudor_id, saldo = None, 0.0
+            tipo = "Contado"
+            if rng.random() < 0.08:
+                tipo, deudor_id = "Credito", rng.randint(1, p["deudores"])
+                saldo = total
+                if rng.random() < 0.5:
+                    pago = round(total * rng.choice((0.5, 1.0)), 2)
+                    saldo = round(total - pago, 2)
+                    pagos.append((deudor_id, venta_id, dia.isoformat(), pago))
+                    auditoria.append(database._fila_auditoria(
+                        usuario_id, fecha_hora, "PAGO_REGISTRADO",
+                        "Pago de ${monto_pago:.2f} de '{deudor}' a venta ID {venta_id}.",
+                        ("venta", venta_id), pago,
+                        {"monto_pago": pago, "deudor": f"Cliente {deudor_id:04d}",
+                         "deudor_id": deudor_id, "venta_id": venta_id}))
+                saldos[deudor_id] = saldos.get(deudor_id, 0.0) + saldo
+            ventas.append((venta_id, usuario_id, fecha_hora, total, tipo, deudor_id, saldo))
+            auditoria.append(database._fila_auditoria(
+                usuario_id, fecha_hora, "VENTA_REGISTRADA",
+                "Venta ID {venta_id}. Total: ${total:.2f}. Tipo: {tipo}.",
+                ("venta", venta_id), total,
+                {"venta_id": venta_id, "total": total, "tipo": tipo, "deudor_id": deudor_id}))
+
+        compras, detalles_compra = [], []
+        for _ in range(p["compras_por_dia"]):
+            compra_id += 1
+            proveedor_id = rng.randint(1, p["proveedores"])
+            total_costo = 0.0
+            for producto in rng.sample(productos, rng.randint(3, 15)):
+                cantidad = rng.randint(6, 48)
+                detalles_compra.append((compra_id, producto[0], cantidad, producto[3]))
+                total_costo += cantidad * producto[3]
+            total_costo = round(total_costo, 2)
+            compras.append((compra_id, proveedor_id, dia.isoformat(), total_costo))
+            auditoria.append(database._fila_auditoria(
+                usuarios[0], _fecha_hora(dia, rng), "COMPRA_REGISTRADA",
+                "Compra ID {compra_id} a '{proveedor}'. Total: ${total:.2f}.",
+                ("compra", compra_id), total_costo,
+                {"compra_id": compra_id, "proveedor": f"Proveedor {proveedor_id:03d}",
+                 "proveedor_id": proveedor_id, "total": total_costo}))
+
+        cursor.executemany(
+            "INSERT INTO ventas (id, usuario_id, fecha_hora, total, tipo_pago, deudor_id, saldo_pendiente) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)", ventas)
+        cursor.executemany(
+            "INSERT INTO detalles_venta (venta_id, producto_id, cantidad, precio_unitario, costo_unitario) "
+            "VALUES (?, ?, ?, ?, ?)", detalles)
+        cursor.executemany(
+            "INSERT INTO pagos_deudores (deudor_id, venta_id, fecha, monto) VALUES (?, ?, ?, ?)", pagos)
+        cursor.executemany(
+            "INSERT INTO compras (id, proveedor_id, fecha, total_costo) VALUES (?, ?, ?, ?)", compras)
+        cursor.executemany(
+            "INSERT INTO detalles_compra (compra_id, producto_id, cantidad, costo_unitario) VALUES (?, ?, ?, ?)",
+            detalles_compra)
+        # Orden cronológico, como llegarían los eventos reales
+        cursor.executemany(database._INSERT_AUDITORIA, sorted(auditoria, key=lambda fila: fila[1]))
+        dia += timedelta(days=1)
+
+    cursor.executemany("UPDATE deudores SET saldo = ? WHERE id = ?",
+                       [(round(saldo, 2), deudor_id) for deudor_id, saldo in saldos.items()])
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+    reconstruir_resumenes()
+    _guardar_parametros(ruta, parametros)
+
+
+def _ruta_parametros(ruta):
+    return ruta + ".parametros.json"
+
+
+def _guardar_parametros(ruta, parametros):
+    with open(_ruta_parametros(ruta), "w", encoding="utf-8") as archivo:
+        json.dump(parametros, archivo, sort_keys=True)
+
+
+def _base_vigente(ruta, parametros):
+    """True si `ruta` ya tiene los datos generados con estos parámetros."""
+    try:
+        with open(_ruta_parametros(ruta), encoding="utf-8") as archivo:
+            return os.path.exists(ruta) and json.load(archivo) == parametros
+    except (OSError, ValueError):
+        return False
+
+
+# ============================================================================
+# MEDICIONES
+# ============================================================================
+def medir(funcion, repeticiones):
+    """
+    Corre `funcion` una vez para calentar la caché de páginas y después
+    `repeticiones` veces. Tiempos en milisegundos.
+    """
+    inicio = time.perf_counter()
+    funcion()
+    primera = (time.perf_counter() - inicio) * 1000
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        "primera_ms": round(primera, 3),
+        "min_ms": round(min(tiempos), 3),
+        "mediana_ms": round(statistics.median(tiempos), 3),
+        "media_ms": round(statistics.mean(tiempos), 3),
+        "max_ms": round(max(tiempos), 3),
+        "repeticiones": repeticiones,
+    }
+
+
+def _casos(parametros):
+    """(nombre, función) de cada medición, en orden."""
+    rng = random.Random(parametros["semilla"] + 1)
+    fecha_fin = date.fromisoformat(parametros["fecha_fin"])
+    mes = ((fecha_fin - timedelta(days=29)).isoformat(), fecha_fin.isoformat())
+    anio = ((fecha_fin - timedelta(days=364)).isoformat(), fecha_fin.isoformat())
+    total_ventas = parametros["dias"] * parametros["ventas_por_dia"]
+    casos = []
+
+    # --- Búsqueda de productos ---
+    casos += [
+        ("productos_todos", lambda: obtener_productos()),
+        ("productos_texto", lambda: obtener_productos(filtro="arroz")),
+        ("productos_prefijo", lambda: obtener_productos(filtro="gal")),
+        ("productos_dos_palabras", lambda: obtener_productos(filtro="café arcor")),
+        ("productos_codigo", lambda: obtener_productos(filtro=f"{7790000000000 + parametros['productos'] // 2}")),
+        ("productos_categoria", lambda: obtener_productos(categoria_id=1)),
+        ("productos_gestion", lambda: obtener_productos(incluir_id=True)),
+    ]
+
+    # --- Reportes ---
+    for etiqueta, (inicio, fin) in (("mes", mes), ("anio", anio)):
+        casos += [
+            (f"reporte_ventas_{etiqueta}", lambda i=inicio, f=fin: obtener_ventas_por_rango(i, f)),
+            (f"reporte_compras_{etiqueta}", lambda i=inicio, f=fin: obtener_compras_por_rango(i, f)),
+            (f"reporte_top_productos_{etiqueta}", lambda i=inicio, f=fin: obtener_productos_mas_vendidos(i, f)),
+            (f"reporte_ganancias_{etiqueta}", lambda i=inicio, f=fin: obtener_reporte_ganancias(i, f)),
+            (f"reporte_ganancias_producto_{etiqueta}", lambda i=inicio, f=fin: obtener_ganancias_por_producto(i, f)),
+        ]
+
+    # --- Auditoría ---
+    casos += [
+        ("auditoria_primera_pagina", lambda: obtener_registro_auditoria(limite=200)),
+        ("auditoria_categoria", lambda: obtener_registro_auditoria(limite=200, categoria="COMPRA")),
+        ("auditoria_usuario", lambda: obtener_registro_auditoria(limite=200, usuario="cajero01")),
+        ("auditoria_rango_mes", lambda: obtener_registro_auditoria(limite=200, fecha_desde=mes[0], fecha_hasta=mes[0])),
+        ("auditoria_texto", lambda: obtener_registro_auditoria(limite=200, texto="Credito")),
+        ("auditoria_relevancia", lambda: buscar_registro_auditoria("proveedor", limite=200)),
+        ("auditoria_entidad", lambda: obtener_registro_auditoria(
+            limite=200, entidad_tipo="venta", entidad_id=total_ventas // 2)),
+        ("auditoria_pagina_profunda", lambda: obtener_registro_auditoria(
+            limite=200, despues_de=(f"{anio[0]} 12:00:00", 1 << 62))),
+        ("auditoria_contar_categoria", lambda: contar_registro_auditoria(categoria="VENTA")),
+    ]
+
+    # --- Escritura: una venta por repetición ---
+    cursor = sqlite3.connect(database.DB_PATH)
+    codigos = [fila[0] for fila in cursor.execute("SELECT codigo FROM productos ORDER BY id")]
+    cursor.close()
+
+    def vender():
+        carrito = {
+            codigo: {"nombre": codigo, "precio": 100.0, "cantidad": 1}
+            for codigo in rng.sample(codigos, 3)
+        }
+        resultado = registrar_venta(2, 300.0, carrito, "Contado")
+        if not isinstance(resultado, int):
+            raise RuntimeError(f"registrar_venta falló: {resultado}")
+
+    casos.append(("registrar_venta", vender))
+    return casos
+
+
+def ejecutar(ruta, parametros, repeticiones, regenerar=False):
+    """Genera (si hace falta) la base y devuelve el resultado como dict."""
+    inicio = time.perf_counter()
+    generada = regenerar or not _base_vigente(ruta, parametros)
+    if generada:
+        print(f"Generando datos sintéticos en {ruta}...", file=sys.stderr)
+        generar_datos(ruta, parametros)
+    else:
+        usar_base_de_datos(ruta)
+        setup_database()
+    segundos_generacion = time.perf_counter() - inicio
+
+    resultados = {}
+    try:
+        for nombre, funcion in _casos(parametros):
+            resultados[nombre] = medir(funcion, repeticiones)
+            print(f"  {nombre}: {resultados[nombre]['mediana_ms']:.2f} ms", file=sys.stderr)
+    finally:
+        cerrar_conexiones()
+
+    return {
+        "formato": VERSION_FORMATO,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "plataforma": platform.platform(),
+            "perfil_pragmas": dict(database.PRAGMAS_DB),
+        },
+        "parametros": parametros,
+        "base": {
+            "generada": generada,
+            "segundos_preparacion": round(segundos_generacion, 3),
+            "bytes": os.path.getsize(ruta),
+        },
+        "resultados": resultados,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de la capa de base de datos.")
+    parser.add_argument("--ruta", default=os.path.join(tempfile.gettempdir(), "clickventa_benchmark.db"),
+                        help="Archivo de la base sintética (se reutiliza si los parámetros no cambian)")
+    for nombre, valor in PARAMETROS_POR_DEFECTO.items():
+        parser.add_argument(f"--{nombre.replace('_', '-')}", type=type(valor), default=valor)
+    parser.add_argument("--repeticiones", type=int, default=20)
+    parser.add_argument("--regenerar", action="store_true", help="Vuelve a generar la base aunque exista")
+    parser.add_argument("--salida", help="Archivo JSON de resultados (por defecto, la salida estándar)")
+    args = parser.parse_args(argv)
+
+    parametros = {nombre: getattr(args, nombre) for nombre in PARAMETROS_POR_DEFECTO}
+    # Los avisos de database.py (migraciones, errores) no se mezclan con el JSON
+    with contextlib.redirect_stdout(sys.stderr):
+        resultado = ejecutar(args.ruta, parametros, args.repeticiones, args.regenerar)
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as archivo:
+            archivo.write(texto + "\n")
+    else:
+        print(texto)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+# catalog_cache.py
+import threading
+from database import (
+    obtener_versiones,
+    obtener_productos,
+    obtener_categorias,
+    obtener_proveedores,
+    obtener_deudores,
+)
+
+
+class CatalogCache:
+    """
+    Copia en memoria del catálogo (productos, categorías, proveedores y
+    deudores), compartida por todas las vistas.
+
+    Cada entrada guarda la versión de las secciones de las que depende (ver
+    obtener_versiones en database.py). Mientras ninguna escritura las toque,
+    las lecturas salen de memoria; si cambiaron, solo se recarga esa entrada.
+    Las listas devueltas son compartidas: no deben modificarse.
+    """
+
+    def __init__(self):
+        self._entradas = {}  # clave -> (versión, datos)
+        self._lock = threading.Lock()
+
+    def _obtener(self, clave, secciones, cargar):
+        version = obtener_versiones(*secciones)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+        if entrada is not None and entrada[0] == version:
+            return entrada[1]
+
+        datos = cargar()
+        if datos is None:
+            # Error de base de datos: no se guarda, se reintenta la próxima vez
+            return [] if entrada is None else entrada[1]
+        with self._lock:
+            self._entradas[clave] = (version, datos)
+        return datos
+
+    def invalidar(self):
+        """Descarta todo lo guardado (se recarga en el próximo uso)."""
+        with self._lock:
+            self._entradas.clear()
+
+    # --- Productos ---
+    def productos(self, categoria_id=None, proveedor_id=None, incluir_id=False):
+        """
+        Igual que obtener_productos() sin filtro de texto. La búsqueda por texto
+        se sigue haciendo en la base (índice FTS).
+        """
+        clave = ("productos", categoria_id, proveedor_id, incluir_id)
+        return self._obtener(
+            clave,
+            ("productos",),
+            lambda: obtener_productos(
+                categoria_id=categoria_id, proveedor_id=proveedor_id, incluir_id=incluir_id
+            ),
+        )
+
+    def producto_por_codigo(self, codigo):
+        """(codigo, nombre, precio, stock) del producto activo con ese código, o None."""
+        indice = self._obtener(
+            "productos_por_codigo",
+            ("productos",),
+            lambda: {str(p[0]): p for p in self.productos()},
+        )
+        return indice.get(str(codigo))
+
+    def producto_por_id(self, id_producto):
+        """Fila de obtener_productos(incluir_id=True) para ese id, o None."""
+        indice = self._obtener(
+            "productos_por_id",
+            ("productos",),
+            lambda: {p[0]: p for p in self.productos(incluir_id=True)},
+        )
+        return indice.get(id_producto)
+
+    # --- Tablas auxiliares ---
+    def categorias(self):
+        return self._obtener("categorias", ("categorias",), obtener_categorias)
+
+    def proveedores(self):
+        return self._obtener("proveedores", ("proveedores",), obtener_proveedores)
+
+    def deudores(self):
+        return self._obtener("deudores", ("deudores",), obtener_deudores)
+
+
+# Instancia única del proceso
+catalogo = CatalogCache()
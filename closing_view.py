@@ -17,13 +17,22 @@ class ClosingView:
         self.parent_frame = parent_frame
         self.usuario_id = usuario_id
         
+        self.cargar_totales()
+        self.crear_interfaz()
+
+    def cargar_totales(self):
         # Obtener datos del sistema
         self.total_sistema = obtener_resumen_ventas_dia(self.usuario_id)
         self.total_efectivo_sistema = self.total_sistema
         
         # Verificar si ya cerró hoy
         self.ya_cerro_hoy = verificar_cierre_hoy(self.usuario_id)
-        
+
+    def refrescar(self):
+        """Hubo ventas o cierres nuevos: los totales de la interfaz ya no valen."""
+        for widget in self.parent_frame.winfo_children():
+            widget.destroy()
+        self.cargar_totales()
         self.crear_interfaz()
 
     def crear_interfaz(self):
@@ -3,9 +3,18 @@ import sqlite3
 import hashlib
 import os
 import sys
-from datetime import datetime
+from datetime import datetime, timedelta
 import shutil
 import binascii
+import functools
+import hmac
+import re
+import threading
+import time
+import atexit
+import json
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 
 def obtener_ruta_db():
@@ -18,280 +27,1492 @@ def obtener_ruta_db():
 
 DB_PATH = obtener_ruta_db()
 
+# Cantidad máxima de valores por cláusula IN (el límite de parámetros de
+# SQLite en versiones viejas es 999).
+TAMANO_LOTE_IN = 500
 
-# --- DECORADOR PARA MANEJAR LA CONEXIÓN ---
+
+# ============================================================================
+# PERFIL DE PRAGMAS
+# ============================================================================
+# "rendimiento": WAL permite que los reportes lean mientras la caja escribe.
+# "seguro": modo clásico, para bases en carpetas compartidas de red, donde WAL
+# no está soportado.
+PERFILES_PRAGMAS = {
+    "rendimiento": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -20000,       # en KiB (negativo) => ~20 MB
+        "mmap_size": 268435456,     # 256 MB
+        "temp_store": "MEMORY",
+        "busy_timeout": 10000,      # ms
+        "wal_autocheckpoint": 1000,  # páginas
+    },
+    "seguro": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "cache_size": -8000,
+        "mmap_size": 0,
+        "temp_store": "DEFAULT",
+        "busy_timeout": 10000,
+    },
+}
+
+PRAGMAS_DB = dict(PERFILES_PRAGMAS[os.environ.get("CLICKVENTA_PERFIL_DB", "rendimiento")])
+
+# Política de checkpoint del WAL: además del autocheckpoint de SQLite, el pool
+# hace un checkpoint PASSIVE cada N escrituras y uno TRUNCATE al cerrar.
+POLITICA_CHECKPOINT = {
+    "cada_escrituras": 500,
+    "modo": "PASSIVE",
+    "al_cerrar": "TRUNCATE",
+}
+
+# Cada cuánto (segundos) se consulta PRAGMA data_version para detectar
+# escrituras de otros procesos sobre el mismo archivo.
+INTERVALO_VERIFICACION_EXTERNA = 1.0
+
+# Auditoría: "transaccion" inserta cada evento dentro de la transacción que lo
+# genera; "agrupado" lo encola al confirmar y un hilo lo escribe en lotes
+# (commit agrupado). En "agrupado" un corte de luz puede perder los eventos
+# del último intervalo, no los datos de la venta.
+MODO_AUDITORIA = os.environ.get("CLICKVENTA_MODO_AUDITORIA", "transaccion")
+AUDITORIA_AGRUPADA = {
+    "max_lote": 200,    # eventos por transacción de escritura
+    "intervalo": 0.5,   # segundos máximos que un evento espera en memoria
+}
+
+# Esquema de hash para contraseñas nuevas, guardado por usuario como
+# "algoritmo$parámetros". Los usuarios con un esquema distinto se vuelven a
+# hashear con este al iniciar sesión.
+ESQUEMA_PBKDF2_ORIGINAL = "pbkdf2_sha256$100000"
+ESQUEMA_CONTRASENA = os.environ.get(
+    "CLICKVENTA_ESQUEMA_CONTRASENA",
+    "scrypt$16384$8$1" if hasattr(hashlib, "scrypt") else "pbkdf2_sha256$600000",
+)
+
+# Pragmas que se guardan en el archivo y no hace falta repetir por conexión.
+_PRAGMAS_PERSISTENTES = ("journal_mode",)
+
+
+def configurar_pragmas(perfil=None, **ajustes):
+    """
+    Cambia el perfil de pragmas activo (y/o pragmas puntuales). Se aplica a las
+    conexiones que se abran a partir de ahora.
+    """
+    if perfil is not None:
+        if perfil not in PERFILES_PRAGMAS:
+            raise ValueError(f"Perfil de pragmas desconocido: {perfil}")
+        PRAGMAS_DB.clear()
+        PRAGMAS_DB.update(PERFILES_PRAGMAS[perfil])
+    PRAGMAS_DB.update(ajustes)
+    pool.cerrar_todas()
+
+
+def aplicar_pragmas(conn, persistentes=False):
+    """Aplica el perfil de pragmas a una conexión."""
+    for nombre, valor in PRAGMAS_DB.items():
+        if nombre in _PRAGMAS_PERSISTENTES and not persistentes:
+            continue
+        if nombre == "wal_autocheckpoint" and PRAGMAS_DB.get("journal_mode", "").upper() != "WAL":
+            continue
+        conn.execute(f"PRAGMA {nombre} = {valor}")
+
+
+# ============================================================================
+# POOL DE CONEXIONES
+# ============================================================================
+class ConnectionPool:
+    """
+    Mantiene conexiones SQLite de larga duración en lugar de abrir y cerrar
+    una por cada llamada.
+
+    - Lectura: una conexión por hilo (``query_only``), reutilizada mientras
+      el hilo viva.
+    - Escritura: una única conexión compartida, serializada con un lock. Las
+      llamadas anidadas desde el mismo hilo se unen a la transacción en curso.
+    - Versiones: un contador por sección de datos ("productos", "deudores"...)
+      que las funciones de escritura marcan y que se incrementa al hacer
+      commit. Los cambios hechos por otro proceso se detectan con
+      ``PRAGMA data_version`` e invalidan todas las secciones.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock_escritura = threading.RLock()
+        self._lock_registro = threading.Lock()
+        self._conn_escritura = None
+        self._gen_escritura = -1
+        self._profundidad_escritura = 0
+        self._hilo_escritura = None
+        self._lecturas = {}  # ident del hilo -> conexión de lectura
+        self._generacion = 0
+        self._versiones = {}  # sección -> contador
+        self._cambios_pendientes = set()  # secciones tocadas en la transacción en curso
+        self._al_confirmar = []  # funciones a llamar cuando la transacción haga commit
+        self._version_externa = 0
+        self._data_version = None
+        self._ultima_verificacion = 0.0
+        self._estadisticas = {
+            "conexiones_abiertas": 0,
+            "conexiones_cerradas": 0,
+            "lecturas_reutilizadas": 0,
+            "escrituras": 0,
+            "esperas_escritura": 0,
+            "tiempo_espera_escritura": 0.0,
+            "checkpoints": 0,
+            "cambios_externos": 0,
+        }
+
+    def _conectar(self, solo_lectura):
+        conn = sqlite3.connect(DB_PATH, timeout=10.0, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON")
+        aplicar_pragmas(conn, persistentes=not solo_lectura)
+        if solo_lectura:
+            conn.execute("PRAGMA query_only = ON")
+        with self._lock_registro:
+            self._estadisticas["conexiones_abiertas"] += 1
+        return conn
+
+    def _cerrar(self, conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock_registro:
+            self._estadisticas["conexiones_cerradas"] += 1
+
+    def _purgar_hilos_terminados(self):
+        """Cierra las conexiones de lectura de hilos que ya terminaron."""
+        vivos = {hilo.ident for hilo in threading.enumerate()}
+        with self._lock_registro:
+            muertos = [ident for ident in self._lecturas if ident not in vivos]
+            conexiones = [self._lecturas.pop(ident) for ident in muertos]
+        for conn in conexiones:
+            self._cerrar(conn)
+
+    def conexion_lectura(self):
+        """Devuelve la conexión de lectura del hilo actual (la crea si no existe)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.generacion == self._generacion:
+            with self._lock_registro:
+                self._estadisticas["lecturas_reutilizadas"] += 1
+            return conn
+
+        self._purgar_hilos_terminados()
+        conn = self._conectar(solo_lectura=True)
+        self._local.conn = conn
+        self._local.generacion = self._generacion
+        with self._lock_registro:
+            anterior = self._lecturas.pop(threading.get_ident(), None)
+            self._lecturas[threading.get_ident()] = conn
+        if anterior is not None and anterior is not conn:
+            self._cerrar(anterior)
+        return conn
+
+    def interrumpir_lectura(self, ident_hilo):
+        """Interrumpe la consulta que esté corriendo en la conexión de lectura de ese hilo."""
+        with self._lock_registro:
+            conn = self._lecturas.get(ident_hilo)
+        if conn is not None:
+            conn.interrupt()
+
+    def en_transaccion(self):
+        """True si el hilo actual ya está dentro de una transacción de escritura."""
+        return self._hilo_escritura == threading.get_ident()
+
+    @contextmanager
+    def transaccion(self):
+        """
+        Entrega la conexión de escritura con el lock tomado. La transacción más
+        externa empieza con BEGIN IMMEDIATE (toma el lock de escritura del
+        archivo desde el inicio, así lo que se lee dentro ya no puede cambiar),
+        hace commit al salir y rollback si hubo una excepción.
+        """
+        if not self._lock_escritura.acquire(blocking=False):
+            inicio = time.perf_counter()
+            self._lock_escritura.acquire()
+            with self._lock_registro:
+                self._estadisticas["esperas_escritura"] += 1
+                self._estadisticas["tiempo_espera_escritura"] += time.perf_counter() - inicio
+        try:
+            conn = self._asegurar_conexion_escritura()
+            self._profundidad_escritura += 1
+            self._hilo_escritura = threading.get_ident()
+            externa = self._profundidad_escritura == 1
+            try:
+                if externa and not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                yield conn
+                if externa:
+                    conn.commit()
+                    self._publicar_cambios()
+                    self._ejecutar_al_confirmar()
+                    with self._lock_registro:
+                        self._estadisticas["escrituras"] += 1
+                        escrituras = self._estadisticas["escrituras"]
+                    cada = POLITICA_CHECKPOINT.get("cada_escrituras")
+                    if cada and escrituras % cada == 0:
+                        self._checkpoint(conn, POLITICA_CHECKPOINT["modo"])
+            except BaseException:
+                if externa:
+                    conn.rollback()
+                    self._cambios_pendientes.clear()
+                    self._al_confirmar.clear()
+                raise
+            finally:
+                self._profundidad_escritura -= 1
+                if self._profundidad_escritura == 0:
+                    self._hilo_escritura = None
+        finally:
+            self._lock_escritura.release()
+
+    def _asegurar_conexion_escritura(self):
+        """Abre (o reabre tras cerrar_todas) la conexión de escritura. Requiere el lock."""
+        if self._conn_escritura is None or self._gen_escritura != self._generacion:
+            if self._conn_escritura is not None:
+                self._cerrar(self._conn_escritura)
+            self._conn_escritura = self._conectar(solo_lectura=False)
+            self._gen_escritura = self._generacion
+            self._data_version = None
+        return self._conn_escritura
+
+    # --- Versiones de datos ---
+    def marcar_cambios(self, *secciones):
+        """
+        Registra que la transacción en curso modifica esas secciones. Las
+        versiones se incrementan recién al hacer commit (un rollback las descarta).
+        """
+        if self.en_transaccion():
+            self._cambios_pendientes.update(secciones)
+        else:
+            with self._lock_registro:
+                for seccion in secciones:
+                    self._versiones[seccion] = self._versiones.get(seccion, 0) + 1
+
+    def _publicar_cambios(self):
+        if not self._cambios_pendientes:
+            return
+        with self._lock_registro:
+            for seccion in self._cambios_pendientes:
+                self._versiones[seccion] = self._versiones.get(seccion, 0) + 1
+        self._cambios_pendientes.clear()
+
+    def al_confirmar(self, funcion):
+        """
+        Llama a `funcion()` cuando la transacción en curso haga commit (no se
+        llama si hay rollback). Fuera de una transacción se llama enseguida.
+        """
+        if self.en_transaccion():
+            self._al_confirmar.append(funcion)
+        else:
+            funcion()
+
+    def _ejecutar_al_confirmar(self):
+        funciones, self._al_confirmar = self._al_confirmar, []
+        for funcion in funciones:
+            try:
+                funcion()
+            except Exception as e:
+                print(f"Error después del commit: {e}")
+
+    def _verificar_cambios_externos(self):
+        """
+        Compara ``PRAGMA data_version`` de la conexión de escritura: solo cambia
+        cuando otra conexión (otro proceso) hizo commit sobre el archivo.
+        """
+        ahora = time.monotonic()
+        if ahora - self._ultima_verificacion < INTERVALO_VERIFICACION_EXTERNA:
+            return
+        if not self._lock_escritura.acquire(blocking=False):
+            return  # hay una escritura en curso; se verifica en la próxima consulta
+        try:
+            self._ultima_verificacion = ahora
+            conn = self._asegurar_conexion_escritura()
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._data_version is not None and data_version != self._data_version:
+                with self._lock_registro:
+                    self._version_externa += 1
+                    self._estadisticas["cambios_externos"] += 1
+            self._data_version = data_version
+        except sqlite3.Error as e:
+            print(f"Error al verificar cambios externos: {e}")
+        finally:
+            self._lock_escritura.release()
+
+    def versiones(self, *secciones):
+        """Tupla con la versión de cada sección (más la de cambios externos)."""
+        self._verificar_cambios_externos()
+        with self._lock_registro:
+            return tuple(self._versiones.get(s, 0) for s in secciones) + (self._version_externa,)
+
+    def _checkpoint(self, conn, modo):
+        if PRAGMAS_DB.get("journal_mode", "").upper() != "WAL":
+            return None
+        try:
+            resultado = conn.execute(f"PRAGMA wal_checkpoint({modo})").fetchone()
+        except sqlite3.Error as e:
+            print(f"Error en checkpoint del WAL: {e}")
+            return None
+        with self._lock_registro:
+            self._estadisticas["checkpoints"] += 1
+        return resultado
+
+    def checkpoint(self, modo="PASSIVE"):
+        """Ejecuta un checkpoint del WAL con la conexión de escritura."""
+        # Fuera de transacción: un checkpoint no puede correr con una abierta
+        with self._lock_escritura:
+            return self._checkpoint(self._asegurar_conexion_escritura(), modo)
+
+    def cerrar_todas(self, modo_checkpoint=None):
+        """
+        Cierra todas las conexiones del pool. Las conexiones de otros hilos se
+        invalidan y se vuelven a abrir en su próximo uso.
+        """
+        with self._lock_escritura:
+            if modo_checkpoint and self._conn_escritura is not None:
+                self._checkpoint(self._conn_escritura, modo_checkpoint)
+            with self._lock_registro:
+                self._generacion += 1
+                # Pudo cambiar el archivo (p. ej. una restauración): todo se recarga
+                self._version_externa += 1
+                conexiones = list(self._lecturas.values())
+                self._lecturas.clear()
+            for conn in conexiones:
+                self._cerrar(conn)
+            if self._conn_escritura is not None:
+                self._cerrar(self._conn_escritura)
+                self._conn_escritura = None
+
+    def estadisticas(self):
+        with self._lock_registro:
+            datos = dict(self._estadisticas)
+            datos["conexiones_lectura_activas"] = len(self._lecturas)
+        datos["conexion_escritura_activa"] = self._conn_escritura is not None
+        return datos
+
+
+pool = ConnectionPool()
+
+
+def cerrar_conexiones():
+    """Cierra las conexiones del pool (al salir o antes de reemplazar el archivo)."""
+    # Los eventos de auditoría encolados se escriben antes de cerrar
+    auditoria_pendiente.vaciar()
+    pool.cerrar_todas(modo_checkpoint=POLITICA_CHECKPOINT.get("al_cerrar"))
+    _tablas_fts.clear()
+
+
+def usar_base_de_datos(ruta):
+    """
+    Cambia el archivo de base de datos del proceso (herramientas y
+    benchmark.py). Cierra el pool; las próximas conexiones abren `ruta`.
+    """
+    global DB_PATH
+    cerrar_conexiones()
+    DB_PATH = ruta
+
+
+def ejecutar_checkpoint(modo="PASSIVE"):
+    """Fuerza un checkpoint del WAL. Devuelve (busy, páginas_log, páginas_copiadas)."""
+    return pool.checkpoint(modo)
+
+
+def compactar_base():
+    """
+    VACUUM de la base (después de borrar mucho, p. ej. al archivar la
+    auditoría: sin esto el archivo no se achica). Cierra el pool porque
+    VACUUM no puede correr con transacciones abiertas. Devuelve los bytes
+    recuperados, o None si falló.
+    """
+    cerrar_conexiones()
+    try:
+        conn = sqlite3.connect(DB_PATH, isolation_level=None, timeout=PRAGMAS_DB.get("busy_timeout", 10000) / 1000)
+    except sqlite3.Error as e:
+        print(f"Error al abrir la base para compactarla: {e}")
+        return None
+    try:
+        # El WAL se vuelca antes y después, para medir solo el archivo principal
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        antes = os.path.getsize(DB_PATH)
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return antes - os.path.getsize(DB_PATH)
+    except sqlite3.Error as e:
+        print(f"Error al compactar la base de datos: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def obtener_estadisticas_pool():
+    return pool.estadisticas()
+
+
+def interrumpir_lectura(ident_hilo):
+    pool.interrumpir_lectura(ident_hilo)
+
+
+@contextmanager
+def progreso_lectura(manejador, cada=10000):
+    """
+    Instala `manejador` como progress handler de la conexión de lectura del
+    hilo actual mientras dure el bloque. SQLite lo llama cada `cada`
+    instrucciones; si devuelve un valor verdadero la consulta se interrumpe.
+    """
+    conn = pool.conexion_lectura()
+    conn.set_progress_handler(manejador, cada)
+    try:
+        yield
+    finally:
+        conn.set_progress_handler(None, 0)
+
+
+def marcar_cambios(*secciones):
+    """Indica qué secciones del catálogo modifica la escritura en curso."""
+    pool.marcar_cambios(*secciones)
+
+
+def obtener_versiones(*secciones):
+    """Versiones actuales de las secciones; si cambian, hay que recargar."""
+    return pool.versiones(*secciones)
+
+
+# --- DECORADORES PARA MANEJAR LA CONEXIÓN ---
 def db_connection(func):
+    """Ejecuta `func` dentro de una transacción sobre la conexión de escritura."""
+    @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        conn = None
+        if pool.en_transaccion():
+            # Llamada anidada: se une a la transacción de quien la invocó.
+            with pool.transaccion() as conn:
+                return func(conn.cursor(), *args, **kwargs)
         try:
-            conn = sqlite3.connect(DB_PATH, timeout=10.0)
-            conn.execute("PRAGMA foreign_keys = ON")
-            cursor = conn.cursor()
-            result = func(cursor, *args, **kwargs)
-            conn.commit()
-            return result
+            with pool.transaccion() as conn:
+                return func(conn.cursor(), *args, **kwargs)
         except sqlite3.Error as e:
             print(f"Error de base de datos en '{func.__name__}': {e}")
-            if conn:
-                conn.rollback()
+            return None
+    return wrapper
+
+
+def db_read_connection(func):
+    """Ejecuta `func` con un cursor de la conexión de lectura del hilo actual."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        cursor = None
+        try:
+            cursor = pool.conexion_lectura().cursor()
+            return func(cursor, *args, **kwargs)
+        except sqlite3.Error as e:
+            # Una consulta interrumpida a propósito (búsqueda obsoleta) no es un error.
+            if str(e) != "interrupted":
+                print(f"Error de base de datos en '{func.__name__}': {e}")
             return None
         finally:
-            if conn:
-                conn.close()
+            if cursor is not None:
+                cursor.close()
     return wrapper
 
 
 # ============================================================================
 # CONFIGURACIÓN INICIAL DE LA BASE DE DATOS
 # ============================================================================
-def setup_database():
+# Migraciones de esquema, en orden. Cada una lleva la base a su número de
+# versión (PRAGMA user_version) y es idempotente: también se aplica bien sobre
+# bases que ya tienen parte del cambio (las creadas antes de este registro,
+# con user_version 0). Cada paso corre en su propia transacción junto con el
+# cambio de user_version, así que una actualización cortada sigue desde el
+# último paso terminado. Un cambio de esquema nuevo se agrega al final.
+def _migrar_tablas_base(cursor):
+    # --- TABLA USUARIOS ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS usuarios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            nombre_usuario TEXT UNIQUE NOT NULL, 
+            contrasena_hash TEXT NOT NULL, 
+            contrasena_salt TEXT NOT NULL,
+            contrasena_esquema TEXT NOT NULL DEFAULT 'pbkdf2_sha256$100000',
+            rol TEXT NOT NULL CHECK(rol IN ('admin', 'usuario', 'auditor')),
+            debe_cambiar_contrasena INTEGER NOT NULL DEFAULT 1
+        );
+    """)
+
+    # --- TABLA CATEGORÍAS ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS categorias (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT UNIQUE NOT NULL
+        );
+    """)
+
+    # --- TABLA PROVEEDORES ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS proveedores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            nombre TEXT UNIQUE NOT NULL, 
+            contacto TEXT, 
+            telefono TEXT, 
+            email TEXT, 
+            direccion TEXT, 
+            activo INTEGER NOT NULL DEFAULT 1 
+        );
+    """)
+
+    # --- TABLA PRODUCTOS ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS productos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            codigo TEXT UNIQUE NOT NULL,
+            nombre TEXT NOT NULL,
+            descripcion TEXT,
+            costo REAL NOT NULL CHECK(costo >= 0),
+            precio REAL NOT NULL CHECK(precio >= 0),
+            stock INTEGER NOT NULL CHECK(stock >= 0),
+            activo INTEGER NOT NULL DEFAULT 1,
+            proveedor_id INTEGER,
+            categoria_id INTEGER, 
+            FOREIGN KEY (proveedor_id) REFERENCES proveedores (id) ON DELETE SET NULL,
+            FOREIGN KEY (categoria_id) REFERENCES categorias (id) ON DELETE SET NULL
+        );
+    """)
+
+    # --- TABLA DEUDORES ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS deudores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            nombre TEXT UNIQUE NOT NULL, 
+            telefono TEXT, 
+            direccion TEXT, 
+            notas TEXT, 
+            saldo REAL NOT NULL DEFAULT 0.0 CHECK(saldo >= 0)
+        );
+    """)
+
+    # --- TABLA VENTAS ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ventas (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            fecha_hora TEXT NOT NULL,
+            total REAL NOT NULL CHECK(total >= 0),
+            tipo_pago TEXT NOT NULL CHECK(tipo_pago IN ('Contado', 'Credito')),
+            deudor_id INTEGER,
+            saldo_pendiente REAL NOT NULL DEFAULT 0.0 CHECK(saldo_pendiente >= 0),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id),
+            FOREIGN KEY (deudor_id) REFERENCES deudores (id)
+        );
+    """)
+
+    # --- TABLA DETALLES VENTA ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detalles_venta (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            venta_id INTEGER NOT NULL, 
+            producto_id INTEGER NOT NULL, 
+            cantidad INTEGER NOT NULL CHECK(cantidad > 0), 
+            precio_unitario REAL NOT NULL CHECK(precio_unitario >= 0), 
+            costo_unitario REAL CHECK(costo_unitario >= 0), 
+            FOREIGN KEY (venta_id) REFERENCES ventas (id) ON DELETE CASCADE, 
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        );
+    """)
+
+    # --- TABLA COMPRAS ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS compras (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            proveedor_id INTEGER NOT NULL, 
+            fecha TEXT NOT NULL, 
+            total_costo REAL NOT NULL CHECK(total_costo >= 0), 
+            FOREIGN KEY (proveedor_id) REFERENCES proveedores (id)
+        );
+    """)
+
+    # --- TABLA DETALLES COMPRA ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detalles_compra (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            compra_id INTEGER NOT NULL, 
+            producto_id INTEGER NOT NULL, 
+            cantidad INTEGER NOT NULL CHECK(cantidad > 0), 
+            costo_unitario REAL NOT NULL CHECK(costo_unitario >= 0), 
+            FOREIGN KEY (compra_id) REFERENCES compras (id) ON DELETE CASCADE, 
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        );
+    """)
+
+    # --- TABLA PAGOS DEUDORES ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS pagos_deudores (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            deudor_id INTEGER NOT NULL,
+            venta_id INTEGER,
+            fecha TEXT NOT NULL,
+            monto REAL NOT NULL CHECK(monto > 0),
+            FOREIGN KEY (deudor_id) REFERENCES deudores (id),
+            FOREIGN KEY (venta_id) REFERENCES ventas (id) ON DELETE SET NULL
+        );
+    """)
+
+    # --- TABLA AUDITORÍA (CORREGIDA) ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS registro_auditoria (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            fecha_hora TEXT NOT NULL,
+            accion TEXT NOT NULL,
+            descripcion TEXT,
+            entidad_tipo TEXT,
+            entidad_id INTEGER,
+            monto REAL,
+            datos TEXT,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id) ON DELETE CASCADE
+        );
+    """)
+
+    # --- TABLA CIERRES DE CAJA ---
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS cierres_caja (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            usuario_id INTEGER NOT NULL,
+            fecha_hora TEXT NOT NULL,
+            total_ventas_sistema REAL NOT NULL CHECK(total_ventas_sistema >= 0),
+            total_efectivo_sistema REAL NOT NULL CHECK(total_efectivo_sistema >= 0),
+            efectivo_contado REAL NOT NULL CHECK(efectivo_contado >= 0),
+            diferencia REAL NOT NULL,
+            observaciones TEXT,
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        );
+    """)
+    
+    # --- TABLA RESERVAS DE STOCK ---
+    # Cada caja (sesión) reserva lo que tiene en el carrito; las reservas
+    # vencen solas si la caja se cierra sin liberarlas.
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS reservas_stock (
+            sesion TEXT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL CHECK(cantidad > 0),
+            vence TEXT NOT NULL,
+            PRIMARY KEY (sesion, producto_id),
+            FOREIGN KEY (producto_id) REFERENCES productos (id) ON DELETE CASCADE
+        );
+    """)
+
+
+def _migrar_indices(cursor):
+    # Los filtros por fecha usan rangos semiabiertos sobre el texto de
+    # fecha_hora (fecha_hora >= inicio AND fecha_hora < fin), así que estos
+    # índices se recorren por rango en lugar de escanear la tabla.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_codigo ON productos(codigo);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas(fecha_hora);")
+    cursor.execute("DROP INDEX IF EXISTS idx_ventas_usuario;")  # cubierto por idx_ventas_usuario_fecha
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_usuario_fecha ON ventas(usuario_id, fecha_hora, tipo_pago);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_deudor ON ventas(deudor_id, fecha_hora);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalles_venta_venta ON detalles_venta(venta_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalles_venta_producto ON detalles_venta(producto_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_compras_fecha ON compras(fecha);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalles_compra_compra ON detalles_compra(compra_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_pagos_deudores_venta ON pagos_deudores(venta_id);")
+    cursor.execute("DROP INDEX IF EXISTS idx_cierres_usuario;")  # cubierto por idx_cierres_usuario_fecha
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cierres_usuario_fecha ON cierres_caja(usuario_id, fecha_hora);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_cierres_fecha ON cierres_caja(fecha_hora);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_auditoria_fecha ON registro_auditoria(fecha_hora);")
+    cursor.execute("DROP INDEX IF EXISTS idx_auditoria_usuario;")  # cubierto por idx_auditoria_usuario_fecha
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_auditoria_usuario_fecha ON registro_auditoria(usuario_id, fecha_hora);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservas_producto ON reservas_stock(producto_id, vence);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_reservas_vence ON reservas_stock(vence);")
+
+
+def _migrar_auditoria_estructurada(cursor):
+    cursor.execute("PRAGMA table_info(registro_auditoria)")
+    columnas_auditoria = [col[1] for col in cursor.fetchall()]
+    if 'entidad_tipo' not in columnas_auditoria:
+        cursor.execute("ALTER TABLE registro_auditoria ADD COLUMN entidad_tipo TEXT")
+        cursor.execute("ALTER TABLE registro_auditoria ADD COLUMN entidad_id INTEGER")
+        cursor.execute("ALTER TABLE registro_auditoria ADD COLUMN monto REAL")
+        cursor.execute("ALTER TABLE registro_auditoria ADD COLUMN datos TEXT")
+        completar_entidades_auditoria(cursor)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_auditoria_entidad ON registro_auditoria(entidad_tipo, entidad_id, fecha_hora);")
+
+
+def _migrar_texto_completo(cursor):
+    crear_indice_fts_productos(cursor)
+    crear_indice_fts_auditoria(cursor)
+
+
+def _migrar_costo_historico(cursor):
+    # El costo se guarda en cada línea al vender; las ventas anteriores se
+    # completan con la última compra del producto hasta la fecha de la venta.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalles_compra_producto ON detalles_compra(producto_id, compra_id);")
+    cursor.execute("PRAGMA table_info(detalles_venta)")
+    if 'costo_unitario' not in [col[1] for col in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE detalles_venta ADD COLUMN costo_unitario REAL CHECK(costo_unitario >= 0)")
+    if completar_costos_historicos(cursor):
+        # Los resúmenes ya existentes se armaron sin esos costos
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'resumen_ventas_diario'")
+        if cursor.fetchone():
+            _reconstruir_resumenes(cursor)
+
+
+def _migrar_resumenes(cursor):
+    crear_tablas_resumen(cursor)
+
+
+def _migrar_usuarios(cursor):
+    cursor.execute("PRAGMA table_info(usuarios)")
+    columnas = [col[1] for col in cursor.fetchall()]
+    if 'debe_cambiar_contrasena' not in columnas:
+        cursor.execute("ALTER TABLE usuarios ADD COLUMN debe_cambiar_contrasena INTEGER NOT NULL DEFAULT 0")
+        # Marcar solo usuarios con contraseñas débiles
+        cursor.execute("""
+            UPDATE usuarios 
+            SET debe_cambiar_contrasena = 1 
+            WHERE nombre_usuario IN ('admin', 'cajero')
+        """)
+    # Los hashes existentes son PBKDF2-SHA256 con 100000 iteraciones.
+    if 'contrasena_esquema' not in columnas:
+        cursor.execute(
+            f"ALTER TABLE usuarios ADD COLUMN contrasena_esquema TEXT NOT NULL DEFAULT '{ESQUEMA_PBKDF2_ORIGINAL}'"
+        )
+
+
+def _migrar_devoluciones(cursor):
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS devoluciones (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            venta_id INTEGER NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            fecha_hora TEXT NOT NULL,
+            total_devolucion REAL NOT NULL CHECK(total_devolucion >= 0),
+            tipo_devolucion TEXT NOT NULL CHECK(tipo_devolucion IN ('COMPLETA', 'PARCIAL')),
+            motivo TEXT,
+            FOREIGN KEY (venta_id) REFERENCES ventas (id),
+            FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+        );
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS detalles_devolucion (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            devolucion_id INTEGER NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad_devuelta INTEGER NOT NULL CHECK(cantidad_devuelta > 0),
+            precio_unitario REAL NOT NULL CHECK(precio_unitario >= 0),
+            FOREIGN KEY (devolucion_id) REFERENCES devoluciones (id) ON DELETE CASCADE,
+            FOREIGN KEY (producto_id) REFERENCES productos (id)
+        );
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devoluciones_venta ON devoluciones(venta_id);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_devoluciones_fecha ON devoluciones(fecha_hora);")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_detalles_devolucion_devolucion ON detalles_devolucion(devolucion_id);")
+
+
+MIGRACIONES = [
+    (1, "Tablas base", _migrar_tablas_base),
+    (2, "Índices de búsqueda", _migrar_indices),
+    (3, "Auditoría estructurada (entidad, monto, datos)", _migrar_auditoria_estructurada),
+    (4, "Índices de texto completo", _migrar_texto_completo),
+    (5, "Costo histórico en detalles_venta", _migrar_costo_historico),
+    (6, "Tablas de resumen diario", _migrar_resumenes),
+    (7, "Usuarios: cambio obligatorio y esquema de hash", _migrar_usuarios),
+    (8, "Devoluciones", _migrar_devoluciones),
+]
+
+# Versión del esquema al día (se guarda en PRAGMA user_version)
+VERSION_ESQUEMA = MIGRACIONES[-1][0]
+
+
+def aplicar_migraciones(conn, simular=False):
+    """
+    Aplica sobre `conn` las migraciones posteriores a su PRAGMA user_version
+    e informa el tiempo de cada una. Devuelve [(version, descripcion, segundos)].
+
+    Con `simular` los pasos corren igual (para medir cuánto tardarían sobre
+    esta base) pero todo se deshace al final y user_version no cambia.
+    """
+    actual = conn.execute("PRAGMA user_version").fetchone()[0]
+    if actual > VERSION_ESQUEMA:
+        print(f"⚠️ La base tiene el esquema {actual}, más nuevo que el de esta versión ({VERSION_ESQUEMA}); no se modifica.")
+        return []
+    pendientes = [m for m in MIGRACIONES if m[0] > actual]
+    if not pendientes:
+        return []
+
+    modo = " (simulación)" if simular else ""
+    print(f"Actualizando esquema de la base {actual} -> {VERSION_ESQUEMA}{modo}")
+    aplicadas = []
+    cursor = conn.cursor()
+    try:
+        if simular:
+            cursor.execute("BEGIN IMMEDIATE")
+        for version, descripcion, migrar in pendientes:
+            inicio = time.perf_counter()
+            if not simular:
+                cursor.execute("BEGIN IMMEDIATE")
+            migrar(cursor)
+            if not simular:
+                cursor.execute(f"PRAGMA user_version = {version}")
+                cursor.execute("COMMIT")
+            segundos = time.perf_counter() - inicio
+            aplicadas.append((version, descripcion, segundos))
+            print(f"  [{version}] {descripcion}: {segundos:.2f} s")
+    finally:
+        if conn.in_transaction:
+            cursor.execute("ROLLBACK")
+    return aplicadas
+
+
+def _crear_usuarios_por_defecto(cursor):
+    cursor.execute("SELECT COUNT(*) FROM usuarios")
+    if cursor.fetchone()[0] == 0:
+        usuarios_defecto = [
+            ("admin", "Admin2024!", "admin"),
+            ("cajero", "Cajero2024!", "usuario"),
+        ]
+        # Los hashes se calculan en paralelo (hashlib libera el GIL)
+        with ThreadPoolExecutor(max_workers=len(usuarios_defecto)) as ejecutor:
+            hashes = list(ejecutor.map(generar_hash_contrasena, [pwd for _, pwd, _ in usuarios_defecto]))
+        for (user, _, role), (pwd_hash, salt, esquema) in zip(usuarios_defecto, hashes):
+            cursor.execute(
+                "INSERT INTO usuarios (nombre_usuario, contrasena_hash, contrasena_salt, contrasena_esquema, rol, debe_cambiar_contrasena) VALUES (?, ?, ?, ?, ?, 1)",
+                (user, pwd_hash, salt, esquema, role)
+            )
+
+
+def setup_database(simular=False):
+    """
+    Deja la base al día. Si su user_version ya es VERSION_ESQUEMA el arranque
+    no repite ningún CREATE ni verificación. Devuelve las migraciones aplicadas.
+    """
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        # Sin transacciones implícitas: cada migración abre y cierra la suya
+        conn = sqlite3.connect(DB_PATH, isolation_level=None)
         conn.execute("PRAGMA foreign_keys = ON")
-        cursor = conn.cursor()
+        aplicar_pragmas(conn, persistentes=True)
 
-        # --- TABLA USUARIOS ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS usuarios (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                nombre_usuario TEXT UNIQUE NOT NULL, 
-                contrasena_hash TEXT NOT NULL, 
-                contrasena_salt TEXT NOT NULL,
-                rol TEXT NOT NULL CHECK(rol IN ('admin', 'usuario', 'auditor')),
-                debe_cambiar_contrasena INTEGER NOT NULL DEFAULT 1
-            );
-        """)
+        aplicadas = aplicar_migraciones(conn, simular=simular)
+        if aplicadas and not simular:
+            # --- CREAR USUARIOS POR DEFECTO (SI NO EXISTEN) ---
+            cursor = conn.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            _crear_usuarios_por_defecto(cursor)
+            cursor.execute("COMMIT")
+        return aplicadas
+    except sqlite3.Error as e:
+        print(f"Error en la configuración de la base de datos: {e}")
+        return None
+    finally:
+        if conn:
+            conn.close()
 
-        # --- TABLA CATEGORÍAS ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS categorias (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                nombre TEXT UNIQUE NOT NULL
-            );
-        """)
 
-        # --- TABLA PROVEEDORES ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS proveedores (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                nombre TEXT UNIQUE NOT NULL, 
-                contacto TEXT, 
-                telefono TEXT, 
-                email TEXT, 
-                direccion TEXT, 
-                activo INTEGER NOT NULL DEFAULT 1 
-            );
-        """)
+# ============================================================================
+# BÚSQUEDA DE TEXTO COMPLETO (FTS5)
+# ============================================================================
+# unicode61 + remove_diacritics: "cafe" encuentra "Café" y "PURÉ" encuentra
+# "pure". Los índices de prefijo hacen que cada tecla del buscador sea una
+# búsqueda en el índice y no un LIKE '%...%' sobre toda la tabla.
+TOKENIZADOR_FTS = "unicode61 remove_diacritics 2"
 
-        # --- TABLA PRODUCTOS ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS productos (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                codigo TEXT UNIQUE NOT NULL,
-                nombre TEXT NOT NULL,
-                descripcion TEXT,
-                costo REAL NOT NULL CHECK(costo >= 0),
-                precio REAL NOT NULL CHECK(precio >= 0),
-                stock INTEGER NOT NULL CHECK(stock >= 0),
-                activo INTEGER NOT NULL DEFAULT 1,
-                proveedor_id INTEGER,
-                categoria_id INTEGER, 
-                FOREIGN KEY (proveedor_id) REFERENCES proveedores (id) ON DELETE SET NULL,
-                FOREIGN KEY (categoria_id) REFERENCES categorias (id) ON DELETE SET NULL
-            );
-        """)
+# Tablas FTS presentes en la base abierta (se consulta una vez por conexión
+# de escritura/lectura nueva; ver _fts_disponible).
+_tablas_fts = {}
 
-        # --- TABLA DEUDORES ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS deudores (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                nombre TEXT UNIQUE NOT NULL, 
-                telefono TEXT, 
-                direccion TEXT, 
-                notas TEXT, 
-                saldo REAL NOT NULL DEFAULT 0.0 CHECK(saldo >= 0)
-            );
-        """)
 
-        # --- TABLA VENTAS ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS ventas (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usuario_id INTEGER NOT NULL,
-                fecha_hora TEXT NOT NULL,
-                total REAL NOT NULL CHECK(total >= 0),
-                tipo_pago TEXT NOT NULL CHECK(tipo_pago IN ('Contado', 'Credito')),
-                deudor_id INTEGER,
-                saldo_pendiente REAL NOT NULL DEFAULT 0.0 CHECK(saldo_pendiente >= 0),
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id),
-                FOREIGN KEY (deudor_id) REFERENCES deudores (id)
-            );
-        """)
+def crear_indice_fts_productos(cursor):
+    """
+    Crea el índice FTS5 de productos (codigo, nombre, descripcion) y los
+    triggers que lo mantienen sincronizado. Si el SQLite instalado no trae
+    FTS5, se omite y obtener_productos sigue usando LIKE.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'productos_fts'")
+    if cursor.fetchone():
+        return True
 
-        # --- TABLA DETALLES VENTA ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS detalles_venta (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                venta_id INTEGER NOT NULL, 
-                producto_id INTEGER NOT NULL, 
-                cantidad INTEGER NOT NULL CHECK(cantidad > 0), 
-                precio_unitario REAL NOT NULL CHECK(precio_unitario >= 0), 
-                FOREIGN KEY (venta_id) REFERENCES ventas (id) ON DELETE CASCADE, 
-                FOREIGN KEY (producto_id) REFERENCES productos (id)
+    try:
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE productos_fts USING fts5(
+                codigo, nombre, descripcion,
+                content = 'productos', content_rowid = 'id',
+                tokenize = '{TOKENIZADOR_FTS}', prefix = '1 2 3'
             );
         """)
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 no disponible, la búsqueda de productos usará LIKE: {e}")
+        return False
 
-        # --- TABLA COMPRAS ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS compras (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                proveedor_id INTEGER NOT NULL, 
-                fecha TEXT NOT NULL, 
-                total_costo REAL NOT NULL CHECK(total_costo >= 0), 
-                FOREIGN KEY (proveedor_id) REFERENCES proveedores (id)
-            );
-        """)
+    # Relevancia: una coincidencia en el código pesa más que en el nombre, y
+    # ésta más que en la descripción.
+    cursor.execute("INSERT INTO productos_fts(productos_fts, rank) VALUES ('rank', 'bm25(10.0, 5.0, 1.0)')")
 
-        # --- TABLA DETALLES COMPRA ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS detalles_compra (
-                id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                compra_id INTEGER NOT NULL, 
-                producto_id INTEGER NOT NULL, 
-                cantidad INTEGER NOT NULL CHECK(cantidad > 0), 
-                costo_unitario REAL NOT NULL CHECK(costo_unitario >= 0), 
-                FOREIGN KEY (compra_id) REFERENCES compras (id) ON DELETE CASCADE, 
-                FOREIGN KEY (producto_id) REFERENCES productos (id)
-            );
-        """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ai AFTER INSERT ON productos BEGIN
+            INSERT INTO productos_fts(rowid, codigo, nombre, descripcion)
+            VALUES (new.id, new.codigo, new.nombre, new.descripcion);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS productos_fts_ad AFTER DELETE ON productos BEGIN
+            INSERT INTO productos_fts(productos_fts, rowid, codigo, nombre, descripcion)
+            VALUES ('delete', old.id, old.codigo, old.nombre, old.descripcion);
+        END;
+    """)
+    # Solo se dispara al cambiar columnas indexadas: los UPDATE de stock de
+    # cada venta no tocan el índice.
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS productos_fts_au AFTER UPDATE OF codigo, nombre, descripcion ON productos BEGIN
+            INSERT INTO productos_fts(productos_fts, rowid, codigo, nombre, descripcion)
+            VALUES ('delete', old.id, old.codigo, old.nombre, old.descripcion);
+            INSERT INTO productos_fts(rowid, codigo, nombre, descripcion)
+            VALUES (new.id, new.codigo, new.nombre, new.descripcion);
+        END;
+    """)
+    cursor.execute("INSERT INTO productos_fts(productos_fts) VALUES ('rebuild')")
+    return True
 
-        # --- TABLA PAGOS DEUDORES ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS pagos_deudores (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                deudor_id INTEGER NOT NULL,
-                venta_id INTEGER,
-                fecha TEXT NOT NULL,
-                monto REAL NOT NULL CHECK(monto > 0),
-                FOREIGN KEY (deudor_id) REFERENCES deudores (id),
-                FOREIGN KEY (venta_id) REFERENCES ventas (id) ON DELETE SET NULL
-            );
-        """)
 
-        # --- TABLA AUDITORÍA (CORREGIDA) ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS registro_auditoria (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usuario_id INTEGER NOT NULL,
-                fecha_hora TEXT NOT NULL,
-                accion TEXT NOT NULL,
-                descripcion TEXT,
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id) ON DELETE CASCADE
-            );
-        """)
+def crear_indice_fts_auditoria(cursor):
+    """
+    Crea el índice FTS5 del registro de auditoría (accion, descripcion) y los
+    triggers que lo mantienen. Sin FTS5, los filtros de texto usan LIKE.
+    """
+    cursor.execute("SELECT name FROM sqlite_master WHERE name IN ('auditoria_fts', 'auditoria_fts_ai')")
+    existentes = {fila[0] for fila in cursor.fetchall()}
+    if existentes == {'auditoria_fts', 'auditoria_fts_ai'}:
+        return True
+    if 'auditoria_fts' in existentes:
+        # Índice sin triggers (la tabla se reconstruyó): se vuelve a armar
+        cursor.execute("DROP TABLE auditoria_fts")
 
-                # --- TABLA CIERRES DE CAJA ---
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS cierres_caja (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                usuario_id INTEGER NOT NULL,
-                fecha_hora TEXT NOT NULL,
-                total_ventas_sistema REAL NOT NULL CHECK(total_ventas_sistema >= 0),
-                total_efectivo_sistema REAL NOT NULL CHECK(total_efectivo_sistema >= 0),
-                efectivo_contado REAL NOT NULL CHECK(efectivo_contado >= 0),
-                diferencia REAL NOT NULL,
-                observaciones TEXT,
-                FOREIGN KEY (usuario_id) REFERENCES usuarios (id)
+    try:
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE auditoria_fts USING fts5(
+                accion, descripcion,
+                content = 'registro_auditoria', content_rowid = 'id',
+                tokenize = '{TOKENIZADOR_FTS}', prefix = '2 3'
             );
         """)
-        
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_cierres_usuario ON cierres_caja(usuario_id);")
+    except sqlite3.OperationalError as e:
+        print(f"FTS5 no disponible, la búsqueda en auditoría usará LIKE: {e}")
+        return False
 
-        # --- CREAR ÍNDICES PARA OPTIMIZAR BÚSQUEDAS ---
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_codigo ON productos(codigo);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos(nombre);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_fecha ON ventas(fecha_hora);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_ventas_usuario ON ventas(usuario_id);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_auditoria_fecha ON registro_auditoria(fecha_hora);")
-        cursor.execute("CREATE INDEX IF NOT EXISTS idx_auditoria_usuario ON registro_auditoria(usuario_id);")
+    cursor.execute("INSERT INTO auditoria_fts(auditoria_fts, rank) VALUES ('rank', 'bm25(2.0, 1.0)')")
 
-        # --- MIGRAR TABLA AUDITORÍA SI YA EXISTE SIN ROL ---
-        try:
-            cursor.execute("SELECT rol FROM registro_auditoria LIMIT 1")
-        except sqlite3.OperationalError:
-            # La columna 'rol' no existe, necesitamos migrar (silencioso)
-            cursor.execute("""
-                CREATE TABLE IF NOT EXISTS registro_auditoria_new (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    usuario_id INTEGER NOT NULL,
-                    fecha_hora TEXT NOT NULL,
-                    accion TEXT NOT NULL,
-                    descripcion TEXT,
-                    FOREIGN KEY (usuario_id) REFERENCES usuarios (id) ON DELETE CASCADE
-                );
-            """)
-            cursor.execute("""
-                INSERT INTO registro_auditoria_new (id, usuario_id, fecha_hora, accion, descripcion)
-                SELECT id, usuario_id, fecha_hora, accion, descripcion FROM registro_auditoria;
-            """)
-            cursor.execute("DROP TABLE registro_auditoria;")
-            cursor.execute("ALTER TABLE registro_auditoria_new RENAME TO registro_auditoria;")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_auditoria_fecha ON registro_auditoria(fecha_hora);")
-            cursor.execute("CREATE INDEX IF NOT EXISTS idx_auditoria_usuario ON registro_auditoria(usuario_id);")
-
-        # --- MIGRAR COLUMNA debe_cambiar_contrasena SI NO EXISTE ---
-        cursor.execute("PRAGMA table_info(usuarios)")
-        columnas = [col[1] for col in cursor.fetchall()]
-        if 'debe_cambiar_contrasena' not in columnas:
-            cursor.execute("ALTER TABLE usuarios ADD COLUMN debe_cambiar_contrasena INTEGER NOT NULL DEFAULT 0")
-            # Marcar solo usuarios con contraseñas débiles
-            cursor.execute("""
-                UPDATE usuarios 
-                SET debe_cambiar_contrasena = 1 
-                WHERE nombre_usuario IN ('admin', 'cajero')
-            """)
-
-        # --- CREAR USUARIOS POR DEFECTO (SI NO EXISTEN) ---
-        cursor.execute("SELECT COUNT(*) FROM usuarios")
-        if cursor.fetchone()[0] == 0:
-            usuarios_defecto = [
-                ("admin", "Admin2024!", "admin"),
-                ("cajero", "Cajero2024!", "usuario"),
-            ]
-            for user, pwd, role in usuarios_defecto:
-                salt = os.urandom(16)
-                pwd_hash = hashlib.pbkdf2_hmac('sha256', pwd.encode('utf-8'), salt, 100000)
-                cursor.execute(
-                    "INSERT INTO usuarios (nombre_usuario, contrasena_hash, contrasena_salt, rol, debe_cambiar_contrasena) VALUES (?, ?, ?, ?, 1)",
-                    (user, binascii.hexlify(pwd_hash).decode('utf-8'), binascii.hexlify(salt).decode('utf-8'), role)
-                )
-
-        conn.commit()
-    except sqlite3.Error as e:
-        print(f"Error en la configuración de la base de datos: {e}")
-    finally:
-        if conn:
-            conn.close()
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS auditoria_fts_ai AFTER INSERT ON registro_auditoria BEGIN
+            INSERT INTO auditoria_fts(rowid, accion, descripcion)
+            VALUES (new.id, new.accion, new.descripcion);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS auditoria_fts_ad AFTER DELETE ON registro_auditoria BEGIN
+            INSERT INTO auditoria_fts(auditoria_fts, rowid, accion, descripcion)
+            VALUES ('delete', old.id, old.accion, old.descripcion);
+        END;
+    """)
+    cursor.execute("""
+        CREATE TRIGGER IF NOT EXISTS auditoria_fts_au AFTER UPDATE OF accion, descripcion ON registro_auditoria BEGIN
+            INSERT INTO auditoria_fts(auditoria_fts, rowid, accion, descripcion)
+            VALUES ('delete', old.id, old.accion, old.descripcion);
+            INSERT INTO auditoria_fts(rowid, accion, descripcion)
+            VALUES (new.id, new.accion, new.descripcion);
+        END;
+    """)
+    cursor.execute("INSERT INTO auditoria_fts(auditoria_fts) VALUES ('rebuild')")
+    return True
+
+
+def _fts_disponible(cursor, tabla):
+    if tabla not in _tablas_fts:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,))
+        _tablas_fts[tabla] = cursor.fetchone() is not None
+    return _tablas_fts[tabla]
+
+
+def consulta_fts(texto):
+    """
+    Convierte lo que escribe el usuario en una consulta FTS5 segura: cada
+    palabra se busca como prefijo y todas deben aparecer. Lo que va entre
+    comillas se busca como frase exacta.
+    'coca 1.5' -> '"coca"* "1"* "5"*'
+    '"venta id 12" contado' -> '"venta id 12" "contado"*'
+    """
+    partes = []
+    for frase, sueltas in re.findall(r'"([^"]*)"|([^"]+)', texto.lower()):
+        if frase:
+            palabras = re.findall(r"\w+", frase)
+            if palabras:
+                partes.append('"' + " ".join(palabras) + '"')
+        else:
+            partes.extend(f'"{t}"*' for t in re.findall(r"\w+", sueltas))
+    return " ".join(partes)
+
+
+# ============================================================================
+# RESÚMENES DIARIOS PARA REPORTES
+# ============================================================================
+# Los reportes por rango leen estas tablas (una fila por día y producto /
+# usuario / proveedor) en lugar de recorrer todo el detalle. registrar_venta,
+# registrar_compra y registrar_devolucion las actualizan en la misma
+# transacción; reconstruir_resumenes() las recalcula desde el detalle.
+_UPSERT_RESUMEN_VENTA = (
+    "INSERT INTO resumen_ventas_diario (fecha, usuario_id, tipo_pago, cantidad_ventas, total) "
+    "VALUES (?, ?, ?, 1, ?) "
+    "ON CONFLICT(fecha, usuario_id, tipo_pago) DO UPDATE SET "
+    "cantidad_ventas = cantidad_ventas + 1, total = total + excluded.total"
+)
+_UPSERT_RESUMEN_PRODUCTO = (
+    "INSERT INTO resumen_productos_diario (fecha, producto_id, cantidad, ingresos, costo) "
+    "VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(fecha, producto_id) DO UPDATE SET "
+    "cantidad = cantidad + excluded.cantidad, ingresos = ingresos + excluded.ingresos, "
+    "costo = costo + excluded.costo"
+)
+_UPSERT_RESUMEN_DEVOLUCION = (
+    "INSERT INTO resumen_productos_diario (fecha, producto_id, cantidad_devuelta, monto_devuelto) "
+    "VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(fecha, producto_id) DO UPDATE SET "
+    "cantidad_devuelta = cantidad_devuelta + excluded.cantidad_devuelta, "
+    "monto_devuelto = monto_devuelto + excluded.monto_devuelto"
+)
+_UPSERT_RESUMEN_COMPRA = (
+    "INSERT INTO resumen_compras_diario (fecha, proveedor_id, cantidad_compras, total_costo) "
+    "VALUES (?, ?, 1, ?) "
+    "ON CONFLICT(fecha, proveedor_id) DO UPDATE SET "
+    "cantidad_compras = cantidad_compras + 1, total_costo = total_costo + excluded.total_costo"
+)
+
+
+def completar_costos_historicos(cursor):
+    """
+    Completa detalles_venta.costo_unitario donde falte: costo de la última
+    compra del producto hecha hasta el día de la venta o, si no hay compras,
+    el costo actual del producto. Devuelve la cantidad de líneas completadas.
+    """
+    cursor.execute("""
+        UPDATE detalles_venta
+        SET costo_unitario = COALESCE(
+            (SELECT dc.costo_unitario
+             FROM detalles_compra dc
+             JOIN compras c ON dc.compra_id = c.id
+             WHERE dc.producto_id = detalles_venta.producto_id
+               AND c.fecha <= (SELECT date(v.fecha_hora) FROM ventas v WHERE v.id = detalles_venta.venta_id)
+             ORDER BY c.fecha DESC, dc.id DESC
+             LIMIT 1),
+            (SELECT p.costo FROM productos p WHERE p.id = detalles_venta.producto_id)
+        )
+        WHERE costo_unitario IS NULL
+    """)
+    return cursor.rowcount
+
+
+def crear_tablas_resumen(cursor, reconstruir=False):
+    """
+    Crea las tablas de resumen y, si recién se crean (o `reconstruir`), las
+    llena con el historial.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'resumen_ventas_diario'")
+    existian = cursor.fetchone() is not None
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_ventas_diario (
+            fecha TEXT NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            tipo_pago TEXT NOT NULL,
+            cantidad_ventas INTEGER NOT NULL DEFAULT 0,
+            total REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, usuario_id, tipo_pago)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_productos_diario (
+            fecha TEXT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            cantidad INTEGER NOT NULL DEFAULT 0,
+            ingresos REAL NOT NULL DEFAULT 0,
+            costo REAL NOT NULL DEFAULT 0,
+            cantidad_devuelta INTEGER NOT NULL DEFAULT 0,
+            monto_devuelto REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, producto_id)
+        ) WITHOUT ROWID;
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_compras_diario (
+            fecha TEXT NOT NULL,
+            proveedor_id INTEGER NOT NULL,
+            cantidad_compras INTEGER NOT NULL DEFAULT 0,
+            total_costo REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (fecha, proveedor_id)
+        ) WITHOUT ROWID;
+    """)
+
+    if not existian or reconstruir:
+        _reconstruir_resumenes(cursor)
+
+
+def _filtro_fechas(columna, fecha_inicio, fecha_fin):
+    """Condición de rango semiabierto sobre `columna` (extremos opcionales)."""
+    condiciones, params = [], []
+    if fecha_inicio:
+        condiciones.append(f"{columna} >= ?")
+        params.append(fecha_inicio)
+    if fecha_fin:
+        condiciones.append(f"{columna} < date(?, '+1 day')")
+        params.append(fecha_fin)
+    return (" AND ".join(condiciones) or "1"), params
+
+
+def _reconstruir_resumenes(cursor, fecha_inicio=None, fecha_fin=None):
+    """Recalcula los resúmenes del rango (todo el historial si no hay fechas)."""
+    filtro, params = _filtro_fechas("fecha", fecha_inicio, fecha_fin)
+    for tabla in ("resumen_ventas_diario", "resumen_productos_diario", "resumen_compras_diario"):
+        cursor.execute(f"DELETE FROM {tabla} WHERE {filtro}", params)
+
+    filtro, params = _filtro_fechas("v.fecha_hora", fecha_inicio, fecha_fin)
+    cursor.execute(f"""
+        INSERT INTO resumen_ventas_diario (fecha, usuario_id, tipo_pago, cantidad_ventas, total)
+        SELECT date(v.fecha_hora), v.usuario_id, v.tipo_pago, COUNT(*), SUM(v.total)
+        FROM ventas v
+        WHERE {filtro}
+        GROUP BY date(v.fecha_hora), v.usuario_id, v.tipo_pago
+    """, params)
+    cursor.execute(f"""
+        INSERT INTO resumen_productos_diario (fecha, producto_id, cantidad, ingresos, costo)
+        SELECT date(v.fecha_hora), dv.producto_id, SUM(dv.cantidad),
+               SUM(dv.cantidad * dv.precio_unitario), SUM(dv.cantidad * dv.costo_unitario)
+        FROM detalles_venta dv
+        JOIN ventas v ON dv.venta_id = v.id
+        WHERE {filtro}
+        GROUP BY date(v.fecha_hora), dv.producto_id
+    """, params)
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'detalles_devolucion'")
+    if cursor.fetchone():
+        filtro, params = _filtro_fechas("d.fecha_hora", fecha_inicio, fecha_fin)
+        cursor.execute(f"""
+            INSERT INTO resumen_productos_diario (fecha, producto_id, cantidad_devuelta, monto_devuelto)
+            SELECT date(d.fecha_hora), dd.producto_id, SUM(dd.cantidad_devuelta),
+                   SUM(dd.cantidad_devuelta * dd.precio_unitario)
+            FROM detalles_devolucion dd
+            JOIN devoluciones d ON dd.devolucion_id = d.id
+            WHERE {filtro}
+            GROUP BY date(d.fecha_hora), dd.producto_id
+            ON CONFLICT(fecha, producto_id) DO UPDATE SET
+                cantidad_devuelta = excluded.cantidad_devuelta,
+                monto_devuelto = excluded.monto_devuelto
+        """, params)
+
+    filtro, params = _filtro_fechas("c.fecha", fecha_inicio, fecha_fin)
+    cursor.execute(f"""
+        INSERT INTO resumen_compras_diario (fecha, proveedor_id, cantidad_compras, total_costo)
+        SELECT c.fecha, c.proveedor_id, COUNT(*), SUM(c.total_costo)
+        FROM compras c
+        WHERE {filtro}
+        GROUP BY c.fecha, c.proveedor_id
+    """, params)
+
+
+@db_connection
+def reconstruir_resumenes(cursor, fecha_inicio=None, fecha_fin=None):
+    """
+    Recalcula las tablas de resumen desde el detalle de ventas, devoluciones y
+    compras (para cargar el historial o corregir diferencias).
+    """
+    # "historico": cambia reportes de períodos ya cerrados (ver report_cache.py)
+    marcar_cambios("ventas", "compras", "devoluciones", "historico")
+    _reconstruir_resumenes(cursor, fecha_inicio, fecha_fin)
+    return True
 
 
 # ============================================================================
 # FUNCIONES DE AUDITORÍA (CENTRALIZADAS)
 # ============================================================================
-def registrar_auditoria(cursor, usuario_id, accion, descripcion=""):
-    """Registra una acción en la tabla de auditoría."""
+class AuditBuffer:
+    """
+    Cola de eventos de auditoría para el modo "agrupado".
+
+    Los eventos llegan ya confirmados (ver ConnectionPool.al_confirmar) y un
+    hilo los escribe con un único INSERT por lote, cada `intervalo` segundos
+    o al juntar `max_lote`. La descripción se arma recién ahí, fuera de la
+    transacción que generó el evento. vaciar() escribe lo pendiente en el
+    hilo que la llama (se usa al cerrar).
+    """
+
+    def __init__(self, max_lote=200, intervalo=0.5):
+        self.max_lote = max_lote
+        self.intervalo = intervalo
+        self._eventos = []
+        self._lock = threading.Lock()
+        self._hay_lote = threading.Event()
+        self._hilo = None
+        self._detenido = False
+
+    def encolar(self, evento):
+        with self._lock:
+            self._eventos.append(evento)
+            lleno = len(self._eventos) >= self.max_lote
+            if self._hilo is None and not self._detenido:
+                self._hilo = threading.Thread(target=self._trabajar, name="auditoria", daemon=True)
+                self._hilo.start()
+        if lleno:
+            self._hay_lote.set()
+
+    def pendientes(self):
+        with self._lock:
+            return len(self._eventos)
+
+    def _trabajar(self):
+        while not self._detenido:
+            self._hay_lote.wait(self.intervalo)
+            self._hay_lote.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                # El hilo no puede morir: los eventos siguientes quedarían sin escribir
+                print(f"Error inesperado al escribir la auditoría: {e}")
+
+    def vaciar(self):
+        """Escribe todos los eventos pendientes. Devuelve cuántos escribió."""
+        with self._lock:
+            eventos, self._eventos = self._eventos, []
+        if not eventos:
+            return 0
+        validos, filas = [], []
+        for evento in eventos:
+            try:
+                filas.append(_fila_auditoria(*evento))
+            except Exception as e:
+                # Un evento mal armado (p. ej. un campo que falta en la
+                # descripción) se descarta solo, no con todo el lote.
+                print(f"Evento de auditoría descartado ({evento[2]}): {e!r}")
+                continue
+            validos.append(evento)
+        if not filas:
+            return 0
+        try:
+            with pool.transaccion() as conn:
+                marcar_cambios("auditoria")
+                for inicio in range(0, len(filas), self.max_lote):
+                    conn.executemany(_INSERT_AUDITORIA, filas[inicio:inicio + self.max_lote])
+        except sqlite3.Error as e:
+            print(f"Error al escribir la auditoría pendiente ({len(validos)} eventos): {e}")
+            with self._lock:
+                # Se reintentan en el próximo lote, antes que los nuevos
+                self._eventos[:0] = validos
+            return 0
+        return len(filas)
+
+    def detener(self):
+        """Detiene el hilo y escribe lo pendiente."""
+        self._detenido = True
+        self._hay_lote.set()
+        if self._hilo is not None and self._hilo is not threading.current_thread():
+            self._hilo.join(timeout=5)
+        self._hilo = None
+        return self.vaciar()
+
+
+auditoria_pendiente = AuditBuffer(**AUDITORIA_AGRUPADA)
+atexit.register(auditoria_pendiente.detener)
+
+
+def configurar_auditoria(modo):
+    """Cambia el modo de auditoría ("transaccion" o "agrupado")."""
+    global MODO_AUDITORIA
+    if modo not in ("transaccion", "agrupado"):
+        raise ValueError(f"Modo de auditoría desconocido: {modo}")
+    if modo == "transaccion":
+        auditoria_pendiente.vaciar()
+    MODO_AUDITORIA = modo
+
+
+_INSERT_AUDITORIA = (
+    "INSERT INTO registro_auditoria "
+    "(usuario_id, fecha_hora, accion, descripcion, entidad_tipo, entidad_id, monto, datos) "
+    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+
+def _fila_auditoria(usuario_id, fecha_hora, accion, descripcion, entidad, monto, campos):
+    """Arma la fila a insertar: la descripción se formatea y los campos van como JSON."""
+    entidad_tipo, entidad_id = entidad if entidad else (None, None)
+    if campos:
+        descripcion = descripcion.format(**campos)
+        datos = json.dumps(campos, ensure_ascii=False, default=str)
+    else:
+        datos = None
+    return (usuario_id, fecha_hora, accion, descripcion, entidad_tipo, entidad_id, monto, datos)
+
+
+def registrar_auditoria(cursor, usuario_id, accion, descripcion="", entidad=None, monto=None, **campos):
+    """
+    Registra una acción en la tabla de auditoría.
+
+    - `entidad`: (tipo, id) del registro afectado, p. ej. ("venta", 4812);
+      se guarda en columnas indexadas para buscar por entidad.
+    - `monto`: importe del evento, si tiene.
+    - `campos`: datos del evento; se guardan como JSON en `datos` y
+      `descripcion` es entonces una plantilla con esos campos
+      ("Venta ID {venta_id}. Total: ${total:.2f}."). El texto se arma solo al
+      escribirlo.
+
+    Según MODO_AUDITORIA el evento se inserta en esta misma transacción o se
+    encola y se escribe en lote tras el commit.
+    """
     fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    cursor.execute(
-        "INSERT INTO registro_auditoria (usuario_id, fecha_hora, accion, descripcion) VALUES (?, ?, ?, ?)",
-        (usuario_id, fecha_hora, accion, descripcion)
-    )
+    evento = (usuario_id, fecha_hora, accion, descripcion, entidad, monto, campos)
+    if MODO_AUDITORIA == "agrupado":
+        pool.al_confirmar(lambda: auditoria_pendiente.encolar(evento))
+        return
+    marcar_cambios("auditoria")
+    cursor.execute(_INSERT_AUDITORIA, _fila_auditoria(*evento))
+
+
+# Patrones de las descripciones viejas (texto libre) para completar las
+# columnas estructuradas: acción -> (regex, tipo de entidad, grupo del id, grupo del monto)
+_PATRONES_AUDITORIA = {
+    "VENTA_REGISTRADA": (r"Venta ID (\d+)\. Total: \$(\d+(?:\.\d+)?)", "venta", 1, 2),
+    "COMPRA_REGISTRADA": (r"Compra ID (\d+) .*Total: \$(\d+(?:\.\d+)?)", "compra", 1, 2),
+    "PAGO_REGISTRADO": (r"Pago de \$(\d+(?:\.\d+)?) .*venta ID (\d+)", "venta", 2, 1),
+    "DEVOLUCION_REGISTRADA": (r"de venta #(\d+)\. Total: \$(\d+(?:\.\d+)?)", "venta", 1, 2),
+    "CIERRE_CAJA": (r"Cierre ID (\d+)", "cierre", 1, None),
+    "PROD_ACTUALIZADO": (r"Producto ID (\d+)", "producto", 1, None),
+    "PROD_DESACTIVADO": (r"Producto ID (\d+)", "producto", 1, None),
+    "USUARIO_ELIMINADO": (r"\(ID: (\d+)\)", "usuario", 1, None),
+}
+
+
+def completar_entidades_auditoria(cursor, lote=5000):
+    """
+    Completa entidad_tipo/entidad_id/monto de los registros anteriores a las
+    columnas estructuradas, interpretando su descripción. Devuelve cuántos
+    registros completó.
+    """
+    acciones = list(_PATRONES_AUDITORIA)
+    marcadores = ", ".join("?" * len(acciones))
+    patrones = {accion: (re.compile(regex), tipo, g_id, g_monto)
+                for accion, (regex, tipo, g_id, g_monto) in _PATRONES_AUDITORIA.items()}
+    completados, ultimo_id = 0, 0
+    while True:
+        cursor.execute(
+            f"SELECT id, accion, descripcion FROM registro_auditoria "
+            f"WHERE id > ? AND entidad_tipo IS NULL AND accion IN ({marcadores}) ORDER BY id LIMIT ?",
+            [ultimo_id] + acciones + [lote]
+        )
+        filas = cursor.fetchall()
+        if not filas:
+            return completados
+        cambios = []
+        for id_registro, accion, descripcion in filas:
+            regex, tipo, g_id, g_monto = patrones[accion]
+            encontrado = regex.search(descripcion or "")
+            if encontrado:
+                monto = float(encontrado.group(g_monto)) if g_monto else None
+                cambios.append((tipo, int(encontrado.group(g_id)), monto, id_registro))
+        cursor.executemany(
+            "UPDATE registro_auditoria SET entidad_tipo = ?, entidad_id = ?, monto = ? WHERE id = ?",
+            cambios
+        )
+        completados += len(cambios)
+        ultimo_id = filas[-1][0]
 
 
-@db_connection
-def obtener_registro_auditoria(cursor, limite=500):
-    """Recupera los registros de auditoría con el rol del usuario."""
-    query = """
+@db_read_connection
+def obtener_evento_auditoria(cursor, id_registro):
+    """
+    Detalle de un registro de auditoría: (fecha_hora, usuario, accion,
+    descripcion, entidad_tipo, entidad_id, monto, datos), con `datos` ya
+    convertido de JSON a dict.
+    """
+    cursor.execute("""
+        SELECT ra.fecha_hora, u.nombre_usuario, ra.accion, ra.descripcion,
+               ra.entidad_tipo, ra.entidad_id, ra.monto, ra.datos
+        FROM registro_auditoria ra
+        JOIN usuarios u ON ra.usuario_id = u.id
+        WHERE ra.id = ?
+    """, (id_registro,))
+    fila = cursor.fetchone()
+    if fila is None:
+        return None
+    datos = json.loads(fila[7]) if fila[7] else {}
+    return fila[:7] + (datos,)
+
+
+def _filtros_auditoria(cursor, texto=None, categoria=None, usuario=None, rol=None,
+                       fecha_desde=None, fecha_hasta=None, entidad_tipo=None, entidad_id=None):
+    """Condiciones WHERE (y sus parámetros) para los filtros del registro de auditoría."""
+    condiciones, params = [], []
+    if entidad_tipo:
+        # idx_auditoria_entidad: todos los eventos de, p. ej., la venta 4812
+        condiciones.append("ra.entidad_tipo = ?")
+        params.append(entidad_tipo)
+        if entidad_id is not None:
+            condiciones.append("ra.entidad_id = ?")
+            params.append(entidad_id)
+    consulta = consulta_fts(texto) if texto else ""
+    if consulta and _fts_disponible(cursor, "auditoria_fts"):
+        # El índice FTS devuelve los ids; el resto de los filtros se aplica
+        # encima. El usuario no está en el índice: se busca aparte, igual que
+        # con LIKE (usuarios es chica e idx_auditoria_usuario_fecha resuelve el IN).
+        condiciones.append(
+            "(ra.id IN (SELECT rowid FROM auditoria_fts WHERE auditoria_fts MATCH ?)"
+            " OR ra.usuario_id IN (SELECT id FROM usuarios WHERE nombre_usuario LIKE ?))"
+        )
+        params += [consulta, f"%{texto}%"]
+    elif texto:
+        patron = f"%{texto}%"
+        condiciones.append("(ra.accion LIKE ? OR ra.descripcion LIKE ? OR u.nombre_usuario LIKE ?)")
+        params += [patron, patron, patron]
+    if categoria:
+        # Prefijo de la acción ("PROD", "VENTA"...). Se filtra mientras se
+        # recorre idx_auditoria_fecha en orden: con LIMIT corta enseguida, en
+        # lugar de juntar y ordenar todas las acciones de la categoría.
+        condiciones.append("ra.accion GLOB ?")
+        params.append(f"{categoria}*")
+    if usuario:
+        condiciones.append("u.nombre_usuario = ?")
+        params.append(usuario)
+    if rol:
+        condiciones.append("u.rol = ?")
+        params.append(rol)
+    if fecha_desde:
+        condiciones.append("ra.fecha_hora >= ?")
+        params.append(fecha_desde)
+    if fecha_hasta:
+        condiciones.append("ra.fecha_hora < date(?, '+1 day')")
+        params.append(fecha_hasta)
+    return condiciones, params
+
+
+@db_read_connection
+def obtener_registro_auditoria(cursor, limite=500, texto=None, categoria=None, usuario=None,
+                               rol=None, fecha_desde=None, fecha_hasta=None,
+                               entidad_tipo=None, entidad_id=None,
+                               despues_de=None, incluir_id=False):
+    """
+    Recupera los registros de auditoría con el rol del usuario, del más nuevo
+    al más viejo, aplicando los filtros en SQL.
+
+    Paginación por keyset: `despues_de` es el (fecha_hora, id) del último
+    registro de la página anterior, así cada página cuesta lo mismo sin
+    importar cuán atrás se esté en el historial. Con `incluir_id=True` cada
+    fila empieza con el id (lo necesario para pedir la página siguiente).
+    """
+    condiciones, params = _filtros_auditoria(
+        cursor, texto, categoria, usuario, rol, fecha_desde, fecha_hasta, entidad_tipo, entidad_id
+    )
+    if despues_de is not None:
+        fecha_hora, id_registro = despues_de
+        condiciones.append("ra.fecha_hora <= ? AND (ra.fecha_hora < ? OR ra.id < ?)")
+        params += [fecha_hora, fecha_hora, id_registro]
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+
+    query = f"""
         SELECT 
+            {"ra.id," if incluir_id else ""}
             ra.fecha_hora, 
             u.nombre_usuario,
             u.rol,
@@ -299,88 +1520,217 @@ def obtener_registro_auditoria(cursor, limite=500):
             ra.descripcion
         FROM registro_auditoria ra
         JOIN usuarios u ON ra.usuario_id = u.id
-        ORDER BY ra.fecha_hora DESC
+        {where}
+        ORDER BY ra.fecha_hora DESC, ra.id DESC
         LIMIT ?
     """
-    cursor.execute(query, (limite,))
+    cursor.execute(query, params + [limite])
+    return cursor.fetchall()
+
+
+@db_read_connection
+def contar_registro_auditoria(cursor, texto=None, categoria=None, usuario=None,
+                              rol=None, fecha_desde=None, fecha_hasta=None,
+                              entidad_tipo=None, entidad_id=None):
+    """Cantidad de registros de auditoría que cumplen los filtros."""
+    condiciones, params = _filtros_auditoria(
+        cursor, texto, categoria, usuario, rol, fecha_desde, fecha_hasta, entidad_tipo, entidad_id
+    )
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    cursor.execute(
+        f"SELECT COUNT(*) FROM registro_auditoria ra JOIN usuarios u ON ra.usuario_id = u.id {where}",
+        params
+    )
+    return cursor.fetchone()[0]
+
+
+@db_read_connection
+def buscar_registro_auditoria(cursor, texto, limite=200, categoria=None, usuario=None,
+                              rol=None, fecha_desde=None, fecha_hasta=None,
+                              entidad_tipo=None, entidad_id=None):
+    """
+    Búsqueda de texto en el registro de auditoría ordenada por relevancia
+    (bm25: pesa más la acción que la descripción). Admite frases entre
+    comillas. Los eventos que coinciden solo por el nombre de usuario van
+    después, del más nuevo al más viejo. Filas como las de
+    obtener_registro_auditoria(incluir_id=True). Sin FTS5 devuelve los más
+    recientes que contienen el texto.
+    """
+    consulta = consulta_fts(texto) if texto else ""
+    if not consulta or not _fts_disponible(cursor, "auditoria_fts"):
+        return obtener_registro_auditoria(
+            limite, texto=texto, categoria=categoria, usuario=usuario, rol=rol,
+            fecha_desde=fecha_desde, fecha_hasta=fecha_hasta,
+            entidad_tipo=entidad_tipo, entidad_id=entidad_id, incluir_id=True
+        )
+
+    condiciones, params = _filtros_auditoria(
+        cursor, None, categoria, usuario, rol, fecha_desde, fecha_hasta, entidad_tipo, entidad_id
+    )
+    condiciones.insert(0, "(f.rowid IS NOT NULL OR u.nombre_usuario LIKE ?)")
+    params.insert(0, f"%{texto}%")
+    cursor.execute(f"""
+        SELECT ra.id, ra.fecha_hora, u.nombre_usuario, u.rol, ra.accion, ra.descripcion
+        FROM registro_auditoria ra
+        JOIN usuarios u ON ra.usuario_id = u.id
+        LEFT JOIN (
+            SELECT rowid, rank FROM auditoria_fts WHERE auditoria_fts MATCH ?
+        ) f ON f.rowid = ra.id
+        WHERE {' AND '.join(condiciones)}
+        ORDER BY f.rank IS NULL, f.rank, ra.fecha_hora DESC, ra.id DESC
+        LIMIT ?
+    """, [consulta] + params + [limite])
     return cursor.fetchall()
 
 
 # ============================================================================
 # FUNCIONES DE USUARIOS
 # ============================================================================
-@db_connection
-def verificar_credenciales(cursor, nombre_usuario, contrasena):
+def calcular_hash_contrasena(contrasena, salt, esquema):
+    """Hash (bytes) de `contrasena` con el esquema "algoritmo$parámetros"."""
+    algoritmo, *parametros = esquema.split("$")
+    if algoritmo == "scrypt":
+        n, r, p = (int(valor) for valor in parametros)
+        return hashlib.scrypt(
+            contrasena.encode('utf-8'), salt=salt, n=n, r=r, p=p,
+            maxmem=256 * n * r + 1024 * 1024, dklen=32,
+        )
+    if algoritmo == "pbkdf2_sha256":
+        return hashlib.pbkdf2_hmac('sha256', contrasena.encode('utf-8'), salt, int(parametros[0]))
+    raise ValueError(f"Esquema de contraseña desconocido: {esquema}")
+
+
+def generar_hash_contrasena(contrasena, esquema=None):
+    """Devuelve (hash_hex, salt_hex, esquema) para guardar en la tabla usuarios."""
+    esquema = esquema or ESQUEMA_CONTRASENA
+    salt = os.urandom(16)
+    contrasena_hash = calcular_hash_contrasena(contrasena, salt, esquema)
+    return (binascii.hexlify(contrasena_hash).decode('utf-8'),
+            binascii.hexlify(salt).decode('utf-8'), esquema)
+
+
+def contrasena_coincide(contrasena, hash_hex, salt_hex, esquema):
+    """Compara en tiempo constante la contraseña con el hash guardado."""
+    calculado = calcular_hash_contrasena(contrasena, binascii.unhexlify(salt_hex), esquema)
+    return hmac.compare_digest(calculado, binascii.unhexlify(hash_hex))
+
+
+# Hash de relleno para que un usuario inexistente tarde lo mismo que una
+# contraseña incorrecta (no revela qué nombres de usuario existen).
+_CREDENCIAL_FICTICIA = None
+
+
+@db_read_connection
+def _obtener_credenciales(cursor, nombre_usuario):
     cursor.execute(
-        "SELECT id, rol, contrasena_hash, contrasena_salt, debe_cambiar_contrasena FROM usuarios WHERE nombre_usuario = ?",
+        "SELECT id, rol, contrasena_hash, contrasena_salt, contrasena_esquema, debe_cambiar_contrasena FROM usuarios WHERE nombre_usuario = ?",
         (nombre_usuario,)
     )
-    resultado = cursor.fetchone()
+    return cursor.fetchone()
+
+
+@db_connection
+def _guardar_hash_contrasena(cursor, id_usuario, contrasena_hash, salt, esquema, hash_anterior=None):
+    """Guarda un hash nuevo; con `hash_anterior` solo si nadie lo cambió mientras tanto."""
+    marcar_cambios("usuarios")
+    consulta = "UPDATE usuarios SET contrasena_hash = ?, contrasena_salt = ?, contrasena_esquema = ? WHERE id = ?"
+    parametros = [contrasena_hash, salt, esquema, id_usuario]
+    if hash_anterior is not None:
+        consulta += " AND contrasena_hash = ?"
+        parametros.append(hash_anterior)
+    cursor.execute(consulta, parametros)
+    return cursor.rowcount == 1
+
+
+def verificar_credenciales(nombre_usuario, contrasena):
+    """
+    Devuelve (id, rol, debe_cambiar_contrasena) o None. El hash se calcula
+    sin tener tomada ninguna conexión; si el usuario tiene un esquema viejo se
+    vuelve a hashear con ESQUEMA_CONTRASENA.
+
+    Tarda lo que tarde el KDF: desde la interfaz usar auth_service.
+    """
+    global _CREDENCIAL_FICTICIA
+    resultado = _obtener_credenciales(nombre_usuario)
     if resultado is None:
+        if _CREDENCIAL_FICTICIA is None:
+            _CREDENCIAL_FICTICIA = generar_hash_contrasena("")
+        contrasena_coincide(contrasena, *_CREDENCIAL_FICTICIA)
         return None
-    
-    user_id, rol, stored_hash, stored_salt_hex, debe_cambiar = resultado
-    salt = binascii.unhexlify(stored_salt_hex)
-    new_hash = hashlib.pbkdf2_hmac('sha256', contrasena.encode('utf-8'), salt, 100000)
-    
-    if binascii.hexlify(new_hash).decode('utf-8') == stored_hash:
-        return user_id, rol, bool(debe_cambiar)
-    else:
+
+    user_id, rol, stored_hash, stored_salt_hex, esquema, debe_cambiar = resultado
+    try:
+        if not contrasena_coincide(contrasena, stored_hash, stored_salt_hex, esquema):
+            return None
+    except (ValueError, binascii.Error) as e:
+        print(f"Error al verificar la contraseña de '{nombre_usuario}': {e}")
         return None
 
+    if esquema != ESQUEMA_CONTRASENA:
+        _guardar_hash_contrasena(user_id, *generar_hash_contrasena(contrasena), hash_anterior=stored_hash)
+    return user_id, rol, bool(debe_cambiar)
 
-@db_connection
+
+@db_read_connection
 def obtener_usuarios(cursor):
     cursor.execute("SELECT id, nombre_usuario, rol FROM usuarios ORDER BY nombre_usuario ASC")
     return cursor.fetchall()
 
 
-@db_connection
-def agregar_usuario(cursor, usuario_admin_id, nombre_usuario, contrasena, rol):
+def agregar_usuario(usuario_admin_id, nombre_usuario, contrasena, rol):
     """✅ MEJORADO: Valida contraseña y audita la creación."""
     if len(contrasena) < 6:
         return "Error: La contraseña debe tener al menos 6 caracteres."
-    
+    # El hash se calcula antes de abrir la transacción de escritura
+    return _insertar_usuario(usuario_admin_id, nombre_usuario, generar_hash_contrasena(contrasena), rol)
+
+
+@db_connection
+def _insertar_usuario(cursor, usuario_admin_id, nombre_usuario, credencial, rol):
+    marcar_cambios("usuarios")
+    contrasena_hash, salt, esquema = credencial
     try:
-        salt = os.urandom(16)
-        contrasena_hash = hashlib.pbkdf2_hmac('sha256', contrasena.encode('utf-8'), salt, 100000)
         cursor.execute(
-            "INSERT INTO usuarios (nombre_usuario, contrasena_hash, contrasena_salt, rol, debe_cambiar_contrasena) VALUES (?, ?, ?, ?, 0)",
-            (nombre_usuario, binascii.hexlify(contrasena_hash).decode('utf-8'), 
-             binascii.hexlify(salt).decode('utf-8'), rol)
+            "INSERT INTO usuarios (nombre_usuario, contrasena_hash, contrasena_salt, contrasena_esquema, rol, debe_cambiar_contrasena) VALUES (?, ?, ?, ?, ?, 0)",
+            (nombre_usuario, contrasena_hash, salt, esquema, rol)
         )
         registrar_auditoria(cursor, usuario_admin_id, "USUARIO_CREADO", 
-                          f"Usuario '{nombre_usuario}' con rol '{rol}' fue creado.")
+                          f"Usuario '{nombre_usuario}' con rol '{rol}' fue creado.",
+                          entidad=("usuario", cursor.lastrowid))
         return True
     except sqlite3.IntegrityError:
         return "Error: El nombre de usuario ya existe."
 
 
-@db_connection
-def actualizar_contrasena(cursor, id_usuario, nueva_contrasena, usuario_admin_id=None):
+def actualizar_contrasena(id_usuario, nueva_contrasena, usuario_admin_id=None):
     """✅ MEJORADO: Valida contraseña, audita y quita flag de cambio."""
     if len(nueva_contrasena) < 6:
         return "Error: La contraseña debe tener al menos 6 caracteres."
-    
-    nuevo_salt = os.urandom(16)
-    nueva_contrasena_hash = hashlib.pbkdf2_hmac('sha256', nueva_contrasena.encode('utf-8'), nuevo_salt, 100000)
+    return _reemplazar_contrasena(id_usuario, generar_hash_contrasena(nueva_contrasena), usuario_admin_id)
+
+
+@db_connection
+def _reemplazar_contrasena(cursor, id_usuario, credencial, usuario_admin_id):
+    marcar_cambios("usuarios")
+    contrasena_hash, salt, esquema = credencial
     cursor.execute(
-        "UPDATE usuarios SET contrasena_hash = ?, contrasena_salt = ?, debe_cambiar_contrasena = 0 WHERE id = ?",
-        (binascii.hexlify(nueva_contrasena_hash).decode('utf-8'), 
-         binascii.hexlify(nuevo_salt).decode('utf-8'), id_usuario)
+        "UPDATE usuarios SET contrasena_hash = ?, contrasena_salt = ?, contrasena_esquema = ?, debe_cambiar_contrasena = 0 WHERE id = ?",
+        (contrasena_hash, salt, esquema, id_usuario)
     )
     
     # Auditar solo si lo hace un administrador sobre otro usuario
-    if usuario_admin_id and usuario_admin_id != id_usuario:
+    if usuario_admin_id and str(usuario_admin_id) != str(id_usuario):
         cursor.execute("SELECT nombre_usuario FROM usuarios WHERE id = ?", (id_usuario,))
         nombre = cursor.fetchone()[0]
         registrar_auditoria(cursor, usuario_admin_id, "CONTRASENA_CAMBIADA", 
-                          f"Contraseña del usuario '{nombre}' fue modificada.")
+                          f"Contraseña del usuario '{nombre}' fue modificada.",
+                          entidad=("usuario", id_usuario))
     return True
 
 
 @db_connection
 def eliminar_usuario(cursor, id_usuario_a_eliminar, usuario_admin_id):
+    marcar_cambios("usuarios")
     cursor.execute("SELECT nombre_usuario FROM usuarios WHERE id = ?", (id_usuario_a_eliminar,))
     nombre_usuario = cursor.fetchone()
     if not nombre_usuario:
@@ -388,14 +1738,15 @@ def eliminar_usuario(cursor, id_usuario_a_eliminar, usuario_admin_id):
     
     cursor.execute("DELETE FROM usuarios WHERE id = ?", (id_usuario_a_eliminar,))
     registrar_auditoria(cursor, usuario_admin_id, "USUARIO_ELIMINADO", 
-                       f"Usuario '{nombre_usuario[0]}' (ID: {id_usuario_a_eliminar}) fue eliminado.")
+                       f"Usuario '{nombre_usuario[0]}' (ID: {id_usuario_a_eliminar}) fue eliminado.",
+                       entidad=("usuario", id_usuario_a_eliminar))
     return True
 
 
 # ============================================================================
 # FUNCIONES DE PRODUCTOS
 # ============================================================================
-@db_connection
+@db_read_connection
 def obtener_productos(cursor, filtro="", incluir_id=False, categoria_id=None, proveedor_id=None):
     params = []
     if incluir_id:
@@ -403,14 +1754,26 @@ def obtener_productos(cursor, filtro="", incluir_id=False, categoria_id=None, pr
     else:
         campos = "p.codigo, p.nombre, p.precio, p.stock"
 
-    query = f"SELECT {campos} FROM productos p LEFT JOIN proveedores pr ON p.proveedor_id = pr.id LEFT JOIN categorias c ON p.categoria_id = c.id WHERE p.activo = 1"
+    filtro = filtro.strip() if filtro else ""
+    consulta = consulta_fts(filtro) if filtro else ""
+    usar_fts = bool(consulta) and _fts_disponible(cursor, "productos_fts")
+
+    if usar_fts:
+        # El índice FTS resuelve el texto; el JOIN solo trae las filas halladas.
+        query = (
+            f"SELECT {campos} FROM productos_fts f JOIN productos p ON p.id = f.rowid "
+            "LEFT JOIN proveedores pr ON p.proveedor_id = pr.id LEFT JOIN categorias c ON p.categoria_id = c.id "
+            "WHERE productos_fts MATCH ? AND p.activo = 1"
+        )
+        params.append(consulta)
+    else:
+        query = f"SELECT {campos} FROM productos p LEFT JOIN proveedores pr ON p.proveedor_id = pr.id LEFT JOIN categorias c ON p.categoria_id = c.id WHERE p.activo = 1"
 
     if proveedor_id:
         query += " AND p.proveedor_id = ?"
         params.append(proveedor_id)
 
-    if filtro:
-        filtro = filtro.strip()
+    if filtro and not usar_fts:
         if filtro.isdigit():
             query += " AND (p.codigo LIKE ? OR LOWER(p.nombre) LIKE ?)"
             params.extend([f"{filtro}%", f"%{filtro.lower()}%"])
@@ -422,12 +1785,54 @@ def obtener_productos(cursor, filtro="", incluir_id=False, categoria_id=None, pr
         query += " AND p.categoria_id = ?"
         params.append(categoria_id)
 
-    query += " ORDER BY p.nombre ASC"
+    query += " ORDER BY f.rank, p.nombre ASC" if usar_fts else " ORDER BY p.nombre ASC"
     cursor.execute(query, tuple(params))
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
+def buscar_productos(cursor, texto, limite=50):
+    """
+    Búsqueda por relevancia sobre código, nombre y descripción.
+    Devuelve (codigo, nombre, precio, stock, puntaje), mejor coincidencia primero
+    (puntaje bm25: más negativo = más relevante).
+    """
+    consulta = consulta_fts(texto or "")
+    if not consulta:
+        return []
+    if not _fts_disponible(cursor, "productos_fts"):
+        return [fila + (0.0,) for fila in obtener_productos(filtro=texto)[:limite]]
+    cursor.execute(
+        "SELECT p.codigo, p.nombre, p.precio, p.stock, f.rank FROM productos_fts f "
+        "JOIN productos p ON p.id = f.rowid "
+        "WHERE productos_fts MATCH ? AND p.activo = 1 ORDER BY f.rank LIMIT ?",
+        (consulta, limite)
+    )
+    return cursor.fetchall()
+
+
+@db_read_connection
+def obtener_productos_por_codigos(cursor, codigos):
+    """
+    Devuelve (codigo, nombre, precio, stock) de los productos activos cuyos
+    códigos estén en `codigos`. Los códigos inexistentes o inactivos no
+    aparecen en el resultado.
+    """
+    codigos = list(dict.fromkeys(str(c) for c in codigos if c))
+    filas = []
+    # Por tandas, para no pasar el límite de parámetros de SQLite
+    for inicio in range(0, len(codigos), TAMANO_LOTE_IN):
+        lote = codigos[inicio:inicio + TAMANO_LOTE_IN]
+        marcadores = ", ".join("?" * len(lote))
+        cursor.execute(
+            f"SELECT codigo, nombre, precio, stock FROM productos WHERE activo = 1 AND codigo IN ({marcadores})",
+            lote
+        )
+        filas.extend(cursor.fetchall())
+    return filas
+
+
+@db_read_connection
 def obtener_producto_por_id(cursor, id_producto):
     cursor.execute(
         "SELECT id, codigo, nombre, descripcion, costo, precio, stock, proveedor_id, categoria_id FROM productos WHERE id = ?",
@@ -439,6 +1844,7 @@ def obtener_producto_por_id(cursor, id_producto):
 @db_connection
 def agregar_producto(cursor, usuario_id, codigo, nombre, descripcion, costo, precio, stock, proveedor_id, categoria_id):
     """✅ MEJORADO: Valida que costo > 0 y audita."""
+    marcar_cambios("productos")
     if costo <= 0:
         return "Error: El costo debe ser mayor a 0 para calcular ganancias correctamente."
     
@@ -452,7 +1858,8 @@ def agregar_producto(cursor, usuario_id, codigo, nombre, descripcion, costo, pre
             (codigo, nombre, descripcion, costo, precio, stock, proveedor_id, categoria_id)
         )
         registrar_auditoria(cursor, usuario_id, "PROD_CREADO", 
-                          f"Producto '{nombre}' ({codigo}) con costo ${costo:.2f} agregado.")
+                          f"Producto '{nombre}' ({codigo}) con costo ${costo:.2f} agregado.",
+                          entidad=("producto", cursor.lastrowid))
         return True
     except sqlite3.IntegrityError:
         return "Error: El código del producto ya existe."
@@ -461,6 +1868,8 @@ def agregar_producto(cursor, usuario_id, codigo, nombre, descripcion, costo, pre
 @db_connection
 def actualizar_producto(cursor, usuario_id, id_producto, codigo, nombre, descripcion, costo, precio, stock, proveedor_id, categoria_id):
     """✅ MEJORADO: Valida costo y audita cambios."""
+    # El nombre aparece en reportes de períodos cerrados: también "historico"
+    marcar_cambios("productos", "historico")
     if costo <= 0:
         return "Error: El costo debe ser mayor a 0."
     
@@ -487,7 +1896,7 @@ def actualizar_producto(cursor, usuario_id, id_producto, codigo, nombre, descrip
             cambios.append(f"costo: ${costo_antiguo:.2f} → ${costo:.2f}")
         
         desc = f"Producto ID {id_producto}. Cambios: {', '.join(cambios)}" if cambios else f"Producto ID {id_producto} actualizado."
-        registrar_auditoria(cursor, usuario_id, "PROD_ACTUALIZADO", desc)
+        registrar_auditoria(cursor, usuario_id, "PROD_ACTUALIZADO", desc, entidad=("producto", id_producto))
         return True
     except sqlite3.IntegrityError:
         return "Error: El código del producto ya existe."
@@ -495,6 +1904,7 @@ def actualizar_producto(cursor, usuario_id, id_producto, codigo, nombre, descrip
 
 @db_connection
 def desactivar_producto(cursor, usuario_id, id_producto):
+    marcar_cambios("productos")
     cursor.execute("SELECT nombre FROM productos WHERE id = ?", (id_producto,))
     nombre_producto = cursor.fetchone()
     if not nombre_producto:
@@ -502,74 +1912,232 @@ def desactivar_producto(cursor, usuario_id, id_producto):
 
     cursor.execute("UPDATE productos SET activo = 0 WHERE id = ?", (id_producto,))
     registrar_auditoria(cursor, usuario_id, "PROD_DESACTIVADO", 
-                       f"Producto ID {id_producto} ('{nombre_producto[0]}') desactivado.")
+                       f"Producto ID {id_producto} ('{nombre_producto[0]}') desactivado.",
+                       entidad=("producto", id_producto))
     return True
 
 
 # ============================================================================
-# FUNCIONES DE VENTAS
+# FUNCIONES DE RESERVAS DE STOCK
 # ============================================================================
+# Con varias cajas sobre la misma base, el stock disponible es el stock menos
+# lo reservado (no vencido) en los carritos de las demás cajas. Cada reserva
+# dura DURACION_RESERVA_SEGUNDOS desde su última renovación.
+DURACION_RESERVA_SEGUNDOS = 15 * 60
+
+
+def _ahora_texto(segundos=0):
+    return (datetime.now() + timedelta(seconds=segundos)).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _reservado_por_otros(cursor, producto_ids, sesion):
+    """producto_id -> cantidad reservada (vigente) por otras sesiones."""
+    reservado = {}
+    for inicio in range(0, len(producto_ids), TAMANO_LOTE_IN):
+        lote = producto_ids[inicio:inicio + TAMANO_LOTE_IN]
+        marcadores = ", ".join("?" * len(lote))
+        cursor.execute(
+            f"SELECT producto_id, SUM(cantidad) FROM reservas_stock "
+            f"WHERE producto_id IN ({marcadores}) AND vence > ? AND sesion <> ? GROUP BY producto_id",
+            (*lote, _ahora_texto(), sesion or "")
+        )
+        reservado.update(cursor.fetchall())
+    return reservado
+
+
 @db_connection
-def registrar_venta(cursor, usuario_id, total, carrito, tipo_pago, deudor_id=None):
-    try:
-        fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        saldo_pendiente = total if tipo_pago == "Credito" else 0.0
-        
+def reservar_stock(cursor, sesion, codigo, cantidad):
+    """
+    Fija en `cantidad` la reserva de la sesión para ese producto (0 la borra).
+    Se verifica y se escribe en la misma transacción, así dos cajas no pueden
+    reservar la misma unidad. Devuelve True o un texto "Error: ...".
+    """
+    marcar_cambios("reservas")
+    cursor.execute("DELETE FROM reservas_stock WHERE vence <= ?", (_ahora_texto(),))
+
+    cursor.execute("SELECT id, nombre, stock FROM productos WHERE codigo = ?", (str(codigo),))
+    producto = cursor.fetchone()
+    if not producto:
+        return "Error: Producto no encontrado."
+    producto_id, nombre, stock = producto
+
+    if cantidad <= 0:
         cursor.execute(
-            "INSERT INTO ventas (usuario_id, fecha_hora, total, tipo_pago, deudor_id, saldo_pendiente) VALUES (?, ?, ?, ?, ?, ?)",
-            (usuario_id, fecha_hora, total, tipo_pago, deudor_id, saldo_pendiente)
+            "DELETE FROM reservas_stock WHERE sesion = ? AND producto_id = ?", (sesion, producto_id)
         )
-        venta_id = cursor.lastrowid
+        return True
 
-        for codigo, item in carrito.items():
-            cursor.execute("SELECT id FROM productos WHERE codigo = ?", (codigo,))
-            producto_id = cursor.fetchone()[0]
-            cursor.execute(
-                "INSERT INTO detalles_venta (venta_id, producto_id, cantidad, precio_unitario) VALUES (?, ?, ?, ?)",
-                (venta_id, producto_id, item["cantidad"], item["precio"])
-            )
-            cursor.execute("UPDATE productos SET stock = stock - ? WHERE id = ?", (item["cantidad"], producto_id))
+    disponible = stock - _reservado_por_otros(cursor, [producto_id], sesion).get(producto_id, 0)
+    if cantidad > disponible:
+        return f"Error: Stock insuficiente para '{nombre}' (disponible {max(disponible, 0)})."
+
+    cursor.execute(
+        "INSERT INTO reservas_stock (sesion, producto_id, cantidad, vence) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(sesion, producto_id) DO UPDATE SET cantidad = excluded.cantidad, vence = excluded.vence",
+        (sesion, producto_id, cantidad, _ahora_texto(DURACION_RESERVA_SEGUNDOS))
+    )
+    return True
 
-        if tipo_pago == "Credito" and deudor_id is not None:
-            cursor.execute("UPDATE deudores SET saldo = saldo + ? WHERE id = ?", (total, deudor_id))
 
-        tipo = "Crédito" if tipo_pago == "Credito" else "Contado"
-        registrar_auditoria(cursor, usuario_id, "VENTA_REGISTRADA", 
-                          f"Venta ID {venta_id}. Total: ${total:.2f}. Tipo: {tipo}.")
-        return venta_id
-    except sqlite3.Error as e:
-        raise e
+@db_connection
+def renovar_reservas(cursor, sesion):
+    """Extiende el vencimiento de todas las reservas de la sesión (carrito abierto)."""
+    cursor.execute(
+        "UPDATE reservas_stock SET vence = ? WHERE sesion = ?",
+        (_ahora_texto(DURACION_RESERVA_SEGUNDOS), sesion)
+    )
+    return cursor.rowcount
+
+
+@db_connection
+def liberar_reservas(cursor, sesion):
+    """Borra las reservas de la sesión (venta cancelada o caja cerrada)."""
+    marcar_cambios("reservas")
+    cursor.execute("DELETE FROM reservas_stock WHERE sesion = ?", (sesion,))
+    return True
+
+
+@db_read_connection
+def obtener_reservas_ajenas(cursor, sesion):
+    """codigo -> cantidad reservada por otras cajas (solo reservas vigentes)."""
+    cursor.execute(
+        "SELECT p.codigo, SUM(r.cantidad) FROM reservas_stock r JOIN productos p ON p.id = r.producto_id "
+        "WHERE r.vence > ? AND r.sesion <> ? GROUP BY p.codigo",
+        (_ahora_texto(), sesion or "")
+    )
+    return dict(cursor.fetchall())
 
 
+# ============================================================================
+# FUNCIONES DE VENTAS
+# ============================================================================
 @db_connection
+def registrar_venta(cursor, usuario_id, total, carrito, tipo_pago, deudor_id=None, sesion_reserva=None):
+    """
+    Registra la venta del carrito en una sola transacción (BEGIN IMMEDIATE):
+    resuelve todos los códigos en una consulta, verifica el stock de todas las
+    líneas y recién entonces inserta el detalle y descuenta el stock en lote.
+
+    El stock disponible descuenta lo reservado por otras cajas; las reservas
+    de `sesion_reserva` (el carrito que se vende) se convierten en la venta.
+
+    Devuelve el id de la venta, o un texto "Error: ..." con las líneas que no
+    tienen stock suficiente (en ese caso no se modifica nada).
+    """
+    marcar_cambios("productos", "ventas", "deudores", "reservas")
+    lineas = [(str(codigo), item) for codigo, item in carrito.items()]
+    codigos = [codigo for codigo, _ in lineas]
+
+    # 1. Todos los productos del carrito, por tandas de IN (...)
+    productos = {}
+    for inicio in range(0, len(codigos), TAMANO_LOTE_IN):
+        lote = codigos[inicio:inicio + TAMANO_LOTE_IN]
+        marcadores = ", ".join("?" * len(lote))
+        cursor.execute(
+            f"SELECT codigo, id, nombre, stock, costo FROM productos WHERE codigo IN ({marcadores})",
+            lote
+        )
+        for codigo, producto_id, nombre, stock, costo in cursor.fetchall():
+            productos[codigo] = (producto_id, nombre, stock, costo)
+
+    inexistentes = [codigo for codigo in codigos if codigo not in productos]
+    if inexistentes:
+        return f"Error: Productos inexistentes: {', '.join(inexistentes)}."
+
+    # 2. Stock de todas las líneas antes de escribir nada
+    reservado = _reservado_por_otros(cursor, [p[0] for p in productos.values()], sesion_reserva)
+    disponible = {
+        codigo: stock - reservado.get(producto_id, 0)
+        for codigo, (producto_id, _, stock, _) in productos.items()
+    }
+    faltantes = [
+        f"{productos[codigo][1]} (pedido {item['cantidad']}, disponible {max(disponible[codigo], 0)})"
+        for codigo, item in lineas
+        if item["cantidad"] > disponible[codigo]
+    ]
+    if faltantes:
+        return "Error: Stock insuficiente para: " + "; ".join(faltantes) + "."
+
+    # 3. Venta, detalle y stock
+    fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    saldo_pendiente = total if tipo_pago == "Credito" else 0.0
+
+    cursor.execute(
+        "INSERT INTO ventas (usuario_id, fecha_hora, total, tipo_pago, deudor_id, saldo_pendiente) VALUES (?, ?, ?, ?, ?, ?)",
+        (usuario_id, fecha_hora, total, tipo_pago, deudor_id, saldo_pendiente)
+    )
+    venta_id = cursor.lastrowid
+
+    # El costo queda fijo en la línea: editar el producto después no cambia
+    # la ganancia de ventas pasadas.
+    cursor.executemany(
+        "INSERT INTO detalles_venta (venta_id, producto_id, cantidad, precio_unitario, costo_unitario) VALUES (?, ?, ?, ?, ?)",
+        [(venta_id, productos[codigo][0], item["cantidad"], item["precio"], productos[codigo][3])
+         for codigo, item in lineas]
+    )
+    # La condición stock >= ? es la garantía final: si alguna fila no se
+    # actualiza, la venta completa se deshace.
+    cursor.executemany(
+        "UPDATE productos SET stock = stock - ? WHERE id = ? AND stock >= ?",
+        [(item["cantidad"], productos[codigo][0], item["cantidad"]) for codigo, item in lineas]
+    )
+    if cursor.rowcount != len(lineas):
+        raise sqlite3.IntegrityError("El stock cambió durante la venta.")
+
+    if sesion_reserva:
+        cursor.execute("DELETE FROM reservas_stock WHERE sesion = ?", (sesion_reserva,))
+
+    if tipo_pago == "Credito" and deudor_id is not None:
+        cursor.execute("UPDATE deudores SET saldo = saldo + ? WHERE id = ?", (total, deudor_id))
+
+    # 4. Resúmenes diarios para reportes
+    fecha = fecha_hora[:10]
+    cursor.execute(_UPSERT_RESUMEN_VENTA, (fecha, usuario_id, tipo_pago, total))
+    cursor.executemany(_UPSERT_RESUMEN_PRODUCTO, [
+        (fecha, productos[codigo][0], item["cantidad"],
+         item["cantidad"] * item["precio"], item["cantidad"] * productos[codigo][3])
+        for codigo, item in lineas
+    ])
+
+    tipo = "Crédito" if tipo_pago == "Credito" else "Contado"
+    registrar_auditoria(cursor, usuario_id, "VENTA_REGISTRADA",
+                        "Venta ID {venta_id}. Total: ${total:.2f}. Tipo: {tipo}.",
+                        entidad=("venta", venta_id), monto=total,
+                        venta_id=venta_id, total=total, tipo=tipo, deudor_id=deudor_id)
+    return venta_id
+
+
+@db_read_connection
 def obtener_ventas_del_dia(cursor):
     fecha_hoy = datetime.now().strftime("%Y-%m-%d")
     cursor.execute(
         "SELECT v.id, v.fecha_hora, u.nombre_usuario, v.total FROM ventas v "
-        "JOIN usuarios u ON v.usuario_id = u.id WHERE DATE(v.fecha_hora) = ? ORDER BY v.fecha_hora DESC",
-        (fecha_hoy,)
+        "JOIN usuarios u ON v.usuario_id = u.id "
+        "WHERE v.fecha_hora >= ? AND v.fecha_hora < date(?, '+1 day') ORDER BY v.fecha_hora DESC",
+        (fecha_hoy, fecha_hoy)
     )
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_resumen_ventas_dia(cursor, usuario_id):
     fecha_hoy = datetime.now().strftime("%Y-%m-%d")
     cursor.execute(
-        "SELECT SUM(total) FROM ventas WHERE usuario_id = ? AND DATE(fecha_hora) = ? AND tipo_pago = 'Contado'",
-        (usuario_id, fecha_hoy)
+        "SELECT SUM(total) FROM ventas WHERE usuario_id = ? "
+        "AND fecha_hora >= ? AND fecha_hora < date(?, '+1 day') AND tipo_pago = 'Contado'",
+        (usuario_id, fecha_hoy, fecha_hoy)
     )
     resultado = cursor.fetchone()[0]
     return resultado if resultado is not None else 0.0
 
 
-@db_connection
+@db_read_connection
 def obtener_info_venta(cursor, venta_id):
     cursor.execute("SELECT fecha_hora, total FROM ventas WHERE id = ?", (venta_id,))
     return cursor.fetchone()
 
 
-@db_connection
+@db_read_connection
 def obtener_detalle_de_venta(cursor, venta_id):
     cursor.execute(
         "SELECT p.nombre, dv.cantidad, (dv.cantidad * dv.precio_unitario) as subtotal FROM detalles_venta dv "
@@ -579,22 +2147,24 @@ def obtener_detalle_de_venta(cursor, venta_id):
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_ventas_por_rango(cursor, fecha_inicio, fecha_fin):
     cursor.execute(
         "SELECT v.id, v.fecha_hora, u.nombre_usuario, v.total FROM ventas v "
-        "JOIN usuarios u ON v.usuario_id = u.id WHERE DATE(v.fecha_hora) BETWEEN ? AND ? ORDER BY v.fecha_hora DESC",
+        "JOIN usuarios u ON v.usuario_id = u.id "
+        "WHERE v.fecha_hora >= ? AND v.fecha_hora < date(?, '+1 day') ORDER BY v.fecha_hora DESC",
         (fecha_inicio, fecha_fin)
     )
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_productos_mas_vendidos(cursor, fecha_inicio, fecha_fin):
     cursor.execute(
-        "SELECT p.nombre, SUM(dv.cantidad) as total_vendido FROM detalles_venta dv "
-        "JOIN productos p ON dv.producto_id = p.id JOIN ventas v ON dv.venta_id = v.id "
-        "WHERE DATE(v.fecha_hora) BETWEEN ? AND ? GROUP BY p.nombre ORDER BY total_vendido DESC",
+        "SELECT p.nombre, SUM(r.cantidad) as total_vendido FROM resumen_productos_diario r "
+        "JOIN productos p ON r.producto_id = p.id "
+        "WHERE r.fecha >= ? AND r.fecha < date(?, '+1 day') AND r.cantidad > 0 "
+        "GROUP BY p.nombre ORDER BY total_vendido DESC",
         (fecha_inicio, fecha_fin)
     )
     return cursor.fetchall()
@@ -606,6 +2176,7 @@ def obtener_productos_mas_vendidos(cursor, fecha_inicio, fecha_fin):
 @db_connection
 def registrar_compra(cursor, usuario_id, proveedor_id, total_costo, carrito_compra):
     """✅ MEJORADO: Audita las compras."""
+    marcar_cambios("productos", "compras")
     try:
         fecha = datetime.now().strftime("%Y-%m-%d")
         cursor.execute(
@@ -615,36 +2186,41 @@ def registrar_compra(cursor, usuario_id, proveedor_id, total_costo, carrito_comp
         compra_id = cursor.lastrowid
         
         for codigo, item in carrito_compra.items():
-            cursor.execute("SELECT id, stock FROM productos WHERE codigo = ?", (codigo,))
-            producto_id, stock_actual = cursor.fetchone()
+            cursor.execute("SELECT id FROM productos WHERE codigo = ?", (codigo,))
+            producto_id = cursor.fetchone()[0]
             cursor.execute(
                 "INSERT INTO detalles_compra (compra_id, producto_id, cantidad, costo_unitario) VALUES (?, ?, ?, ?)",
                 (compra_id, producto_id, item["cantidad"], item["costo"])
             )
-            nuevo_stock = stock_actual + item["cantidad"]
-            cursor.execute("UPDATE productos SET stock = ? WHERE id = ?", (nuevo_stock, producto_id))
+            # Incremento en la misma sentencia: no se pisa una venta concurrente
+            cursor.execute("UPDATE productos SET stock = stock + ? WHERE id = ?", (item["cantidad"], producto_id))
         
+        cursor.execute(_UPSERT_RESUMEN_COMPRA, (fecha, proveedor_id, total_costo))
+
         cursor.execute("SELECT nombre FROM proveedores WHERE id = ?", (proveedor_id,))
         nombre_prov = cursor.fetchone()[0]
-        registrar_auditoria(cursor, usuario_id, "COMPRA_REGISTRADA", 
-                          f"Compra ID {compra_id} a '{nombre_prov}'. Total: ${total_costo:.2f}.")
+        registrar_auditoria(cursor, usuario_id, "COMPRA_REGISTRADA",
+                            "Compra ID {compra_id} a '{proveedor}'. Total: ${total:.2f}.",
+                            entidad=("compra", compra_id), monto=total_costo,
+                            compra_id=compra_id, proveedor=nombre_prov, proveedor_id=proveedor_id,
+                            total=total_costo)
         return True
     except sqlite3.Error as e:
         raise e
 
 
-@db_connection
+@db_read_connection
 def obtener_compras_por_rango(cursor, fecha_inicio, fecha_fin):
     query = """
         SELECT c.id, c.fecha, IFNULL(p.nombre, 'PROVEEDOR ELIMINADO'), c.total_costo
         FROM compras c LEFT JOIN proveedores p ON c.proveedor_id = p.id
-        WHERE DATE(c.fecha) BETWEEN ? AND ? ORDER BY c.fecha DESC
+        WHERE c.fecha >= ? AND c.fecha < date(?, '+1 day') ORDER BY c.fecha DESC
     """
     cursor.execute(query, (fecha_inicio, fecha_fin))
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_detalle_de_compra(cursor, compra_id):
     query = """
         SELECT p.nombre, dc.cantidad, dc.costo_unitario, (dc.cantidad * dc.costo_unitario) as subtotal
@@ -657,7 +2233,7 @@ def obtener_detalle_de_compra(cursor, compra_id):
 # ============================================================================
 # FUNCIONES DE PROVEEDORES
 # ============================================================================
-@db_connection
+@db_read_connection
 def obtener_proveedores(cursor, incluir_inactivos=False):
     query = "SELECT id, nombre, telefono, email FROM proveedores"
     if not incluir_inactivos:
@@ -667,7 +2243,7 @@ def obtener_proveedores(cursor, incluir_inactivos=False):
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_proveedor_por_id(cursor, id_proveedor):
     cursor.execute("SELECT id, nombre, telefono, email, direccion, activo FROM proveedores WHERE id = ?", (id_proveedor,))
     return cursor.fetchone()
@@ -676,13 +2252,14 @@ def obtener_proveedor_por_id(cursor, id_proveedor):
 @db_connection
 def agregar_proveedor(cursor, usuario_id, nombre, telefono, email, direccion):
     """✅ MEJORADO: Audita la creación."""
+    marcar_cambios("proveedores")
     try:
         cursor.execute(
             "INSERT INTO proveedores (nombre, telefono, email, direccion, activo) VALUES (?, ?, ?, ?, 1)",
             (nombre, telefono, email, direccion)
         )
         registrar_auditoria(cursor, usuario_id, "PROVEEDOR_CREADO", 
-                          f"Proveedor '{nombre}' agregado.")
+                          f"Proveedor '{nombre}' agregado.", entidad=("proveedor", cursor.lastrowid))
         return True
     except sqlite3.IntegrityError:
         return "Error: Ya existe un proveedor con ese nombre."
@@ -691,6 +2268,7 @@ def agregar_proveedor(cursor, usuario_id, nombre, telefono, email, direccion):
 @db_connection
 def actualizar_proveedor(cursor, usuario_id, id_proveedor, nombre, telefono, email, direccion):
     """✅ MEJORADO: Audita la actualización."""
+    marcar_cambios("proveedores", "productos")
     cursor.execute("SELECT nombre FROM proveedores WHERE id = ?", (id_proveedor,))
     nombre_antiguo = cursor.fetchone()
     if not nombre_antiguo:
@@ -703,7 +2281,8 @@ def actualizar_proveedor(cursor, usuario_id, id_proveedor, nombre, telefono, ema
         )
         if nombre != nombre_antiguo[0]:
             registrar_auditoria(cursor, usuario_id, "PROVEEDOR_ACTUALIZADO", 
-                              f"Proveedor '{nombre_antiguo[0]}' → '{nombre}'.")
+                              f"Proveedor '{nombre_antiguo[0]}' → '{nombre}'.",
+                              entidad=("proveedor", id_proveedor))
         return True
     except sqlite3.IntegrityError:
         return "Error: Ya existe otro proveedor con el mismo nombre."
@@ -712,6 +2291,7 @@ def actualizar_proveedor(cursor, usuario_id, id_proveedor, nombre, telefono, ema
 @db_connection
 def desactivar_proveedor(cursor, usuario_id, id_proveedor):
     """✅ MEJORADO: Eliminación lógica con auditoría."""
+    marcar_cambios("proveedores", "productos")
     cursor.execute("SELECT nombre FROM proveedores WHERE id = ?", (id_proveedor,))
     nombre = cursor.fetchone()
     if not nombre:
@@ -719,20 +2299,20 @@ def desactivar_proveedor(cursor, usuario_id, id_proveedor):
     
     cursor.execute("UPDATE proveedores SET activo = 0 WHERE id = ?", (id_proveedor,))
     registrar_auditoria(cursor, usuario_id, "PROVEEDOR_DESACTIVADO", 
-                       f"Proveedor '{nombre[0]}' desactivado.")
+                       f"Proveedor '{nombre[0]}' desactivado.", entidad=("proveedor", id_proveedor))
     return True
 
 
 # ============================================================================
 # FUNCIONES DE DEUDORES
 # ============================================================================
-@db_connection
+@db_read_connection
 def obtener_deudores(cursor):
     cursor.execute("SELECT id, nombre, telefono, saldo FROM deudores ORDER BY nombre ASC")
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_deudor_por_id(cursor, deudor_id):
     cursor.execute(
         "SELECT id, nombre, telefono, direccion, notas, saldo FROM deudores WHERE id = ?",
@@ -744,13 +2324,14 @@ def obtener_deudor_por_id(cursor, deudor_id):
 @db_connection
 def agregar_deudor(cursor, usuario_id, nombre, telefono, direccion, notas):
     """✅ MEJORADO: Audita la creación."""
+    marcar_cambios("deudores")
     try:
         cursor.execute(
             "INSERT INTO deudores (nombre, telefono, direccion, notas) VALUES (?, ?, ?, ?)",
             (nombre, telefono, direccion, notas)
         )
         registrar_auditoria(cursor, usuario_id, "DEUDOR_CREADO", 
-                          f"Deudor '{nombre}' agregado.")
+                          f"Deudor '{nombre}' agregado.", entidad=("deudor", cursor.lastrowid))
         return True
     except sqlite3.IntegrityError:
         return "Error: Ya existe un deudor con ese nombre."
@@ -759,6 +2340,7 @@ def agregar_deudor(cursor, usuario_id, nombre, telefono, direccion, notas):
 @db_connection
 def actualizar_deudor(cursor, usuario_id, deudor_id, nombre, telefono, direccion, notas):
     """✅ MEJORADO: Audita la actualización."""
+    marcar_cambios("deudores")
     cursor.execute("SELECT nombre FROM deudores WHERE id = ?", (deudor_id,))
     nombre_antiguo = cursor.fetchone()
     if not nombre_antiguo:
@@ -771,7 +2353,8 @@ def actualizar_deudor(cursor, usuario_id, deudor_id, nombre, telefono, direccion
         )
         if nombre != nombre_antiguo[0]:
             registrar_auditoria(cursor, usuario_id, "DEUDOR_ACTUALIZADO", 
-                              f"Deudor '{nombre_antiguo[0]}' → '{nombre}'.")
+                              f"Deudor '{nombre_antiguo[0]}' → '{nombre}'.",
+                              entidad=("deudor", deudor_id))
         return True
     except sqlite3.IntegrityError:
         return "Error: Ya existe un deudor con ese nombre."
@@ -780,6 +2363,7 @@ def actualizar_deudor(cursor, usuario_id, deudor_id, nombre, telefono, direccion
 @db_connection
 def eliminar_deudor(cursor, usuario_id, deudor_id):
     """✅ MEJORADO: Audita la eliminación."""
+    marcar_cambios("deudores")
     cursor.execute("SELECT nombre, saldo FROM deudores WHERE id = ?", (deudor_id,))
     resultado = cursor.fetchone()
     if not resultado:
@@ -791,13 +2375,14 @@ def eliminar_deudor(cursor, usuario_id, deudor_id):
     
     cursor.execute("DELETE FROM deudores WHERE id = ?", (deudor_id,))
     registrar_auditoria(cursor, usuario_id, "DEUDOR_ELIMINADO", 
-                       f"Deudor '{nombre}' eliminado.")
+                       f"Deudor '{nombre}' eliminado.", entidad=("deudor", deudor_id))
     return True
 
 
 @db_connection
 def registrar_pago_deudor(cursor, usuario_id, deudor_id, venta_id, monto):
     """✅ MEJORADO: Audita los pagos."""
+    marcar_cambios("deudores", "ventas")
     try:
         cursor.execute("SELECT saldo_pendiente FROM ventas WHERE id = ?", (venta_id,))
         resultado = cursor.fetchone()
@@ -824,14 +2409,16 @@ def registrar_pago_deudor(cursor, usuario_id, deudor_id, venta_id, monto):
         
         cursor.execute("SELECT nombre FROM deudores WHERE id = ?", (deudor_id,))
         nombre_deudor = cursor.fetchone()[0]
-        registrar_auditoria(cursor, usuario_id, "PAGO_REGISTRADO", 
-                          f"Pago de ${monto:.2f} de '{nombre_deudor}' a venta ID {venta_id}.")
+        registrar_auditoria(cursor, usuario_id, "PAGO_REGISTRADO",
+                            "Pago de ${monto_pago:.2f} de '{deudor}' a venta ID {venta_id}.",
+                            entidad=("venta", venta_id), monto=monto,
+                            monto_pago=monto, deudor=nombre_deudor, deudor_id=deudor_id, venta_id=venta_id)
         return True
     except sqlite3.Error as e:
         raise e
 
 
-@db_connection
+@db_read_connection
 def obtener_ventas_deudor(cursor, deudor_id):
     cursor.execute(
         "SELECT id, fecha_hora, total FROM ventas WHERE deudor_id = ? AND tipo_pago = 'Credito' ORDER BY fecha_hora DESC",
@@ -840,7 +2427,7 @@ def obtener_ventas_deudor(cursor, deudor_id):
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_deudas_pendientes_deudor(cursor, deudor_id):
     cursor.execute(
         "SELECT id, fecha_hora, total, saldo_pendiente FROM ventas "
@@ -850,7 +2437,7 @@ def obtener_deudas_pendientes_deudor(cursor, deudor_id):
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_pagos_de_una_venta(cursor, venta_id):
     cursor.execute(
         "SELECT fecha, monto FROM pagos_deudores WHERE venta_id = ? ORDER BY fecha DESC",
@@ -859,7 +2446,7 @@ def obtener_pagos_de_una_venta(cursor, venta_id):
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_deudas_pagadas_deudor(cursor, deudor_id):
     cursor.execute(
         "SELECT id, fecha_hora, total FROM ventas "
@@ -872,7 +2459,7 @@ def obtener_deudas_pagadas_deudor(cursor, deudor_id):
 # ============================================================================
 # FUNCIONES DE CATEGORÍAS
 # ============================================================================
-@db_connection
+@db_read_connection
 def obtener_categorias(cursor):
     cursor.execute("SELECT id, nombre FROM categorias ORDER BY nombre ASC")
     return cursor.fetchall()
@@ -881,10 +2468,11 @@ def obtener_categorias(cursor):
 @db_connection
 def agregar_categoria(cursor, usuario_id, nombre):
     """✅ MEJORADO: Audita la creación."""
+    marcar_cambios("categorias")
     try:
         cursor.execute("INSERT INTO categorias (nombre) VALUES (?)", (nombre,))
         registrar_auditoria(cursor, usuario_id, "CATEGORIA_CREADA", 
-                          f"Categoría '{nombre}' creada.")
+                          f"Categoría '{nombre}' creada.", entidad=("categoria", cursor.lastrowid))
         return True
     except sqlite3.IntegrityError:
         return "Error: Esa categoría ya existe."
@@ -893,6 +2481,7 @@ def agregar_categoria(cursor, usuario_id, nombre):
 @db_connection
 def eliminar_categoria(cursor, usuario_id, id_categoria):
     """✅ MEJORADO: Audita la eliminación."""
+    marcar_cambios("categorias", "productos")
     cursor.execute("SELECT nombre FROM categorias WHERE id = ?", (id_categoria,))
     nombre = cursor.fetchone()
     if not nombre:
@@ -901,7 +2490,7 @@ def eliminar_categoria(cursor, usuario_id, id_categoria):
     try:
         cursor.execute("DELETE FROM categorias WHERE id = ?", (id_categoria,))
         registrar_auditoria(cursor, usuario_id, "CATEGORIA_ELIMINADA", 
-                          f"Categoría '{nombre[0]}' eliminada.")
+                          f"Categoría '{nombre[0]}' eliminada.", entidad=("categoria", id_categoria))
         return True
     except sqlite3.IntegrityError:
         return "Error: No se puede eliminar la categoría porque tiene productos asignados."
@@ -910,16 +2499,13 @@ def eliminar_categoria(cursor, usuario_id, id_categoria):
 # ============================================================================
 # FUNCIONES DE REPORTES
 # ============================================================================
-@db_connection
+@db_read_connection
 def obtener_reporte_ganancias(cursor, fecha_inicio, fecha_fin):
+    # Lee el resumen diario: unas filas por día en lugar de todo el detalle
     query = """
-        SELECT
-            SUM(dv.cantidad * dv.precio_unitario) as total_ventas,
-            SUM(dv.cantidad * p.costo) as total_costo
-        FROM detalles_venta dv
-        JOIN productos p ON dv.producto_id = p.id
-        JOIN ventas v ON dv.venta_id = v.id
-        WHERE DATE(v.fecha_hora) BETWEEN ? AND ?
+        SELECT SUM(r.ingresos) as total_ventas, SUM(r.costo) as total_costo
+        FROM resumen_productos_diario r
+        WHERE r.fecha >= ? AND r.fecha < date(?, '+1 day')
     """
     cursor.execute(query, (fecha_inicio, fecha_fin))
     resultado = cursor.fetchone()
@@ -933,19 +2519,18 @@ def obtener_reporte_ganancias(cursor, fecha_inicio, fecha_fin):
     }
 
 
-@db_connection
+@db_read_connection
 def obtener_ganancias_por_producto(cursor, fecha_inicio, fecha_fin):
     query = """
         SELECT
             p.nombre,
-            SUM(dv.cantidad) AS cantidad_total,
-            SUM(dv.cantidad * dv.precio_unitario) AS ingresos_totales,
-            SUM(dv.cantidad * p.costo) AS costo_total,
-            (SUM(dv.cantidad * dv.precio_unitario) - SUM(dv.cantidad * p.costo)) AS ganancia_neta
-        FROM detalles_venta dv
-        JOIN productos p ON dv.producto_id = p.id
-        JOIN ventas v ON dv.venta_id = v.id
-        WHERE DATE(v.fecha_hora) BETWEEN ? AND ?
+            SUM(r.cantidad) AS cantidad_total,
+            SUM(r.ingresos) AS ingresos_totales,
+            SUM(r.costo) AS costo_total,
+            (SUM(r.ingresos) - SUM(r.costo)) AS ganancia_neta
+        FROM resumen_productos_diario r
+        JOIN productos p ON r.producto_id = p.id
+        WHERE r.fecha >= ? AND r.fecha < date(?, '+1 day') AND r.cantidad > 0
         GROUP BY p.id, p.nombre
         ORDER BY ganancia_neta DESC
     """
@@ -953,29 +2538,180 @@ def obtener_ganancias_por_producto(cursor, fecha_inicio, fecha_fin):
     return cursor.fetchall()
 
 
+# ============================================================================
+# FUNCIONES DE EXPORTACIÓN
+# ============================================================================
+# nombre -> (encabezados, consulta con parámetros fecha_inicio y fecha_fin)
+_CONSULTAS_EXPORTACION = {
+    "ventas": (
+        ("ID Venta", "Fecha y Hora", "Usuario", "Tipo de Pago", "Total", "Saldo Pendiente"),
+        "SELECT v.id, v.fecha_hora, u.nombre_usuario, v.tipo_pago, v.total, v.saldo_pendiente "
+        "FROM ventas v JOIN usuarios u ON v.usuario_id = u.id "
+        "WHERE v.fecha_hora >= ? AND v.fecha_hora < date(?, '+1 day') ORDER BY v.fecha_hora, v.id",
+    ),
+    "detalle_ventas": (
+        ("ID Venta", "Fecha y Hora", "Código", "Producto", "Cantidad", "Precio Unitario", "Costo Unitario", "Subtotal"),
+        "SELECT v.id, v.fecha_hora, p.codigo, p.nombre, dv.cantidad, dv.precio_unitario, dv.costo_unitario, "
+        "dv.cantidad * dv.precio_unitario "
+        "FROM ventas v JOIN detalles_venta dv ON dv.venta_id = v.id JOIN productos p ON dv.producto_id = p.id "
+        "WHERE v.fecha_hora >= ? AND v.fecha_hora < date(?, '+1 day') ORDER BY v.fecha_hora, v.id",
+    ),
+    "compras": (
+        ("ID Compra", "Fecha", "Proveedor", "Total"),
+        "SELECT c.id, c.fecha, IFNULL(p.nombre, 'PROVEEDOR ELIMINADO'), c.total_costo "
+        "FROM compras c LEFT JOIN proveedores p ON c.proveedor_id = p.id "
+        "WHERE c.fecha >= ? AND c.fecha < date(?, '+1 day') ORDER BY c.fecha, c.id",
+    ),
+    "top_productos": (
+        ("Producto", "Unidades Vendidas"),
+        "SELECT p.nombre, SUM(r.cantidad) AS total_vendido FROM resumen_productos_diario r "
+        "JOIN productos p ON r.producto_id = p.id "
+        "WHERE r.fecha >= ? AND r.fecha < date(?, '+1 day') AND r.cantidad > 0 "
+        "GROUP BY p.nombre ORDER BY total_vendido DESC",
+    ),
+    "ganancias": (
+        ("Producto", "Cantidad Vendida", "Ingresos", "Costo", "Ganancia Neta"),
+        "SELECT p.nombre, SUM(r.cantidad), SUM(r.ingresos), SUM(r.costo), SUM(r.ingresos) - SUM(r.costo) "
+        "FROM resumen_productos_diario r JOIN productos p ON r.producto_id = p.id "
+        "WHERE r.fecha >= ? AND r.fecha < date(?, '+1 day') AND r.cantidad > 0 "
+        "GROUP BY p.id, p.nombre ORDER BY 5 DESC",
+    ),
+}
+
+ENCABEZADOS_AUDITORIA = ("Fecha y Hora", "Usuario", "Rol", "Acción", "Descripción")
+
+
+def encabezados_exportacion(nombre):
+    """Encabezados de columna de una exportación ('auditoria' o de _CONSULTAS_EXPORTACION)."""
+    if nombre == "auditoria":
+        return ENCABEZADOS_AUDITORIA
+    return _CONSULTAS_EXPORTACION[nombre][0]
+
+
+def _iterar_cursor(query, params, tamano_lote):
+    # Generador: las filas se traen de a `tamano_lote` con fetchmany, así la
+    # memoria no depende del tamaño del resultado. Usa la conexión de lectura
+    # del hilo que lo consume.
+    cursor = pool.conexion_lectura().cursor()
+    try:
+        cursor.execute(query, params)
+        while True:
+            lote = cursor.fetchmany(tamano_lote)
+            if not lote:
+                return
+            yield lote
+    finally:
+        cursor.close()
+
+
+def iterar_exportacion(nombre, fecha_inicio, fecha_fin, tamano_lote=5000):
+    """Lotes de filas de la exportación `nombre` para el rango de fechas."""
+    query = _CONSULTAS_EXPORTACION[nombre][1]
+    return _iterar_cursor(query, (fecha_inicio, fecha_fin), tamano_lote)
+
+
+def iterar_registro_auditoria(tamano_lote=5000, **filtros):
+    """
+    Lotes del registro de auditoría con los mismos filtros que
+    obtener_registro_auditoria, del más nuevo al más viejo.
+    """
+    cursor = pool.conexion_lectura().cursor()
+    try:
+        condiciones, params = _filtros_auditoria(cursor, **filtros)
+    finally:
+        cursor.close()
+    where = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    query = f"""
+        SELECT ra.fecha_hora, u.nombre_usuario, u.rol, ra.accion, ra.descripcion
+        FROM registro_auditoria ra
+        JOIN usuarios u ON ra.usuario_id = u.id
+        {where}
+        ORDER BY ra.fecha_hora DESC, ra.id DESC
+    """
+    return _iterar_cursor(query, params, tamano_lote)
+
+
 # ============================================================================
 # FUNCIONES DE BACKUP
 # ============================================================================
 def crear_copia_de_seguridad(ruta_destino):
+    # Con WAL, copiar solo data.db puede dejar afuera transacciones que aún
+    # están en el archivo -wal; la API de backup de SQLite copia un estado
+    # consistente de la base.
+    origen = destino = None
     try:
-        shutil.copy(DB_PATH, ruta_destino)
+        origen = sqlite3.connect(DB_PATH)
+        destino = sqlite3.connect(ruta_destino)
+        origen.backup(destino)
         return True
     except Exception as e:
         print(f"Error al crear la copia de seguridad: {e}")
         return False
+    finally:
+        if destino:
+            destino.close()
+        if origen:
+            origen.close()
+
+
+def _version_de_copia(ruta):
+    """PRAGMA user_version de la copia, o un texto "Error: ..." si no es una base del sistema."""
+    conn = None
+    try:
+        conn = sqlite3.connect(f"file:{ruta}?mode=ro", uri=True)
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'usuarios'").fetchone():
+            return "Error: El archivo no es una copia de seguridad del sistema."
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    except sqlite3.DatabaseError as e:
+        return f"Error: El archivo no es una base de datos válida ({e})."
+    finally:
+        if conn:
+            conn.close()
 
 
 def restaurar_copia_de_seguridad(ruta_origen):
+    """
+    Reemplaza la base por la copia `ruta_origen`, llevada antes al esquema
+    actual: una copia vieja no tiene las columnas que agregaron las
+    migraciones posteriores. Se rechazan las copias de una versión más nueva
+    del programa. La base en uso no se toca hasta que la copia quedó migrada.
+    Devuelve True o un texto "Error: ...".
+    """
     if not os.path.exists(ruta_origen):
-        print("Error: El archivo de backup no existe.")
-        return False
-
+        return "Error: El archivo de backup no existe."
+    version = _version_de_copia(ruta_origen)
+    if isinstance(version, str):
+        return version
+    if version > VERSION_ESQUEMA:
+        return (f"Error: La copia tiene el esquema {version}, más nuevo que el de esta versión "
+                f"del programa ({VERSION_ESQUEMA}). Actualice el programa antes de restaurarla.")
+
+    temporal = DB_PATH + ".restaurando"
     try:
-        shutil.copy(ruta_origen, DB_PATH)
+        shutil.copy(ruta_origen, temporal)
+        conn = sqlite3.connect(temporal, isolation_level=None)
+        try:
+            conn.execute("PRAGMA foreign_keys = ON")
+            aplicar_pragmas(conn, persistentes=True)
+            aplicar_migraciones(conn)
+        finally:
+            conn.close()
+
+        # Las conexiones del pool deben soltar el archivo antes de reemplazarlo.
+        cerrar_conexiones()
+        # Un -wal/-shm viejo se aplicaría sobre la base restaurada.
+        for sufijo in ("-wal", "-shm"):
+            if os.path.exists(DB_PATH + sufijo):
+                os.remove(DB_PATH + sufijo)
+        os.replace(temporal, DB_PATH)
         return True
     except Exception as e:
         print(f"Error al restaurar la copia de seguridad: {e}")
-        return False
+        return f"Error: No se pudo restaurar la copia de seguridad ({e})."
+    finally:
+        for sufijo in ("", "-wal", "-shm"):
+            if os.path.exists(temporal + sufijo):
+                os.remove(temporal + sufijo)
 
 # ============================================================================
 # FUNCIONES DE CIERRE DE CAJA
@@ -986,6 +2722,7 @@ def registrar_cierre_caja(cursor, usuario_id, total_ventas_sistema, total_efecti
     """
     Registra un cierre de caja y audita la acción.
     """
+    marcar_cambios("cierres")
     try:
         fecha_hora = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         diferencia = efectivo_contado - total_efectivo_sistema
@@ -1007,7 +2744,9 @@ def registrar_cierre_caja(cursor, usuario_id, total_ventas_sistema, total_efecti
             usuario_id, 
             "CIERRE_CAJA",
             f"Cierre ID {cierre_id}. Efectivo sistema: ${total_efectivo_sistema:.2f}, "
-            f"Contado: ${efectivo_contado:.2f}, Diferencia: ${diferencia:.2f} ({estado})"
+            f"Contado: ${efectivo_contado:.2f}, Diferencia: ${diferencia:.2f} ({estado})",
+            entidad=("cierre", cierre_id),
+            monto=diferencia
         )
         
         return cierre_id
@@ -1016,7 +2755,7 @@ def registrar_cierre_caja(cursor, usuario_id, total_ventas_sistema, total_efecti
         return None
 
 
-@db_connection
+@db_read_connection
 def obtener_cierres_por_usuario(cursor, usuario_id, limite=30):
     """Obtiene el historial de cierres de un usuario específico."""
     query = """
@@ -1037,7 +2776,7 @@ def obtener_cierres_por_usuario(cursor, usuario_id, limite=30):
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_cierres_por_rango(cursor, fecha_inicio, fecha_fin):
     """Obtiene todos los cierres en un rango de fechas."""
     query = """
@@ -1052,14 +2791,14 @@ def obtener_cierres_por_rango(cursor, fecha_inicio, fecha_fin):
             c.observaciones
         FROM cierres_caja c
         JOIN usuarios u ON c.usuario_id = u.id
-        WHERE DATE(c.fecha_hora) BETWEEN ? AND ?
+        WHERE c.fecha_hora >= ? AND c.fecha_hora < date(?, '+1 day')
         ORDER BY c.fecha_hora DESC
     """
     cursor.execute(query, (fecha_inicio, fecha_fin))
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_detalle_cierre(cursor, cierre_id):
     """Obtiene el detalle completo de un cierre específico."""
     query = """
@@ -1081,20 +2820,20 @@ def obtener_detalle_cierre(cursor, cierre_id):
     return cursor.fetchone()
 
 
-@db_connection
+@db_read_connection
 def verificar_cierre_hoy(cursor, usuario_id):
     """Verifica si ya existe un cierre para el usuario en el día actual."""
     fecha_hoy = datetime.now().strftime("%Y-%m-%d")
     cursor.execute(
         """SELECT COUNT(*) FROM cierres_caja 
-           WHERE usuario_id = ? AND DATE(fecha_hora) = ?""",
-        (usuario_id, fecha_hoy)
+           WHERE usuario_id = ? AND fecha_hora >= ? AND fecha_hora < date(?, '+1 day')""",
+        (usuario_id, fecha_hoy, fecha_hoy)
     )
     count = cursor.fetchone()[0]
     return count > 0
 
 
-@db_connection
+@db_read_connection
 def obtener_resumen_cierres(cursor, fecha_inicio, fecha_fin):
     """Obtiene un resumen estadístico de los cierres en un rango de fechas."""
     query = """
@@ -1108,7 +2847,7 @@ def obtener_resumen_cierres(cursor, fecha_inicio, fecha_fin):
             SUM(CASE WHEN diferencia < 0 THEN diferencia ELSE 0 END) as total_faltantes,
             SUM(CASE WHEN diferencia = 0 THEN 1 ELSE 0 END) as cierres_cuadrados
         FROM cierres_caja
-        WHERE DATE(fecha_hora) BETWEEN ? AND ?
+        WHERE fecha_hora >= ? AND fecha_hora < date(?, '+1 day')
     """
     cursor.execute(query, (fecha_inicio, fecha_fin))
     resultado = cursor.fetchone()
@@ -1136,7 +2875,7 @@ def obtener_resumen_cierres(cursor, fecha_inicio, fecha_fin):
         "cierres_cuadrados": resultado[7] or 0
     }
 
-@db_connection
+@db_read_connection
 def buscar_ventas_para_devolucion(cursor, criterio, valor):
     """
     Busca ventas que puedan ser devueltas.
@@ -1175,17 +2914,17 @@ def buscar_ventas_para_devolucion(cursor, criterio, valor):
             FROM ventas v
             JOIN usuarios u ON v.usuario_id = u.id
             LEFT JOIN deudores d ON v.deudor_id = d.id
-            WHERE DATE(v.fecha_hora) = ?
+            WHERE v.fecha_hora >= ? AND v.fecha_hora < date(?, '+1 day')
             ORDER BY v.fecha_hora DESC
         """
-        cursor.execute(query, (valor,))
+        cursor.execute(query, (valor, valor))
     else:
         return []
     
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_detalle_venta_para_devolucion(cursor, venta_id):
     """
     Obtiene el detalle completo de una venta para procesarla.
@@ -1235,7 +2974,7 @@ def obtener_detalle_venta_para_devolucion(cursor, venta_id):
     return info_venta, detalles
 
 
-@db_connection
+@db_read_connection
 def verificar_devolucion_previa(cursor, venta_id):
     """
     Verifica si una venta ya tiene devoluciones registradas.
@@ -1272,6 +3011,7 @@ def registrar_devolucion(cursor, usuario_id, venta_id, productos_devolver, motiv
     Returns:
         ID de la devolución o None si falla
     """
+    marcar_cambios("devoluciones", "productos", "ventas", "deudores")
     try:
         # 1. Obtener info de la venta
         cursor.execute("""
@@ -1332,6 +3072,12 @@ def registrar_devolucion(cursor, usuario_id, venta_id, productos_devolver, motiv
                 SET stock = stock + ?
                 WHERE id = ?
             """, (cantidad, producto_id))
+
+            # Resumen diario (la devolución cuenta en el día en que se hace)
+            cursor.execute(
+                _UPSERT_RESUMEN_DEVOLUCION,
+                (fecha_hora[:10], producto_id, cantidad, cantidad * precio_unitario)
+            )
         
         # 7. Procesar reintegro según tipo de pago
         if tipo_pago == "Credito" and deudor_id:
@@ -1359,7 +3105,9 @@ def registrar_devolucion(cursor, usuario_id, venta_id, productos_devolver, motiv
             "DEVOLUCION_REGISTRADA",
             f"Devolución ID {devolucion_id} de venta #{venta_id}. "
             f"Total: ${total_devolucion:.2f}. Tipo: {tipo_devolucion}. "
-            f"Pago: {tipo_pago}{f' (Deudor: {nombre_deudor})' if deudor_id else ''}."
+            f"Pago: {tipo_pago}{f' (Deudor: {nombre_deudor})' if deudor_id else ''}.",
+            entidad=("venta", venta_id),
+            monto=total_devolucion
         )
         
         return devolucion_id
@@ -1369,7 +3117,7 @@ def registrar_devolucion(cursor, usuario_id, venta_id, productos_devolver, motiv
         return None
 
 
-@db_connection
+@db_read_connection
 def obtener_devoluciones_por_rango(cursor, fecha_inicio, fecha_fin):
     """
     Obtiene todas las devoluciones en un rango de fechas.
@@ -1385,14 +3133,14 @@ def obtener_devoluciones_por_rango(cursor, fecha_inicio, fecha_fin):
             d.motivo
         FROM devoluciones d
         JOIN usuarios u ON d.usuario_id = u.id
-        WHERE DATE(d.fecha_hora) BETWEEN ? AND ?
+        WHERE d.fecha_hora >= ? AND d.fecha_hora < date(?, '+1 day')
         ORDER BY d.fecha_hora DESC
     """
     cursor.execute(query, (fecha_inicio, fecha_fin))
     return cursor.fetchall()
 
 
-@db_connection
+@db_read_connection
 def obtener_detalle_devolucion(cursor, devolucion_id):
     """
     Obtiene el detalle completo de una devolución.
@@ -1433,7 +3181,7 @@ def obtener_detalle_devolucion(cursor, devolucion_id):
     return info_devolucion, detalles
 
 
-@db_connection
+@db_read_connection
 def obtener_estadisticas_devoluciones(cursor, fecha_inicio, fecha_fin):
     """
     Obtiene estadísticas de devoluciones en un período.
@@ -1446,7 +3194,7 @@ def obtener_estadisticas_devoluciones(cursor, fecha_inicio, fecha_fin):
             SUM(CASE WHEN tipo_devolucion = 'PARCIAL' THEN 1 ELSE 0 END) as parciales,
             AVG(total_devolucion) as promedio_devolucion
         FROM devoluciones
-        WHERE DATE(fecha_hora) BETWEEN ? AND ?
+        WHERE fecha_hora >= ? AND fecha_hora < date(?, '+1 day')
     """
     cursor.execute(query, (fecha_inicio, fecha_fin))
     resultado = cursor.fetchone()
@@ -0,0 +1,105 @@
+# db_tools.py
+"""
+Tareas de mantenimiento de la base de datos desde la línea de comandos.
+
+    python db_tools.py reconstruir-resumenes [--desde AAAA-MM-DD] [--hasta AAAA-MM-DD]
+    python db_tools.py archivar-auditoria [--meses N] [--sin-compactar]
+    python db_tools.py migrar [--simular]
+"""
+import argparse
+import sys
+import time
+from database import setup_database, reconstruir_resumenes, cerrar_conexiones, compactar_base, VERSION_ESQUEMA
+from audit_archive import archivar_auditoria, MESES_A_CONSERVAR
+
+
+def comando_reconstruir_resumenes(args):
+    inicio = time.perf_counter()
+    resultado = reconstruir_resumenes(args.desde, args.hasta)
+    if not resultado:
+        print("No se pudieron reconstruir los resúmenes.")
+        return 1
+    rango = f"{args.desde or 'inicio'} a {args.hasta or 'hoy'}"
+    print(f"Resúmenes reconstruidos ({rango}) en {time.perf_counter() - inicio:.2f} s.")
+    return 0
+
+
+def comando_archivar_auditoria(args):
+    inicio = time.perf_counter()
+    resultados = archivar_auditoria(args.meses)
+    if not resultados:
+        print(f"No hay registros de auditoría anteriores a los últimos {args.meses} meses.")
+        return 0
+    errores = 0
+    for mes, resultado in resultados:
+        if isinstance(resultado, str):
+            errores += 1
+            print(f"{mes}: {resultado}")
+        else:
+            print(f"{mes}: {resultado} registros archivados.")
+    if errores < len(resultados) and not args.sin_compactar:
+        # Lo borrado deja páginas libres; VACUUM las devuelve al disco
+        recuperados = compactar_base()
+        if recuperados is None:
+            errores += 1
+        else:
+            print(f"Base compactada: {recuperados / 1024 / 1024:.1f} MB recuperados.")
+    print(f"Listo en {time.perf_counter() - inicio:.2f} s.")
+    return 1 if errores else 0
+
+
+def comando_migrar(args):
+    inicio = time.perf_counter()
+    aplicadas = setup_database(simular=args.simular)
+    if aplicadas is None:
+        print("No se pudo actualizar el esquema.")
+        return 1
+    if not aplicadas:
+        print(f"El esquema ya está al día (versión {VERSION_ESQUEMA}).")
+        return 0
+    accion = "Simulación terminada (sin cambios)" if args.simular else "Esquema actualizado"
+    print(f"{accion}: {len(aplicadas)} pasos en {time.perf_counter() - inicio:.2f} s.")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mantenimiento de la base de datos.")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    reconstruir = subcomandos.add_parser(
+        "reconstruir-resumenes",
+        help="Recalcula las tablas de resumen diario desde el detalle de ventas y compras.",
+    )
+    reconstruir.add_argument("--desde", help="Fecha inicial (AAAA-MM-DD)")
+    reconstruir.add_argument("--hasta", help="Fecha final (AAAA-MM-DD)")
+    reconstruir.set_defaults(funcion=comando_reconstruir_resumenes)
+
+    archivar = subcomandos.add_parser(
+        "archivar-auditoria",
+        help="Mueve la auditoría vieja a archivos mensuales (archivo_auditoria/).",
+    )
+    archivar.add_argument("--meses", type=int, default=MESES_A_CONSERVAR,
+                          help=f"Meses que se conservan en la base (por defecto {MESES_A_CONSERVAR})")
+    archivar.add_argument("--sin-compactar", action="store_true",
+                          help="No corre VACUUM después de archivar (la base no se achica)")
+    archivar.set_defaults(funcion=comando_archivar_auditoria)
+
+    migrar = subcomandos.add_parser(
+        "migrar",
+        help="Aplica las migraciones de esquema pendientes, mostrando el tiempo de cada una.",
+    )
+    migrar.add_argument("--simular", action="store_true",
+                        help="Corre los pasos y los deshace al final, sin modificar la base")
+    migrar.set_defaults(funcion=comando_migrar)
+
+    args = parser.parse_args(argv)
+    if args.funcion is not comando_migrar:
+        setup_database()
+    try:
+        return args.funcion(args)
+    finally:
+        cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+# debounced_search.py
+import queue
+import threading
+from tkinter import TclError
+from database import interrumpir_lectura
+
+
+class DebouncedSearch:
+    """
+    Ejecuta una búsqueda fuera del hilo de Tk.
+
+    - Espera `demora_ms` desde la última tecla antes de consultar (debounce).
+    - La consulta corre en un hilo propio; si llega una búsqueda más nueva, la
+      que está en curso se interrumpe y su resultado se descarta.
+    - Solo el resultado más reciente se aplica, en el hilo de Tk, vía after().
+    """
+
+    INTERVALO_SONDEO_MS = 25
+
+    def __init__(self, widget, buscar, aplicar, demora_ms=200):
+        self.widget = widget
+        self.buscar = buscar      # buscar(*args) -> resultado (hilo de trabajo)
+        self.aplicar = aplicar    # aplicar(resultado) (hilo de Tk)
+        self.demora_ms = demora_ms
+
+        self._after_id = None
+        self._sondeando = False
+        self._solicitud = 0       # número de la búsqueda más reciente
+        self._despachada = 0      # número de la última búsqueda enviada al hilo
+        self._ultimos_args = None
+        self._trabajos = queue.Queue()
+        self._resultados = queue.Queue()
+
+        self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self._hilo.start()
+        self.widget.bind("<Destroy>", lambda e: self.detener(), add="+")
+
+    def solicitar(self, *args):
+        """Programa una búsqueda; las pulsaciones rápidas se agrupan en una sola."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+        self._after_id = self.widget.after(self.demora_ms, self._despachar, args)
+
+    def ejecutar_ahora(self, *args):
+        """Busca sin esperar el debounce (p. ej. al cambiar de categoría)."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+        self._despachar(args, forzar=True)
+
+    def cancelar(self):
+        """Descarta la búsqueda pendiente o en curso (p. ej. antes de una recarga directa)."""
+        if self._after_id is not None:
+            self.widget.after_cancel(self._after_id)
+            self._after_id = None
+        self._ultimos_args = None
+        self._solicitud += 1
+        interrumpir_lectura(self._hilo.ident)
+
+    def _despachar(self, args, forzar=False):
+        self._after_id = None
+        # Teclas que no cambian el texto (flechas, Shift...) no generan consulta.
+        if not forzar and args == self._ultimos_args:
+            return
+        self._ultimos_args = args
+        self._solicitud += 1
+        self._despachada = self._solicitud
+        # Cancela la consulta obsoleta que pueda estar corriendo.
+        interrumpir_lectura(self._hilo.ident)
+        self._trabajos.put((self._solicitud, args))
+        if not self._sondeando:
+            self._sondeando = True
+            self.widget.after(self.INTERVALO_SONDEO_MS, self._sondear)
+
+    def _trabajar(self):
+        while True:
+            trabajo = self._trabajos.get()
+            if trabajo is None:
+                return
+            # Si se acumularon pedidos, solo importa el último.
+            try:
+                while True:
+                    siguiente = self._trabajos.get_nowait()
+                    if siguiente is None:
+                        return
+                    trabajo = siguiente
+            except queue.Empty:
+                pass
+
+            numero, args = trabajo
+            if numero != self._solicitud:
+                continue
+            try:
+                resultado = self.buscar(*args)
+            except Exception as e:
+                print(f"Error en la búsqueda: {e}")
+                resultado = None
+            self._resultados.put((numero, resultado))
+
+    def _sondear(self):
+        ultimo = None
+        try:
+            while True:
+                ultimo = self._resultados.get_nowait()
+        except queue.Empty:
+            pass
+
+        if ultimo is not None and ultimo[0] == self._solicitud:
+            self._sondeando = False
+            if ultimo[1] is not None:
+                self.aplicar(ultimo[1])
+            return
+        if self._despachada != self._solicitud:
+            # cancelar() invalidó la búsqueda en curso: no hay nada que esperar
+            self._sondeando = False
+            return
+
+        try:
+            self.widget.after(self.INTERVALO_SONDEO_MS, self._sondear)
+        except TclError:
+            self._sondeando = False  # El widget ya no existe
+
+    def detener(self):
+        self._solicitud += 1
+        self._trabajos.put(None)
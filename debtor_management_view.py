@@ -4,7 +4,6 @@ from ttkbootstrap.constants import *
 from tkinter import messagebox, simpledialog
 from datetime import datetime
 from database import (
-    obtener_deudores,
     agregar_deudor,
     actualizar_deudor,
     eliminar_deudor,
@@ -16,6 +15,7 @@ from database import (
     obtener_deudas_pagadas_deudor,
 )
 from base_dialog import BaseDialog
+from catalog_cache import catalogo
 
 
 class DebtorManagementView:
@@ -78,10 +78,13 @@ class DebtorManagementView:
 
         self.cargar_deudores()
 
+    def refrescar(self):
+        self.cargar_deudores()
+
     def cargar_deudores(self):
         for item in self.tree.get_children():
             self.tree.delete(item)
-        for debtor in obtener_deudores():
+        for debtor in catalogo.deudores():
             saldo = debtor[3]
             saldo_formateado = f"${saldo:.2f}"
             tags = ("pagado",) if saldo <= 0 else ()
@@ -0,0 +1,174 @@
+# export_engine.py
+"""
+Exportación de reportes y auditoría a CSV / XLSX directamente desde la base.
+
+Las filas se leen por lotes (fetchmany) y se escriben a medida que llegan,
+así que la memoria no depende de la cantidad de filas. XLSX requiere
+openpyxl (modo write_only); si no está instalado solo se ofrece CSV.
+"""
+import csv
+import os
+import queue
+import threading
+from tkinter import TclError
+from database import encabezados_exportacion, iterar_exportacion, iterar_registro_auditoria
+from audit_archive import iterar_archivo
+
+try:
+    from openpyxl import Workbook
+except ImportError:  # openpyxl es opcional
+    Workbook = None
+
+TAMANO_LOTE = 5000
+
+
+class ExportacionCancelada(Exception):
+    pass
+
+
+def formatos_disponibles():
+    """Tipos de archivo para el diálogo de guardado."""
+    tipos = [("Archivos CSV", "*.csv")]
+    if Workbook is not None:
+        tipos.append(("Libro de Excel", "*.xlsx"))
+    return tipos
+
+
+# ============================================================================
+# ESCRITORES
+# ============================================================================
+class _EscritorCSV:
+    def __init__(self, ruta):
+        # utf-8-sig: Excel reconoce los acentos al abrir el CSV
+        self._archivo = open(ruta, "w", newline="", encoding="utf-8-sig")
+        self._csv = csv.writer(self._archivo)
+
+    def escribir(self, filas):
+        self._csv.writerows(filas)
+
+    def cerrar(self):
+        self._archivo.close()
+
+
+class _EscritorXLSX:
+    def __init__(self, ruta):
+        if Workbook is None:
+            raise RuntimeError("Para exportar a Excel hace falta instalar openpyxl.")
+        self._ruta = ruta
+        # write_only: las filas van a un archivo temporal, no quedan en memoria
+        self._libro = Workbook(write_only=True)
+        self._hoja = self._libro.create_sheet()
+
+    def escribir(self, filas):
+        for fila in filas:
+            self._hoja.append(fila)
+
+    def cerrar(self):
+        self._libro.save(self._ruta)
+
+
+def _crear_escritor(ruta):
+    if os.path.splitext(ruta)[1].lower() == ".xlsx":
+        return _EscritorXLSX(ruta)
+    return _EscritorCSV(ruta)
+
+
+# ============================================================================
+# EXPORTACIÓN
+# ============================================================================
+def _lotes(nombre, parametros):
+    if nombre == "auditoria":
+        # Base principal y después los meses archivados
+        yield from iterar_registro_auditoria(TAMANO_LOTE, **parametros)
+        yield from iterar_archivo(TAMANO_LOTE, **parametros)
+    else:
+        yield from iterar_exportacion(
+            nombre, parametros["fecha_inicio"], parametros["fecha_fin"], TAMANO_LOTE
+        )
+
+
+def exportar(nombre, ruta, al_progreso=None, cancelado=None, **parametros):
+    """
+    Escribe la exportación `nombre` ('ventas', 'detalle_ventas', 'compras',
+    'top_productos', 'ganancias' con fecha_inicio/fecha_fin, o 'auditoria'
+    con los filtros de obtener_registro_auditoria) en `ruta`. El formato sale
+    de la extensión (.csv o .xlsx). Devuelve la cantidad de filas escritas.
+
+    `al_progreso(filas)` se llama después de cada lote; si `cancelado()`
+    devuelve True se corta y el archivo incompleto se borra.
+    """
+    escritor = _crear_escritor(ruta)
+    filas_escritas = 0
+    completo = False
+    try:
+        escritor.escribir([encabezados_exportacion(nombre)])
+        for lote in _lotes(nombre, parametros):
+            if cancelado and cancelado():
+                raise ExportacionCancelada()
+            escritor.escribir(lote)
+            filas_escritas += len(lote)
+            if al_progreso:
+                al_progreso(filas_escritas)
+        completo = True
+    finally:
+        escritor.cerrar()
+        if not completo and os.path.exists(ruta):
+            os.remove(ruta)
+    return filas_escritas
+
+
+class ExportJob:
+    """
+    Corre exportar() en un hilo y avisa en el hilo de Tk:
+    `al_progreso(filas)` mientras avanza y `al_terminar(resultado)` al final,
+    donde resultado es la cantidad de filas o un texto "Error: ...".
+    """
+
+    INTERVALO_SONDEO_MS = 150
+
+    def __init__(self, widget, nombre, ruta, al_progreso, al_terminar, **parametros):
+        self.widget = widget
+        self.al_progreso = al_progreso
+        self.al_terminar = al_terminar
+        self._cancelado = False
+        self._eventos = queue.Queue()
+        self._hilo = threading.Thread(
+            target=self._trabajar, args=(nombre, ruta, parametros), name="exportacion", daemon=True
+        )
+        self._hilo.start()
+        self.widget.after(self.INTERVALO_SONDEO_MS, self._sondear)
+
+    def cancelar(self):
+        self._cancelado = True
+
+    def _trabajar(self, nombre, ruta, parametros):
+        try:
+            filas = exportar(
+                nombre, ruta,
+                al_progreso=lambda n: self._eventos.put(("progreso", n)),
+                cancelado=lambda: self._cancelado,
+                **parametros
+            )
+            self._eventos.put(("fin", filas))
+        except ExportacionCancelada:
+            self._eventos.put(("fin", "Error: Exportación cancelada."))
+        except Exception as e:
+            self._eventos.put(("fin", f"Error: {e}"))
+
+    def _sondear(self):
+        progreso = None
+        try:
+            while True:
+                tipo, valor = self._eventos.get_nowait()
+                if tipo == "fin":
+                    self.al_terminar(valor)
+                    return
+                progreso = valor
+        except queue.Empty:
+            pass
+        if progreso is not None:
+            self.al_progreso(progreso)
+        try:
+            self.widget.after(self.INTERVALO_SONDEO_MS, self._sondear)
+        except TclError:
+            self._cancelado = True  # El widget ya no existe
@@ -2,10 +2,27 @@
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from tkinter import messagebox
-from PIL import Image, ImageTk
+import importlib
 import os
-from database import setup_database, verificar_credenciales, actualizar_contrasena
-from main_window import MainWindow
+import threading
+from database import setup_database, cerrar_conexiones
+from auth_service import AuthService, preparar_base
+
+
+def precargar_modulos():
+    """
+    Importa en segundo plano lo que el login no necesita (vistas, reportlab)
+    para que el primer ingreso no espere por esos imports.
+    """
+    try:
+        import main_window
+        for modulo, _, _ in main_window.VISTAS.values():
+            importlib.import_module(modulo)
+        from ticket_generator import cargar_reportlab
+        cargar_reportlab()
+    except Exception as e:
+        # Sin precarga el import se hace (y falla, si corresponde) al usarlo
+        print(f"ℹ️ Precarga incompleta: {e}")
 
 
 class PasswordChangeDialog(ttk.Toplevel):
@@ -16,6 +33,7 @@ class PasswordChangeDialog(ttk.Toplevel):
         self.usuario_id = usuario_id
         self.nombre_usuario = nombre_usuario
         self.nueva_contrasena = None
+        self.auth = AuthService(self)
         
         # Modal
         self.transient(parent)
@@ -55,12 +73,13 @@ class PasswordChangeDialog(ttk.Toplevel):
         btn_frame = ttk.Frame(main_frame)
         btn_frame.pack(fill=X)
         
-        ttk.Button(
+        self.btn_cambiar = ttk.Button(
             btn_frame,
             text="Cambiar Contraseña",
             command=self.cambiar_contrasena,
             bootstyle="success"
-        ).pack(side=LEFT, expand=True, fill=X, padx=(0, 5))
+        )
+        self.btn_cambiar.pack(side=LEFT, expand=True, fill=X, padx=(0, 5))
         
         ttk.Button(
             btn_frame,
@@ -95,9 +114,14 @@ class PasswordChangeDialog(ttk.Toplevel):
             messagebox.showerror("Error", "Las contraseñas no coinciden.", parent=self)
             return
         
-        # Actualizar en la BD (el propio usuario se cambia su contraseña)
-        resultado = actualizar_contrasena(self.usuario_id, nueva)
-        
+        # Actualizar en la BD (el propio usuario se cambia su contraseña).
+        # El hash se calcula en segundo plano; la ventana sigue respondiendo.
+        if self.auth.cambiar_contrasena(
+            self.usuario_id, nueva, lambda resultado: self._contrasena_cambiada(resultado, nueva)
+        ):
+            self.btn_cambiar.config(state=DISABLED, text="Guardando...")
+    
+    def _contrasena_cambiada(self, resultado, nueva):
         if resultado is True:
             self.nueva_contrasena = nueva
             messagebox.showinfo(
@@ -107,13 +131,18 @@ class PasswordChangeDialog(ttk.Toplevel):
             )
             self.destroy()
         else:
-            messagebox.showerror("Error", str(resultado), parent=self)
+            self.btn_cambiar.config(state=NORMAL, text="Cambiar Contraseña")
+            messagebox.showerror("Error", str(resultado or "No se pudo actualizar la contraseña."), parent=self)
 
 
 class App:
     def __init__(self, root):
         self.root = root
         self.root.title("ClickVenta")
+        self.auth = AuthService(self.root)
+        # La base se prepara en el hilo de autenticación mientras se muestra
+        # el login; el primer intento de ingreso queda en cola detrás.
+        preparar_base(setup_database)
         
         # Frame principal
         self.main_container = ttk.Frame(self.root, padding=(20, 20))
@@ -128,7 +157,6 @@ class App:
         # Intentar cargar el logo
         self.logo_label = ttk.Label(left_frame)
         self.logo_label.pack(expand=True)
-        self.cargar_logo()
         
         # ============================================
         # LADO DERECHO - FORMULARIO DE LOGIN
@@ -166,8 +194,20 @@ class App:
         self.root.bind("<Return>", lambda event=None: self.btn_login.invoke())
         self.root.eval("tk::PlaceWindow . center")
 
+        # El logo (PIL) se carga con la ventana ya dibujada y el resto de los
+        # módulos se importa en segundo plano mientras se escribe la contraseña
+        self.root.after_idle(self.mostrar_logo)
+        self.root.after(300, lambda: threading.Thread(
+            target=precargar_modulos, name="precarga", daemon=True
+        ).start())
+
+    def mostrar_logo(self):
+        self.cargar_logo()
+        self.root.eval("tk::PlaceWindow . center")
+
     def cargar_logo(self):
         """Intenta cargar el logo desde varios posibles ubicaciones."""
+        from PIL import Image, ImageTk
         posibles_rutas = [
             "logo.png",                    # En la carpeta raíz del proyecto
             os.path.join("assets", "logo.png"),  # En una carpeta 'assets'
@@ -211,8 +251,12 @@ class App:
     def intentar_login(self):
         usuario = self.entry_usuario.get()
         contrasena = self.entry_contra.get()
-        resultado = verificar_credenciales(usuario, contrasena)
-        
+        # La verificación (KDF) corre fuera del hilo de Tk
+        if self.auth.iniciar_sesion(usuario, contrasena, lambda resultado: self._login_verificado(usuario, resultado)):
+            self.btn_login.config(state=DISABLED, text="Verificando...")
+
+    def _login_verificado(self, usuario, resultado):
+        self.btn_login.config(state=NORMAL, text="Ingresar")
         if resultado:
             usuario_id, rol, debe_cambiar = resultado
             
@@ -230,7 +274,8 @@ class App:
                     )
                     return
             
-            # Continuar con el login normal
+            # Continuar con el login normal (ya importado por la precarga)
+            from main_window import MainWindow
             MainWindow(self.root, rol, usuario_id)
         else:
             messagebox.showerror(
@@ -241,7 +286,7 @@ class App:
 
 
 if __name__ == "__main__":
-    setup_database()
     root = ttk.Window(themename="superhero")
     app = App(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    cerrar_conexiones()
\ No newline at end of file
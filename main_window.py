@@ -1,26 +1,31 @@
 # main_window.py
+import importlib
 import ttkbootstrap as ttk
-from user_management_view import UserManagementView
-from auditoria_view import AuditoriaView # <--- USAR ESTE NOMBRE
-from supplier_management_view import SupplierManagementView
 from ttkbootstrap.constants import *
 from tkinter import messagebox, filedialog
-from datetime import datetime
+from datetime import datetime, date
 from database import (
     crear_copia_de_seguridad,
     restaurar_copia_de_seguridad,
     registrar_auditoria,
+    obtener_versiones,
 )
-from pos_view import POSView
-from sales_history_view import SalesHistoryView
-from closing_view import ClosingView
-from product_management_view import ProductManagementView
-from user_management_view import UserManagementView
-from reports_view import ReportsView
-from supplier_management_view import SupplierManagementView
-from purchase_entry_view import PurchaseEntryView
-from debtor_management_view import DebtorManagementView
-from auditoria_view import AuditoriaView
+
+
+# Vistas del área de contenido: nombre -> (módulo, clase, secciones de datos
+# que muestra). El módulo se importa la primera vez que se abre la vista.
+VISTAS = {
+    "punto_venta": ("pos_view", "POSView", ("productos", "categorias", "reservas")),
+    "historial_ventas": ("sales_history_view", "SalesHistoryView", ("ventas", "devoluciones")),
+    "cierre_caja": ("closing_view", "ClosingView", ("ventas", "cierres")),
+    "gestion_deudores": ("debtor_management_view", "DebtorManagementView", ("deudores",)),
+    "gestion_productos": ("product_management_view", "ProductManagementView", ("productos", "categorias", "proveedores")),
+    "gestion_usuarios": ("user_management_view", "UserManagementView", ("usuarios",)),
+    "gestion_proveedores": ("supplier_management_view", "SupplierManagementView", ("proveedores",)),
+    "registro_compra": ("purchase_entry_view", "PurchaseEntryView", ("productos", "proveedores")),
+    "reportes": ("reports_view", "ReportsView", ("ventas", "compras", "devoluciones", "historico")),
+    "auditoria": ("auditoria_view", "AuditoriaView", ("auditoria", "usuarios")),
+}
 
 
 class MainWindow:
@@ -54,6 +59,10 @@ class MainWindow:
         self.pos_view = None
         # ----------------------------------------------------
 
+        # Vistas ya creadas: nombre -> [marco, vista, versión de sus datos]
+        self.vistas = {}
+        self.vista_actual = None
+
         ttk.Label(
             self.sidebar_frame,
             text=f"Usuario: {rol.upper()}",
@@ -186,9 +195,35 @@ class MainWindow:
 
         self.abrir_punto_venta()  # Inicia en la vista POS
 
-    def limpiar_content_frame(self):
-        for widget in self.content_frame.winfo_children():
-            widget.destroy()
+    def mostrar_vista(self, nombre, *args):
+        """
+        Muestra la vista `nombre` de VISTAS y la devuelve. La primera vez se
+        importa su módulo y se crea con (marco, *args); después se oculta en
+        lugar de destruirse y al volver solo se llama a su refrescar() si
+        cambiaron los datos que muestra (o cambió el día).
+        """
+        modulo, clase, secciones = VISTAS[nombre]
+        version = (date.today(), obtener_versiones(*secciones))
+
+        if self.vista_actual is not None and self.vista_actual != nombre:
+            self.vistas[self.vista_actual][0].pack_forget()
+
+        entrada = self.vistas.get(nombre)
+        if entrada is None:
+            marco = ttk.Frame(self.content_frame)
+            marco.pack(fill=BOTH, expand=True)
+            vista = getattr(importlib.import_module(modulo), clase)(marco, *args)
+            self.vistas[nombre] = [marco, vista, version]
+        else:
+            marco, vista, version_anterior = entrada
+            if self.vista_actual != nombre:
+                marco.pack(fill=BOTH, expand=True)
+            if version != version_anterior:
+                entrada[2] = version
+                vista.refrescar()
+
+        self.vista_actual = nombre
+        return vista
 
     # ------------------------------------------------------------------
     # --- MÉTODO CENTRAL DE VERIFICACIÓN (APLICA LA MODALIDAD) ---
@@ -218,53 +253,45 @@ class MainWindow:
             self.pos_view.cancelar_venta(confirmar=False)
 
         # Ejecutamos la función de la nueva vista (la lambda que le pasamos)
-        self.limpiar_content_frame()
         nueva_vista_func()
 
     # ------------------------------------------------------------------
     # --- MÉTODOS PÚBLICOS DE NAVEGACIÓN (CREA y GUARDA self.pos_view) ---
     # ------------------------------------------------------------------
     def abrir_punto_venta(self):
-        self.limpiar_content_frame()
-        # CLAVE: Creamos la instancia y la guardamos en self.pos_view
-        self.pos_view = POSView(self.content_frame, self.usuario_id)
+        # CLAVE: Guardamos la instancia en self.pos_view
+        self.pos_view = self.mostrar_vista("punto_venta", self.usuario_id)
 
     # ------------------------------------------------------------------
     # --- MÉTODOS INTERNOS DE NAVEGACIÓN (Ejecutados después de la verificación) ---
     # ------------------------------------------------------------------
-    # Renombramos los antiguos métodos "abrir_..." a "_abrir_..._interno"
-    # y eliminamos self.limpiar_content_frame() ya que se hace en verificar_y_cambiar_seccion
-
     def _abrir_historial_ventas_interno(self):
-        SalesHistoryView(self.content_frame, self.usuario_id)
+        self.mostrar_vista("historial_ventas", self.usuario_id)
 
     def _abrir_cierre_caja_interno(self):
-        ClosingView(self.content_frame, self.usuario_id)
+        self.mostrar_vista("cierre_caja", self.usuario_id)
 
     def _abrir_gestion_deudores_interno(self):
-        DebtorManagementView(self.content_frame, self.usuario_id)
+        self.mostrar_vista("gestion_deudores", self.usuario_id)
 
     def _abrir_gestion_productos_interno(self):
-        self.limpiar_content_frame()  # ✅ MÉTODO CORRECTO
-        ProductManagementView(self.content_frame, self, self.usuario_id)
+        self.mostrar_vista("gestion_productos", self, self.usuario_id)
 
     def _abrir_gestion_usuarios_interno(self):
-        self.limpiar_content_frame()  # ✅ MÉTODO CORRECTO
-        UserManagementView(self.content_frame, self, self.usuario_id)
+        self.mostrar_vista("gestion_usuarios", self, self.usuario_id)
 
     def _abrir_gestion_proveedores_interno(self):
-        self.limpiar_content_frame()  # ✅ MÉTODO CORRECTO
         # Pasamos los parámetros estándar (frame, ventana, id_usuario)
-        SupplierManagementView(self.content_frame, self, self.usuario_id)
+        self.mostrar_vista("gestion_proveedores", self, self.usuario_id)
         
     def _abrir_registro_compra_interno(self):
-        PurchaseEntryView(self.content_frame, self.usuario_id)
+        self.mostrar_vista("registro_compra", self.usuario_id)
 
     def _abrir_reportes_interno(self):
-        ReportsView(self.content_frame)
+        self.mostrar_vista("reportes")
 
     def _abrir_auditoria_interno(self):
-        AuditoriaView(self.content_frame)
+        self.mostrar_vista("auditoria")
 
     def realizar_copia_de_seguridad(self):
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
@@ -318,19 +345,19 @@ class MainWindow:
 
         if ruta_origen:
             # 3. Proceso de Restauración
-            if restaurar_copia_de_seguridad(ruta_origen):
+            resultado = restaurar_copia_de_seguridad(ruta_origen)
+            if resultado is True:
                 messagebox.showwarning(
                     "Éxito y Aviso",
-                    "Base de datos restaurada exitosamente.\n\n"
-                    "¡ATENCIÓN! La aplicación DEBE REINICIARSE para cargar los nuevos datos. Cerrando la sesión...",
+                    "Base de datos restaurada y actualizada al esquema actual.\n\n"
+                    "Se cerrará la sesión para cargar los nuevos datos.",
                     parent=root_window,
                 )
                 self.cerrar_sesion()  # Cerrar la ventana principal
             else:
                 messagebox.showerror(
                     "Error de Restauración",
-                    "No se pudo restaurar la base de datos.\n"
-                    "Asegúrese de que la aplicación no esté bloqueando el archivo de la DB.",
+                    f"No se pudo restaurar la base de datos.\n\n{resultado}",
                     parent=root_window,
                 )
         else:
@@ -1,19 +1,30 @@
 # pos_view.py
+import uuid
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
-from tkinter import messagebox
+from tkinter import messagebox, TclError
 from database import (
     obtener_productos,
     registrar_venta,
-    obtener_deudores,
-    obtener_categorias,
+    obtener_productos_por_codigos,
+    obtener_reservas_ajenas,
+    reservar_stock,
+    renovar_reservas,
+    liberar_reservas,
 )  # <-- Nueva importación
+from catalog_cache import catalogo
 from debtor_management_view import DebtorForm
 from ticket_generator import generar_ticket_pdf
 from base_dialog import BaseDialog
+from debounced_search import DebouncedSearch
+from virtual_treeview import VirtualTreeview
 
 
 class POSView:
+    # Cada cuánto se renuevan las reservas del carrito abierto (deben vencer
+    # después: ver DURACION_RESERVA_SEGUNDOS en database.py)
+    INTERVALO_RENOVACION_MS = 60 * 1000
+
     def __init__(self, parent_frame, usuario_id):
         self.parent_frame = parent_frame
         self.usuario_id = usuario_id
@@ -21,6 +32,13 @@ class POSView:
         self.stock_original_productos = (
             {}
         )  # Diccionario código_producto -> stock_original
+        # Índice en memoria para el escáner: codigo -> (nombre, precio, stock_bd)
+        self.indice_codigos = {}
+        # El carrito reserva stock en la BD a nombre de esta sesión, así las
+        # otras cajas no venden las mismas unidades.
+        self.sesion_reserva = uuid.uuid4().hex
+        self.reservas_ajenas = {}  # codigo -> cantidad reservada por otras cajas
+        self._renovacion_id = None
 
         self.products_frame = ttk.Frame(self.parent_frame)
         self.products_frame.pack(side=LEFT, fill=BOTH, expand=True, padx=5, pady=5)
@@ -33,6 +51,19 @@ class POSView:
             self.products_frame, text="Punto de Venta", font=("Helvetica", 16, "bold")
         ).pack(pady=5)
 
+        # --- ESCÁNER DE CÓDIGOS ---
+        # El lector de códigos "tipea" el código y manda Enter; se agrega al
+        # carrito directamente, sin pasar por la búsqueda ni la tabla.
+        scan_frame = ttk.Frame(self.products_frame)
+        scan_frame.pack(fill=X, pady=(5, 0))
+        ttk.Label(scan_frame, text="Escanear:").pack(side=LEFT, padx=(0, 5))
+        self.scan_entry = ttk.Entry(scan_frame, bootstyle="success")
+        self.scan_entry.pack(side=LEFT, fill=X, expand=True)
+        self.scan_entry.bind("<Return>", self.escanear_codigo)
+        self.scan_entry.bind("<KP_Enter>", self.escanear_codigo)
+        self.scan_status_label = ttk.Label(scan_frame, text="", width=40)
+        self.scan_status_label.pack(side=LEFT, padx=(10, 0))
+
         # --- NUEVO FRAME PARA FILTROS ---
         filter_frame = ttk.Frame(self.products_frame)
         filter_frame.pack(fill=X, pady=5)
@@ -41,7 +72,9 @@ class POSView:
         ttk.Label(filter_frame, text="Categoría:").pack(side=LEFT, padx=(0, 5))
         self.combo_categorias = ttk.Combobox(filter_frame, state="readonly", width=20)
         self.combo_categorias.pack(side=LEFT)
-        self.combo_categorias.bind("<<ComboboxSelected>>", self.filtrar_productos)
+        self.combo_categorias.bind(
+            "<<ComboboxSelected>>", lambda e: self.filtrar_productos(inmediato=True)
+        )
 
         # Búsqueda por Texto
         ttk.Label(filter_frame, text="Buscar:", style="padding-left:10px;").pack(
@@ -50,6 +83,10 @@ class POSView:
         self.search_entry = ttk.Entry(filter_frame)
         self.search_entry.pack(side=LEFT, fill=X, expand=True)
         self.search_entry.bind("<KeyRelease>", self.filtrar_productos)
+        # La consulta corre en segundo plano; solo se pinta el último resultado.
+        self.buscador = DebouncedSearch(
+            self.search_entry, self._buscar_productos, self.mostrar_productos
+        )
 
         # Cargar categorías en el combobox
         self.cargar_categorias_combo()
@@ -57,7 +94,7 @@ class POSView:
         # --- FIN DE FILTROS ---
 
         columns = ("codigo", "nombre", "precio", "stock")
-        self.products_tree = ttk.Treeview(
+        self.products_tree = VirtualTreeview(
             self.products_frame, columns=columns, show="headings", bootstyle="primary"
         )
         self.products_tree.heading("codigo", text="Código")
@@ -111,10 +148,23 @@ class POSView:
         ).pack(fill=X, ipady=5, pady=(5, 0))
 
         self.cargar_productos()
+        self.scan_entry.focus_set()
+
+        self._programar_renovacion()
+        self.products_frame.bind("<Destroy>", self._al_cerrar_vista, add="+")
+
+    def refrescar(self):
+        """Al volver a la vista con productos o categorías modificados."""
+        categoria = self.combo_categorias.get()
+        self.cargar_categorias_combo()
+        if categoria in self.combo_categorias["values"]:
+            self.combo_categorias.set(categoria)
+        # Repite la búsqueda actual sin perder el carrito
+        self.filtrar_productos(inmediato=True)
 
     # --- NUEVO MÉTODO ---
     def cargar_categorias_combo(self):
-        self.categorias_map = {cat[1]: cat[0] for cat in obtener_categorias()}
+        self.categorias_map = {cat[1]: cat[0] for cat in catalogo.categorias()}
         # Añadimos la opción para ver todos los productos
         opciones = ["Mostrar Todas"] + list(self.categorias_map.keys())
         self.combo_categorias["values"] = opciones
@@ -122,48 +172,71 @@ class POSView:
 
     # --- MÉTODO MODIFICADO ---
     def cargar_productos(self, filtro_texto="", categoria_id=None):
-        # 1. Limpiamos la tabla
-        for item in self.products_tree.get_children():
-            self.products_tree.delete(item)
-
-        # 2. Obtenemos los productos de la BD
-        productos = obtener_productos(filtro=filtro_texto, categoria_id=categoria_id)
-
-        # 3. Iteramos y ajustamos el stock
-        for producto in productos:
-            # Los datos de la BD vienen así: (codigo, nombre, precio, stock)
-            codigo, nombre, precio, stock_bd = (
-                producto[0],
-                producto[1],
-                producto[2],
-                producto[3],
-            )
+        # Carga sincrónica (apertura de la vista, después de vender/cancelar);
+        # una búsqueda en segundo plano pendiente ya no debe pisar este resultado.
+        self.buscador.cancelar()
+        resultado = self._buscar_productos(filtro_texto, categoria_id)
+        if not filtro_texto and categoria_id is None and resultado[0] is not None:
+            # Sin filtros llegan todos los productos activos: se rehace el índice
+            self.indice_codigos = {}
+        self.mostrar_productos(resultado)
+
+    def _buscar_productos(self, filtro_texto, categoria_id):
+        # Se ejecuta en el hilo del buscador: solo consulta, no toca widgets.
+        if not filtro_texto:
+            # Sin texto la lista sale del catálogo en memoria
+            productos = catalogo.productos(categoria_id=categoria_id)
+        else:
+            productos = obtener_productos(filtro=filtro_texto, categoria_id=categoria_id)
+        # Las reservas cambian con cada caja: se leen siempre de la BD
+        return productos, obtener_reservas_ajenas(self.sesion_reserva)
+
+    def mostrar_productos(self, resultado):
+        productos, reservas_ajenas = resultado
+        productos = productos or []
+        if reservas_ajenas is not None:
+            self.reservas_ajenas = reservas_ajenas
+        # Toda fila recién leída de la BD también actualiza el índice del escáner
+        self._indexar_productos(productos)
+        # Solo se dibujan las filas visibles; el resto se agrega al hacer scroll.
+        self.products_tree.cargar_filas(
+            productos, formatear=self._formatear_producto, clave=lambda p: p[0]
+        )
 
-            # --- VERIFICACIÓN Y AJUSTE DEL STOCK ---
+    def _formatear_producto(self, producto):
+        # Los datos de la BD vienen así: (codigo, nombre, precio, stock)
+        codigo, nombre, precio, stock_bd = (
+            producto[0],
+            producto[1],
+            producto[2],
+            producto[3],
+        )
 
-            # Chequeamos si este producto ya está en el carrito
-            if codigo in self.carrito:
-                # Si está, restamos la cantidad que hay en el carrito al stock de la BD
-                cantidad_en_carrito = self.carrito[codigo]["cantidad"]
-                stock_visual = stock_bd - cantidad_en_carrito
+        # --- VERIFICACIÓN Y AJUSTE DEL STOCK ---
 
-                # Opcional: Aseguramos que el stock visual no sea negativo
-                if stock_visual < 0:
-                    stock_visual = 0
-            else:
-                # Si no está en el carrito, el stock visual es el de la BD
-                stock_visual = stock_bd
+        # Lo reservado por otras cajas no está disponible en esta
+        stock_bd -= self.reservas_ajenas.get(codigo, 0)
 
-            # ---------------------------------------
+        # Chequeamos si este producto ya está en el carrito
+        if codigo in self.carrito:
+            # Si está, restamos la cantidad que hay en el carrito al stock de la BD
+            cantidad_en_carrito = self.carrito[codigo]["cantidad"]
+            stock_visual = stock_bd - cantidad_en_carrito
 
-            # 4. Insertamos en el Treeview con el stock ajustado
-            # Usamos stock_visual en lugar de producto[3]
-            self.products_tree.insert(
-                "", END, values=(codigo, nombre, f"{precio:.2f}", stock_visual)
-            )
+            # Opcional: Aseguramos que el stock visual no sea negativo
+            if stock_visual < 0:
+                stock_visual = 0
+        else:
+            # Si no está en el carrito, el stock visual es el de la BD
+            stock_visual = max(stock_bd, 0)
+
+        # ---------------------------------------
+
+        # Usamos stock_visual en lugar de producto[3]
+        return (codigo, nombre, f"{precio:.2f}", stock_visual)
 
     # --- MÉTODO MODIFICADO Y RENOMBRADO ---
-    def filtrar_productos(self, event=None):
+    def filtrar_productos(self, event=None, inmediato=False):
         filtro_texto = self.search_entry.get().strip()
 
         categoria_nombre = self.combo_categorias.get()
@@ -171,7 +244,11 @@ class POSView:
         if categoria_nombre and categoria_nombre != "Mostrar Todas":
             categoria_id = self.categorias_map.get(categoria_nombre)
 
-        self.cargar_productos(filtro_texto=filtro_texto, categoria_id=categoria_id)
+        # Al tipear se espera a que el cajero haga una pausa (debounce)
+        if inmediato:
+            self.buscador.ejecutar_ahora(filtro_texto, categoria_id)
+        else:
+            self.buscador.solicitar(filtro_texto, categoria_id)
 
     def finalizar_venta(self):
         root_window = self.parent_frame.winfo_toplevel()  # Obtener la ventana principal
@@ -200,7 +277,12 @@ class POSView:
         deudor_id = resultado.get("deudor_id")
 
         venta_id = registrar_venta(
-            self.usuario_id, total, self.carrito, tipo_pago, deudor_id
+            self.usuario_id,
+            total,
+            self.carrito,
+            tipo_pago,
+            deudor_id,
+            sesion_reserva=self.sesion_reserva,
         )
 
         # --- INICIO DEL BLOQUE DE CÓDIGO MODIFICADO ---
@@ -209,7 +291,12 @@ class POSView:
         # Esto es importante para que el bloqueo afecte a toda la app.
         root_window = self.parent_frame.winfo_toplevel()
 
-        if venta_id:
+        if isinstance(venta_id, str):
+            # La venta no se registró (p. ej. otra caja vendió el stock): se
+            # muestran las líneas con problema y se refresca el stock visible.
+            messagebox.showerror("Error de Venta", venta_id, parent=root_window)
+            self.filtrar_productos(inmediato=True)
+        elif venta_id:
             # 2. Bloqueamos la ventana principal antes de mostrar los messageboxes
             root_window.grab_set()
 
@@ -235,8 +322,12 @@ class POSView:
             # 3. Desbloqueamos la ventana principal después de que el usuario interactúa
             root_window.grab_release()
 
-            self.cancelar_venta(confirmar=False)
-            self.filtrar_productos()  # Usamos el nuevo método de filtro para recargar
+            # Lo vendido es exactamente lo que había en el carrito: no hace
+            # falta volver a consultar los productos.
+            vendidos = {codigo: item["cantidad"] for codigo, item in self.carrito.items()}
+            self._vaciar_carrito()
+            self._descontar_vendidos(vendidos)
+            self.scan_entry.focus_set()
         else:
             messagebox.showerror(
                 "Error de Venta",
@@ -250,82 +341,131 @@ class POSView:
         if not seleccion:
             return
 
-        datos = self.products_tree.item(seleccion, "values")
-        codigo, nombre, precio_str, stock_visual_str = (
-            datos[0],
-            datos[1],
-            datos[2],
-            datos[3],
-        )
-
-        # Convertir a tipos numéricos
-        precio = float(precio_str)
-        stock_actual_visual = int(stock_visual_str)
+        # Se parte de la fila original y no de los valores de Tk, que convierte
+        # códigos numéricos a int (y "007" pasaría a ser 7).
+        codigo, nombre, precio, stock_bd = self.products_tree.fila(seleccion)[:4]
 
-        root_window = self.parent_frame.winfo_toplevel()
+        aviso = self._agregar_codigo_al_carrito(codigo, nombre, precio, stock_bd)
+        if aviso:
+            messagebox.showwarning(
+                *aviso, parent=self.parent_frame.winfo_toplevel()
+            )
 
+    def _agregar_codigo_al_carrito(self, codigo, nombre, precio, stock_bd):
+        """
+        Suma una unidad de `codigo` al carrito. Lo usan el doble clic y el
+        escáner. Devuelve None si se agregó o (título, mensaje) si no hay stock.
+        """
         # -------------------------------------------------------------------
         # 1. VALIDACIÓN DE STOCK
-        # La validación se hace siempre contra el stock visible (disponible)
-        if stock_actual_visual <= 0:
-            messagebox.showwarning(
-                "Sin Stock", f"'{nombre}' no tiene stock.", parent=root_window
-            )
-            return
+        # Primero contra lo que se conoce localmente (stock de la BD menos lo
+        # reservado por otras cajas y lo que ya está en el carrito)...
+        en_carrito = self.carrito.get(codigo)
+        cantidad_en_carrito = en_carrito["cantidad"] if en_carrito else 0
+        disponible = stock_bd - self.reservas_ajenas.get(codigo, 0)
+        if disponible - cantidad_en_carrito <= 0:
+            if en_carrito:
+                return ("Stock Insuficiente", f"Stock máximo para '{nombre}' alcanzado.")
+            return ("Sin Stock", f"'{nombre}' no tiene stock.")
+
+        # ...y después se reserva en la BD, que es la que decide entre cajas.
+        reserva = reservar_stock(self.sesion_reserva, codigo, cantidad_en_carrito + 1)
+        if isinstance(reserva, str):
+            return ("Stock Insuficiente", reserva.replace("Error: ", ""))
+        if not reserva:
+            return ("Error", "No se pudo reservar el stock. Intente de nuevo.")
 
         # -------------------------------------------------------------------
         # 2. PROCESO DE AGREGAR AL CARRITO
-
-        if codigo in self.carrito:
+        if en_carrito:
             # Producto ya en carrito: Sólo incrementamos la cantidad
-
-            # La validación debe ser contra el stock_original (el total de la BD)
-            if (
-                self.carrito[codigo]["cantidad"]
-                < self.carrito[codigo]["stock_original"]
-            ):
-                self.carrito[codigo]["cantidad"] += 1
-            else:
-                messagebox.showwarning(
-                    "Stock Insuficiente",
-                    f"Stock máximo para '{nombre}' alcanzado.",
-                    parent=root_window,
-                )
-                return
+            en_carrito["cantidad"] += 1
         else:
-            # Producto nuevo en carrito: Inicializamos el carrito
-
-            # --- CORRECCIÓN CLAVE ---
-            # El stock_original DEBE ser la suma del stock_actual_visual + la cantidad que ya hay en el carrito (1)
-            # para reflejar el stock real de la BD al momento de la carga.
-            stock_original_calculado = (
-                stock_actual_visual + 1
-            )  # Si visible es 1, original era 2. Si visible es 0, original era 1.
-
+            # Producto nuevo en carrito: el stock_original es el stock real de
+            # la BD al momento de la carga.
             self.carrito[codigo] = {
                 "nombre": nombre,
-                "precio": precio,
+                "precio": float(precio),
                 "cantidad": 1,
-                "stock_original": stock_original_calculado,  # Usamos el stock total que debería tener
+                "stock_original": stock_bd,
             }
 
         # -------------------------------------------------------------------
-        # 3. ACTUALIZAR VISTA DE PRODUCTOS (Ahora solo restamos 1 al stock visual)
-
-        # Simplemente restamos 1 al stock visible actual (porque ya validamos que hay al menos 1)
-        nuevo_stock_visual = stock_actual_visual - 1
-
-        # Obtener los valores actuales de la fila (Código, Nombre, Precio, Stock)
-        valores_actuales = list(datos)
-
-        # Sobrescribir solo el valor de Stock (índice 3) con el valor correcto
-        valores_actuales[3] = nuevo_stock_visual
-
-        # Aplicar los nuevos valores a la fila
-        self.products_tree.item(seleccion, values=tuple(valores_actuales))
+        # 3. ACTUALIZAR VISTA DE PRODUCTOS
+        # Se vuelve a formatear solo esta fila (si está dibujada): el stock
+        # visual sale del carrito.
+        self.products_tree.actualizar_fila(codigo)
 
         # 4. ACTUALIZAR VISTA DEL CARRITO
         self.actualizar_vista_carrito()
+        return None
+
+    # ========================================================================
+    # ESCÁNER DE CÓDIGOS DE BARRA
+    # ========================================================================
+    def _indexar_productos(self, productos):
+        """Actualiza el índice del escáner con filas (codigo, nombre, precio, stock)."""
+        for codigo, nombre, precio, stock in productos:
+            self.indice_codigos[str(codigo)] = (nombre, precio, stock)
+
+    def _descontar_vendidos(self, vendidos):
+        """
+        Baja el stock de los productos recién vendidos ({codigo: cantidad}) en
+        el índice del escáner y en la lista, sin volver a leer la BD.
+        """
+        for codigo, cantidad in vendidos.items():
+            producto = self.indice_codigos.get(str(codigo))
+            if producto is None:
+                continue
+            nombre, precio, stock = producto
+            stock = max(stock - cantidad, 0)
+            self.indice_codigos[str(codigo)] = (nombre, precio, stock)
+            # Vuelve a formatear la fila (si está en la lista) con el carrito ya vacío
+            self.products_tree.actualizar_fila(codigo, (codigo, nombre, precio, stock))
+
+    def _refrescar_indice(self, codigos):
+        """Vuelve a leer de la BD solo estos códigos (p. ej. los recién vendidos)."""
+        codigos = [str(c) for c in codigos]
+        filas = obtener_productos_por_codigos(codigos)
+        if filas is None:
+            return
+        for codigo in codigos:
+            # Los que ya no están activos salen del índice
+            self.indice_codigos.pop(codigo, None)
+        self._indexar_productos(filas)
+
+    def escanear_codigo(self, event=None):
+        codigo = self.scan_entry.get().strip()
+        self.scan_entry.delete(0, END)
+        if not codigo:
+            return "break"
+
+        producto = self.indice_codigos.get(codigo)
+        if producto is None:
+            # Código que no estaba en el índice (p. ej. producto recién creado)
+            self._refrescar_indice([codigo])
+            producto = self.indice_codigos.get(codigo)
+
+        if producto is None:
+            self._mostrar_estado_escaner(f"Código no encontrado: {codigo}", error=True)
+            return "break"
+
+        nombre, precio, stock_bd = producto
+        aviso = self._agregar_codigo_al_carrito(codigo, nombre, precio, stock_bd)
+        if aviso:
+            self._mostrar_estado_escaner(aviso[1], error=True)
+        else:
+            self._mostrar_estado_escaner(f"✔ {nombre}  ${float(precio):.2f}")
+        # Se corta el evento para que Enter no dispare otros bindings
+        return "break"
+
+    def _mostrar_estado_escaner(self, texto, error=False):
+        # Sin messagebox: un diálogo modal frenaría la siguiente lectura
+        self.scan_status_label.config(
+            text=texto, bootstyle="danger" if error else "success"
+        )
+        if error:
+            self.scan_entry.bell()
 
     def actualizar_vista_carrito(self):
         for item in self.cart_tree.get_children():
@@ -362,6 +502,7 @@ class POSView:
                 return
 
         self.carrito.clear()
+        liberar_reservas(self.sesion_reserva)
         self.actualizar_vista_carrito()
         self.restaurar_productos()
 
@@ -386,48 +527,47 @@ class POSView:
         # 2. Reducir la cantidad en el carrito (o eliminar si es 1)
         if self.carrito[codigo_a_modificar]["cantidad"] > 1:
             self.carrito[codigo_a_modificar]["cantidad"] -= 1
+            nueva_cantidad = self.carrito[codigo_a_modificar]["cantidad"]
         else:
             # Si la cantidad es 1, lo eliminamos completamente del carrito
             del self.carrito[codigo_a_modificar]
+            nueva_cantidad = 0
 
-        # 3. Calcular el nuevo stock visual que debe tener el producto
-
-        # Obtenemos el stock original (del ítem en el carrito antes de la eliminación)
-        # Si se eliminó (cantidad < 1), usamos el stock original guardado.
-        # Si no se eliminó, usamos el stock original y restamos la nueva cantidad.
-        stock_original_producto = self.carrito.get(codigo_a_modificar, {}).get(
-            "stock_original", self.obtener_stock_actual_bd(codigo_a_modificar)
-        )
-
-        stock_en_carrito = self.carrito.get(codigo_a_modificar, {}).get("cantidad", 0)
-        nuevo_stock_visual = stock_original_producto - stock_en_carrito
-
-        # 4. Actualizar la fila en la tabla de productos (self.products_tree)
+        # La reserva en la BD acompaña al carrito (0 la borra)
+        reservar_stock(self.sesion_reserva, codigo_a_modificar, nueva_cantidad)
 
-        # Necesitamos encontrar el identificador (iid) del producto en products_tree
-        item_iid_a_modificar = None
-        for iid in self.products_tree.get_children():
-            # El código está en la posición 0 de los 'values' del products_tree
-            if self.products_tree.item(iid, "values")[0] == codigo_a_modificar:
-                item_iid_a_modificar = iid
-                break
+        # 3. Actualizar la fila en la tabla de productos (el stock visual se
+        # recalcula a partir del carrito al volver a formatearla)
+        self.products_tree.actualizar_fila(codigo_a_modificar)
 
-        if item_iid_a_modificar:
-            # Obtener los valores actuales de la fila (Código, Nombre, Precio, Stock)
-            valores_actuales = list(
-                self.products_tree.item(item_iid_a_modificar, "values")
-            )
+        # 4. Actualizar la vista del carrito
+        self.actualizar_vista_carrito()
 
-            # Sobrescribir solo el valor de Stock (índice 3)
-            valores_actuales[3] = nuevo_stock_visual
+    # ========================================================================
+    # RESERVAS DE STOCK
+    # ========================================================================
+    def _programar_renovacion(self):
+        self._renovacion_id = self.parent_frame.after(
+            self.INTERVALO_RENOVACION_MS, self._renovar_reservas
+        )
 
-            # Aplicar los nuevos valores a la fila
-            self.products_tree.item(
-                item_iid_a_modificar, values=tuple(valores_actuales)
-            )
+    def _renovar_reservas(self):
+        # Mientras el carrito esté abierto sus reservas no deben vencer
+        if self.carrito:
+            renovar_reservas(self.sesion_reserva)
+        self._programar_renovacion()
 
-        # 5. Actualizar la vista del carrito
-        self.actualizar_vista_carrito()
+    def _al_cerrar_vista(self, event=None):
+        if event is not None and event.widget is not self.products_frame:
+            return
+        if self._renovacion_id is not None:
+            try:
+                self.parent_frame.after_cancel(self._renovacion_id)
+            except TclError:
+                pass
+            self._renovacion_id = None
+        if self.carrito:
+            liberar_reservas(self.sesion_reserva)
 
     def restaurar_productos(self):
         """Limpia los filtros de búsqueda y recarga todos los productos desde la BD."""
@@ -441,6 +581,11 @@ class POSView:
         # Esto usará los valores vacíos del search_entry y la categoría 0.
         self.cargar_productos(filtro_texto="", categoria_id=None)
 
+    def _vaciar_carrito(self):
+        self.carrito.clear()
+        liberar_reservas(self.sesion_reserva)
+        self.actualizar_vista_carrito()
+
     def cancelar_venta(self, confirmar=True):
         root_window = self.parent_frame.winfo_toplevel()  # Obtener la ventana principal
 
@@ -461,9 +606,8 @@ class POSView:
             ):
                 return
 
-        # 3. Limpia el carrito de datos y la vista del carrito
-        self.carrito.clear()
-        self.actualizar_vista_carrito()
+        # 3. Limpia el carrito de datos (y sus reservas) y la vista del carrito
+        self._vaciar_carrito()
 
         # 4. Llama al nuevo método para restaurar COMPLETAMENTE la vista de productos
         # Esto fuerza al Treeview a mostrar el stock original de la BD.
@@ -526,7 +670,7 @@ class PaymentDialog(BaseDialog):
         self.cargar_deudores()
 
     def cargar_deudores(self):
-        deudores_data = obtener_deudores()
+        deudores_data = catalogo.deudores()
         self.deudores_map = {d[1]: d[0] for d in deudores_data}
         self.combo_deudores["values"] = list(self.deudores_map.keys())
 
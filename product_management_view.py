@@ -3,17 +3,16 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from tkinter import messagebox, simpledialog
 from database import (
-    obtener_productos,
     obtener_producto_por_id,
     agregar_producto,
     actualizar_producto,
     desactivar_producto,
-    obtener_proveedores,
-    obtener_categorias,
     agregar_categoria,
     eliminar_categoria,
 )
 from base_dialog import BaseDialog
+from catalog_cache import catalogo
+from virtual_treeview import VirtualTreeview
 
 
 class ProductManagementView:
@@ -67,7 +66,7 @@ class ProductManagementView:
             "proveedor",
             "categoria",
         )
-        self.products_tree = ttk.Treeview(
+        self.products_tree = VirtualTreeview(
             self.parent_frame, columns=columns, show="headings", bootstyle="primary"
         )
 
@@ -92,72 +91,68 @@ class ProductManagementView:
         self.products_tree.pack(fill=BOTH, expand=True, padx=10, pady=10)
         self.cargar_productos()
 
-    def cargar_productos(self):
-        # Limpiar la tabla antes de cargar los productos
-        for item in self.products_tree.get_children():
-            self.products_tree.delete(item)
+    def refrescar(self):
+        self.cargar_productos()
 
+    def cargar_productos(self):
         # Obtener los productos de la base de datos
-        productos = obtener_productos(incluir_id=True)
+        productos = catalogo.productos(incluir_id=True)
 
-        if not productos:
-            return  # Si no hay productos, termina la función sin error
+        # La tabla dibuja solo las filas visibles y formatea cada una al mostrarla
+        self.products_tree.cargar_filas(
+            productos or [], formatear=self._formatear_producto, clave=lambda p: p[0]
+        )
 
-        # Insertar cada producto en el Treeview
-        for producto in productos:
-            try:
-                # Manejo seguro de valores nulos y posibles índices faltantes
-                id_val = (
-                    producto[0] if len(producto) > 0 and producto[0] is not None else ""
-                )
-                codigo_val = (
-                    producto[1] if len(producto) > 1 and producto[1] is not None else ""
-                )
-                nombre_val = (
-                    producto[2] if len(producto) > 2 and producto[2] is not None else ""
-                )
-                costo_val = (
-                    float(producto[3])
-                    if len(producto) > 3 and producto[3] is not None
-                    else 0.0
-                )
-                precio_val = (
-                    float(producto[4])
-                    if len(producto) > 4 and producto[4] is not None
-                    else 0.0
-                )
-                stock_val = (
-                    producto[5] if len(producto) > 5 and producto[5] is not None else 0
-                )
-                proveedor_val = (
-                    producto[6] if len(producto) > 6 and producto[6] is not None else ""
-                )
-                categoria_val = (
-                    producto[7] if len(producto) > 7 and producto[7] is not None else ""
-                )
+    def _formatear_producto(self, producto):
+        try:
+            # Manejo seguro de valores nulos y posibles índices faltantes
+            id_val = (
+                producto[0] if len(producto) > 0 and producto[0] is not None else ""
+            )
+            codigo_val = (
+                producto[1] if len(producto) > 1 and producto[1] is not None else ""
+            )
+            nombre_val = (
+                producto[2] if len(producto) > 2 and producto[2] is not None else ""
+            )
+            costo_val = (
+                float(producto[3])
+                if len(producto) > 3 and producto[3] is not None
+                else 0.0
+            )
+            precio_val = (
+                float(producto[4])
+                if len(producto) > 4 and producto[4] is not None
+                else 0.0
+            )
+            stock_val = (
+                producto[5] if len(producto) > 5 and producto[5] is not None else 0
+            )
+            proveedor_val = (
+                producto[6] if len(producto) > 6 and producto[6] is not None else ""
+            )
+            categoria_val = (
+                producto[7] if len(producto) > 7 and producto[7] is not None else ""
+            )
 
-                # Formatear costo y precio
-                costo_f = f"${costo_val:.2f}"
-                precio_f = f"${precio_val:.2f}"
-
-                # Insertar en el Treeview
-                self.products_tree.insert(
-                    "",
-                    END,
-                    values=(
-                        id_val,
-                        codigo_val,
-                        nombre_val,
-                        costo_f,
-                        precio_f,
-                        stock_val,
-                        proveedor_val,
-                        categoria_val,
-                    ),
-                )
+            # Formatear costo y precio
+            costo_f = f"${costo_val:.2f}"
+            precio_f = f"${precio_val:.2f}"
+
+            return (
+                id_val,
+                codigo_val,
+                nombre_val,
+                costo_f,
+                precio_f,
+                stock_val,
+                proveedor_val,
+                categoria_val,
+            )
 
-            except Exception as e:
-                print(f"Error al cargar producto: {e}")
+        except Exception as e:
+            print(f"Error al cargar producto: {e}")
+            return producto
 
     def abrir_formulario_producto(self, producto=None):
         # MODIFICADO: Pasamos self.usuario_id al formulario
@@ -256,8 +251,8 @@ class ProductForm(BaseDialog):
         self.callback = callback_actualizar
         self.usuario_id = usuario_id  # <--- ID del usuario para auditoría
 
-        self.proveedores_map = {prov[1]: prov[0] for prov in obtener_proveedores()}
-        self.categorias_map = {cat[1]: cat[0] for cat in obtener_categorias()}
+        self.proveedores_map = {prov[1]: prov[0] for prov in catalogo.proveedores()}
+        self.categorias_map = {cat[1]: cat[0] for cat in catalogo.categorias()}
 
         form_frame = ttk.Frame(self, padding=20)
         form_frame.pack(expand=True, fill=BOTH)
@@ -463,7 +458,7 @@ class CategoryManagerDialog(BaseDialog):
     def cargar_categorias(self):
         for i in self.tree.get_children():
             self.tree.delete(i)
-        for cat in obtener_categorias():
+        for cat in catalogo.categorias():
             self.tree.insert("", END, values=cat)
 
     def anadir_categoria(self):
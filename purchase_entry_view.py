@@ -3,7 +3,8 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 import tkinter as tk  # Necesario para StringVar
 from tkinter import messagebox
-from database import obtener_proveedores, obtener_productos, registrar_compra
+from database import obtener_productos, registrar_compra
+from catalog_cache import catalogo
 
 
 # =============================================================================
@@ -117,7 +118,7 @@ class PurchaseEntryView:
         )
 
         # --- INICIO DE CORRECCIÓN: INCLUIR OPCIÓN "Mostrar Todos" ---
-        proveedores = {p[1]: p[0] for p in obtener_proveedores()}
+        proveedores = {p[1]: p[0] for p in catalogo.proveedores()}
         self.proveedores_map = proveedores
 
         nombres_proveedores = list(proveedores.keys())
@@ -208,6 +209,14 @@ class PurchaseEntryView:
 
         self.cargar_productos()
 
+    def refrescar(self):
+        """Al volver a la vista: relee proveedores y stock sin tocar la compra en curso."""
+        self.proveedores_map = {p[1]: p[0] for p in catalogo.proveedores()}
+        self.combo_proveedor.config(values=["Mostrar Todos"] + list(self.proveedores_map.keys()))
+        if self.combo_proveedor.get() not in self.proveedores_map:
+            self.combo_proveedor.set("Mostrar Todos")
+        self.buscar_producto()
+
     # --- FILTRAR Y CARGAR PRODUCTOS ---
     def filtrar_por_proveedor(self, event=None):
         proveedor_nombre = self.combo_proveedor.get()
@@ -223,7 +232,11 @@ class PurchaseEntryView:
     def cargar_productos(self, filtro="", proveedor_id=None):
         for i in self.products_tree.get_children():
             self.products_tree.delete(i)
-        for p in obtener_productos(filtro=filtro, proveedor_id=proveedor_id):
+        if filtro:
+            productos = obtener_productos(filtro=filtro, proveedor_id=proveedor_id)
+        else:
+            productos = catalogo.productos(proveedor_id=proveedor_id)
+        for p in productos or []:
             self.products_tree.insert("", END, values=(p[0], p[1], p[3]))
 
     def buscar_producto(self, event=None):
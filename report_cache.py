@@ -0,0 +1,135 @@
+# report_cache.py
+import threading
+from collections import OrderedDict
+from datetime import date
+from database import (
+    obtener_versiones,
+    obtener_ventas_por_rango,
+    obtener_compras_por_rango,
+    obtener_productos_mas_vendidos,
+    obtener_reporte_ganancias,
+    obtener_ganancias_por_producto,
+)
+
+
+class ReportCache:
+    """
+    Resultados de los reportes por rango de fechas, guardados en memoria (LRU)
+    para que cambiar de reporte o volver a un rango ya consultado no repita
+    las consultas.
+
+    La clave es (reporte, fecha_inicio, fecha_fin, versión de los datos):
+    - Período abierto (llega hasta hoy): depende de las secciones que escriben
+      ventas/compras; cualquier venta nueva lo invalida.
+    - Período cerrado (termina antes de hoy): las ventas, compras y
+      devoluciones nuevas siempre caen en el día actual, así que solo lo
+      invalidan "historico" (reconstrucción de resúmenes, renombrar
+      productos), los nombres que muestra y los cambios externos.
+
+    Se limita por cantidad de entradas y por total de filas guardadas. Las
+    listas devueltas son compartidas: no deben modificarse.
+    """
+
+    MAX_ENTRADAS = 64
+    MAX_FILAS = 200000
+
+    def __init__(self, max_entradas=MAX_ENTRADAS, max_filas=MAX_FILAS):
+        self.max_entradas = max_entradas
+        self.max_filas = max_filas
+        self._entradas = OrderedDict()  # clave -> (datos, filas)
+        self._filas = 0
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    @staticmethod
+    def periodo_cerrado(fecha_fin):
+        """True si el rango termina antes de hoy (fechas AAAA-MM-DD)."""
+        try:
+            return date.fromisoformat(str(fecha_fin)[:10]) < date.today()
+        except ValueError:
+            return False
+
+    def _obtener(self, nombre, consulta, fecha_inicio, fecha_fin, secciones, nombres):
+        if self.periodo_cerrado(fecha_fin):
+            version = ("cerrado",) + obtener_versiones("historico", *nombres)
+        else:
+            version = ("abierto",) + obtener_versiones(*secciones, *nombres)
+        clave = (nombre, fecha_inicio, fecha_fin, version)
+
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is not None:
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return entrada[0]
+            self.fallos += 1
+
+        datos = consulta(fecha_inicio, fecha_fin)
+        if datos is None:
+            # Error de base de datos: no se guarda
+            return None
+        filas = len(datos) if isinstance(datos, list) else 1
+        if filas > self.max_filas:
+            return datos
+
+        with self._lock:
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._filas -= anterior[1]
+            self._entradas[clave] = (datos, filas)
+            self._filas += filas
+            while len(self._entradas) > self.max_entradas or self._filas > self.max_filas:
+                _, (_, filas_viejas) = self._entradas.popitem(last=False)
+                self._filas -= filas_viejas
+        return datos
+
+    def invalidar(self):
+        """Descarta todo lo guardado."""
+        with self._lock:
+            self._entradas.clear()
+            self._filas = 0
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "entradas": len(self._entradas),
+                "filas": self._filas,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+            }
+
+    # --- Reportes ---
+    def ventas_por_rango(self, fecha_inicio, fecha_fin):
+        return self._obtener(
+            "ventas", obtener_ventas_por_rango, fecha_inicio, fecha_fin,
+            ("ventas",), ("usuarios",),
+        )
+
+    def compras_por_rango(self, fecha_inicio, fecha_fin):
+        return self._obtener(
+            "compras", obtener_compras_por_rango, fecha_inicio, fecha_fin,
+            ("compras",), ("proveedores",),
+        )
+
+    def productos_mas_vendidos(self, fecha_inicio, fecha_fin):
+        return self._obtener(
+            "top_productos", obtener_productos_mas_vendidos, fecha_inicio, fecha_fin,
+            ("ventas", "devoluciones", "historico"), (),
+        )
+
+    def reporte_ganancias(self, fecha_inicio, fecha_fin):
+        return self._obtener(
+            "ganancias", obtener_reporte_ganancias, fecha_inicio, fecha_fin,
+            ("ventas", "devoluciones", "historico"), (),
+        )
+
+    def ganancias_por_producto(self, fecha_inicio, fecha_fin):
+        return self._obtener(
+            "ganancias_producto", obtener_ganancias_por_producto, fecha_inicio, fecha_fin,
+            ("ventas", "devoluciones", "historico"), (),
+        )
+
+
+# Instancia única del proceso
+reportes = ReportCache()
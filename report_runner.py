@@ -0,0 +1,108 @@
+# report_runner.py
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tkinter import TclError
+from database import progreso_lectura
+
+
+class _Trabajo:
+    def __init__(self, tarea, al_terminar, args):
+        self.tarea = tarea
+        self.al_terminar = al_terminar
+        self.args = args
+        self.cancelado = False
+        self.pasos = 0
+        self.inicio = time.monotonic()
+
+
+class ReportRunner:
+    """
+    Ejecuta las consultas de reportes en un pool de hilos, fuera del hilo de Tk.
+
+    - Cada hilo usa su propia conexión de lectura (query_only) del pool de
+      database.py.
+    - Un reporte nuevo cancela el anterior: el progress handler de SQLite
+      interrumpe la consulta en curso en cuanto ve el trabajo cancelado.
+    - Mientras hay un trabajo en curso se llama a `al_progreso(segundos)` en
+      el hilo de Tk; al terminar, `al_progreso(None)`.
+    - El resultado se entrega con `al_terminar(resultado)` en el hilo de Tk.
+    """
+
+    INTERVALO_SONDEO_MS = 100
+    INSTRUCCIONES_POR_AVISO = 10000  # cada cuántas instrucciones de SQLite se revisa la cancelación
+
+    def __init__(self, widget, al_progreso=None, max_hilos=2):
+        self.widget = widget
+        self.al_progreso = al_progreso
+        self._ejecutor = ThreadPoolExecutor(max_workers=max_hilos, thread_name_prefix="reportes")
+        self._resultados = queue.Queue()
+        self._actual = None
+        self._sondeando = False
+        self.widget.bind("<Destroy>", lambda e: self.detener(), add="+")
+
+    @property
+    def ocupado(self):
+        return self._actual is not None
+
+    def ejecutar(self, tarea, al_terminar, *args):
+        """Corre `tarea(*args)` en segundo plano, cancelando el reporte anterior."""
+        self.cancelar()
+        trabajo = _Trabajo(tarea, al_terminar, args)
+        self._actual = trabajo
+        self._ejecutor.submit(self._correr, trabajo)
+        if not self._sondeando:
+            self._sondeando = True
+            self._sondear()
+
+    def cancelar(self):
+        """Cancela el reporte en curso (su resultado se descarta)."""
+        if self._actual is not None:
+            self._actual.cancelado = True
+            self._actual = None
+
+    def _correr(self, trabajo):
+        # Hilo del pool: no toca widgets.
+        if trabajo.cancelado:
+            return
+
+        def revisar():
+            trabajo.pasos += 1
+            return trabajo.cancelado
+
+        try:
+            with progreso_lectura(revisar, self.INSTRUCCIONES_POR_AVISO):
+                resultado = trabajo.tarea(*trabajo.args)
+        except Exception as e:
+            print(f"Error al generar el reporte: {e}")
+            resultado = None
+        self._resultados.put((trabajo, resultado))
+
+    def _sondear(self):
+        try:
+            while True:
+                trabajo, resultado = self._resultados.get_nowait()
+                if trabajo is self._actual and not trabajo.cancelado:
+                    self._actual = None
+                    if self.al_progreso:
+                        self.al_progreso(None)
+                    trabajo.al_terminar(resultado)
+        except queue.Empty:
+            pass
+
+        if self._actual is None:
+            self._sondeando = False
+            if self.al_progreso:
+                self.al_progreso(None)
+            return
+
+        if self.al_progreso:
+            self.al_progreso(time.monotonic() - self._actual.inicio)
+        try:
+            self.widget.after(self.INTERVALO_SONDEO_MS, self._sondear)
+        except TclError:
+            self._sondeando = False  # El widget ya no existe
+
+    def detener(self):
+        self.cancelar()
+        self._ejecutor.shutdown(wait=False, cancel_futures=True)
@@ -1,17 +1,22 @@
 # reports_view.py
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
+import time
 from datetime import date
-from tkinter import messagebox
-from database import (obtener_ventas_por_rango, obtener_productos_mas_vendidos, 
-                      obtener_detalle_de_venta, obtener_reporte_ganancias, 
-                      obtener_compras_por_rango, obtener_ganancias_por_producto,
-                      obtener_detalle_de_compra)
+from tkinter import messagebox, filedialog
+from database import obtener_detalle_de_venta, obtener_detalle_de_compra
+from report_cache import reportes
+from virtual_treeview import VirtualTreeview
+from report_runner import ReportRunner
+from export_engine import ExportJob, formatos_disponibles
 
 class ReportsView:
     def __init__(self, parent_frame):
         self.parent_frame = parent_frame
         self.active_report_method = None
+        self.exportacion = None
+        self._refrescando = False          # el reporte lo pide refrescar(), no el usuario
+        self._resultado_silencioso = False  # el resultado en pantalla vino de un refresco
 
         ttk.Label(self.parent_frame, text="Reportes", font=("Helvetica", 16, "bold")).pack(pady=10)
 
@@ -35,6 +40,13 @@ class ReportsView:
         ttk.Button(button_frame, text="Ver Compras", command=self.mostrar_reporte_compras, bootstyle="warning").pack(side=LEFT, padx=10)
         ttk.Button(button_frame, text="Top Productos", command=self.mostrar_reporte_top_productos, bootstyle="info").pack(side=LEFT)
         ttk.Button(button_frame, text="Calcular Ganancias", command=self.mostrar_reporte_ganancias, bootstyle="success").pack(side=LEFT, padx=10)
+        ttk.Button(button_frame, text="Exportar", command=self.exportar_reporte, bootstyle="secondary-outline").pack(side=LEFT)
+
+        # --- Estado del reporte en curso (corre en segundo plano) ---
+        self.estado_label = ttk.Label(button_frame, text="")
+        self.estado_label.pack(side=RIGHT)
+        self.progreso = ttk.Progressbar(button_frame, mode="indeterminate", length=120, bootstyle="info-striped")
+        self.runner = ReportRunner(self.parent_frame, al_progreso=self.mostrar_progreso)
 
         # --- Frame principal de resultados ---
         results_frame = ttk.Frame(self.parent_frame)
@@ -42,7 +54,7 @@ class ReportsView:
         
         main_tree_frame = ttk.Frame(results_frame)
         main_tree_frame.pack(fill=BOTH, expand=True, pady=(0, 10))
-        self.main_tree = ttk.Treeview(main_tree_frame, show='headings')
+        self.main_tree = VirtualTreeview(main_tree_frame, show='headings')
         self.main_tree.pack(side=LEFT, fill=BOTH, expand=True)
         self.main_tree.bind("<<TreeviewSelect>>", self.mostrar_detalle_seleccion)
         main_scrollbar = ttk.Scrollbar(main_tree_frame, orient=VERTICAL, command=self.main_tree.yview)
@@ -55,7 +67,7 @@ class ReportsView:
         self.detail_label.pack(pady=(0,5), anchor="w")
         detail_tree_inner_frame = ttk.Frame(detail_tree_frame)
         detail_tree_inner_frame.pack(fill=BOTH, expand=True)
-        self.detail_tree = ttk.Treeview(detail_tree_inner_frame, show='headings', bootstyle="info")
+        self.detail_tree = VirtualTreeview(detail_tree_inner_frame, show='headings', bootstyle="info")
         self.detail_tree.pack(side=LEFT, fill=BOTH, expand=True)
         detail_scrollbar = ttk.Scrollbar(detail_tree_inner_frame, orient=VERTICAL, command=self.detail_tree.yview)
         detail_scrollbar.pack(side=RIGHT, fill=Y)
@@ -76,7 +88,7 @@ class ReportsView:
     def _configurar_treeview(self, tree, columnas_config):
         """Función central para configurar las columnas de cualquier tabla."""
         # Limpiar cualquier configuración de columnas anterior (importante para evitar residuos)
-        tree.delete(*tree.get_children())
+        tree.limpiar()
         tree.config(columns=list(columnas_config.keys()))
 
         for col_id, props in columnas_config.items():
@@ -90,14 +102,102 @@ class ReportsView:
                 stretch=props.get('stretch', False)  # Si la columna se estira o no
             )
     
+    def mostrar_progreso(self, segundos):
+        """Llamado por el runner: segundos transcurridos, o None al terminar."""
+        if segundos is None:
+            self.progreso.stop()
+            self.progreso.pack_forget()
+            if self.estado_label.cget("text").startswith("Generando"):
+                self.estado_label.config(text="")
+            return
+        if not self.progreso.winfo_ismapped():
+            self.progreso.pack(side=RIGHT, padx=10)
+            self.progreso.start(15)
+        self.estado_label.config(text=f"Generando reporte... {segundos:.1f} s")
+
+    def _ejecutar_reporte(self, tarea, al_terminar):
+        """Corre `tarea(fecha_inicio, fecha_fin)` en segundo plano; un reporte nuevo cancela el anterior."""
+        fecha_inicio, fecha_fin = self.fecha_inicio_entry.entry.get(), self.fecha_fin_entry.entry.get()
+        inicio = time.monotonic()
+        silencioso = self._refrescando
+
+        def terminar(resultado):
+            self.estado_label.config(text=f"Reporte generado en {time.monotonic() - inicio:.1f} s")
+            self._resultado_silencioso = silencioso
+            al_terminar(resultado)
+
+        self.runner.ejecutar(tarea, terminar, fecha_inicio, fecha_fin)
+
+    def exportar_reporte(self):
+        """Exporta el reporte activo (todo el rango, directo desde la base) a CSV o XLSX."""
+        exportaciones = {
+            self.mostrar_reporte_ventas: "ventas",
+            self.mostrar_reporte_compras: "compras",
+            self.mostrar_reporte_top_productos: "top_productos",
+            self.mostrar_reporte_ganancias: "ganancias",
+        }
+        nombre = exportaciones.get(self.active_report_method)
+        if nombre is None:
+            messagebox.showwarning("Sin Reporte", "Primero genere un reporte.", parent=self.parent_frame)
+            return
+        if self.exportacion is not None:
+            messagebox.showwarning("Exportación en curso", "Espere a que termine la exportación actual.", parent=self.parent_frame)
+            return
+        if nombre == "ventas" and messagebox.askyesno(
+            "Exportar Ventas", "¿Incluir el detalle de productos de cada venta?", parent=self.parent_frame
+        ):
+            nombre = "detalle_ventas"
+
+        fecha_inicio, fecha_fin = self.fecha_inicio_entry.entry.get(), self.fecha_fin_entry.entry.get()
+        ruta = filedialog.asksaveasfilename(
+            defaultextension=".csv",
+            filetypes=formatos_disponibles(),
+            initialfile=f"{nombre}_{fecha_inicio}_{fecha_fin}.csv",
+            parent=self.parent_frame
+        )
+        if not ruta:
+            return
+
+        def al_terminar(resultado):
+            self.exportacion = None
+            if isinstance(resultado, str):
+                self.estado_label.config(text="")
+                messagebox.showerror("Error", f"Error al exportar:\n{resultado}", parent=self.parent_frame)
+                return
+            self.estado_label.config(text=f"Exportadas {resultado} filas")
+            messagebox.showinfo("Éxito", f"{resultado} filas exportadas a:\n{ruta}", parent=self.parent_frame)
+
+        self.estado_label.config(text="Exportando...")
+        self.exportacion = ExportJob(
+            self.parent_frame, nombre, ruta,
+            lambda filas: self.estado_label.config(text=f"Exportando... {filas} filas"),
+            al_terminar,
+            fecha_inicio=fecha_inicio, fecha_fin=fecha_fin
+        )
+
     def actualizar_reporte_automatico(self, event=None):
         if self.active_report_method:
             self.active_report_method()
 
+    def refrescar(self):
+        # Los resultados sin cambios salen de report_cache. El usuario no pidió
+        # este reporte: si ahora está vacío no se le muestra un diálogo.
+        self._refrescando = True
+        try:
+            self.actualizar_reporte_automatico()
+        finally:
+            self._refrescando = False
+
+    def _sin_resultados(self, mensaje):
+        if self._resultado_silencioso:
+            self.estado_label.config(text=mensaje)
+        else:
+            messagebox.showinfo("Sin Resultados", mensaje, parent=self.parent_frame)
+
     def limpiar_vistas(self):
         """Limpia ambas tablas y las etiquetas de resumen, y resetea las columnas."""
-        self.main_tree.delete(*self.main_tree.get_children())
-        self.detail_tree.delete(*self.detail_tree.get_children())
+        self.main_tree.limpiar()
+        self.detail_tree.limpiar()
         
         # Es crucial resetear las columnas para que _configurar_treeview las cree desde cero
         self.main_tree.config(columns=[]) 
@@ -120,13 +220,13 @@ class ReportsView:
             'total':   {'text': 'Total',        'width': 120, 'anchor': 'e', 'head_anchor': 'e'} # 'e' para derecha
         }
         self._configurar_treeview(self.main_tree, columnas)
-        
-        ventas = obtener_ventas_por_rango(self.fecha_inicio_entry.entry.get(), self.fecha_fin_entry.entry.get())
+        self._ejecutar_reporte(reportes.ventas_por_rango, self._mostrar_ventas)
+
+    def _mostrar_ventas(self, ventas):
         if not ventas:
-            messagebox.showinfo("Sin Resultados", "No se encontraron ventas en el período.", parent=self.parent_frame)
+            self._sin_resultados("No se encontraron ventas en el período.")
             return
-        for venta in ventas:
-            self.main_tree.insert('', END, values=(venta[0], venta[1], venta[2], f"${venta[3]:.2f}"))
+        self.main_tree.cargar_filas(ventas, formatear=lambda v: (v[0], v[1], v[2], f"${v[3]:.2f}"))
     
     def mostrar_reporte_compras(self):
         self.active_report_method = self.mostrar_reporte_compras
@@ -139,13 +239,13 @@ class ReportsView:
             'total':     {'text': 'Total Costo', 'width': 120, 'anchor': 'e', 'head_anchor': 'e'}
         }
         self._configurar_treeview(self.main_tree, columnas)
+        self._ejecutar_reporte(reportes.compras_por_rango, self._mostrar_compras)
 
-        compras = obtener_compras_por_rango(self.fecha_inicio_entry.entry.get(), self.fecha_fin_entry.entry.get())
+    def _mostrar_compras(self, compras):
         if not compras:
-            messagebox.showinfo("Sin Resultados", "No se encontraron compras en el período.", parent=self.parent_frame)
+            self._sin_resultados("No se encontraron compras en el período.")
             return
-        for compra in compras:
-            self.main_tree.insert('', END, values=(compra[0], compra[1], compra[2], f"${compra[3]:.2f}"))
+        self.main_tree.cargar_filas(compras, formatear=lambda c: (c[0], c[1], c[2], f"${c[3]:.2f}"))
 
     def mostrar_reporte_top_productos(self):
         self.active_report_method = self.mostrar_reporte_top_productos
@@ -156,16 +256,16 @@ class ReportsView:
             'cantidad': {'text': 'Cantidad Vendida', 'width': 150, 'anchor': CENTER, 'head_anchor': CENTER}
         }
         self._configurar_treeview(self.main_tree, columnas)
-        
-        productos = obtener_productos_mas_vendidos(self.fecha_inicio_entry.entry.get(), self.fecha_fin_entry.entry.get())
+        self._ejecutar_reporte(reportes.productos_mas_vendidos, self._mostrar_top_productos)
+
+    def _mostrar_top_productos(self, productos):
         if not productos:
-            messagebox.showinfo("Sin Resultados", "No se vendieron productos en el período.", parent=self.parent_frame)
+            self._sin_resultados("No se vendieron productos en el período.")
             return
-        for producto in productos:
-            self.main_tree.insert('', END, values=producto)
+        self.main_tree.cargar_filas(productos)
     
     def mostrar_detalle_seleccion(self, event=None):
-        self.detail_tree.delete(*self.detail_tree.get_children())
+        self.detail_tree.limpiar()
         seleccion = self.main_tree.focus()
         if not seleccion: return
         
@@ -187,7 +287,7 @@ class ReportsView:
             self._configurar_treeview(self.detail_tree, columnas)
             
             detalles = obtener_detalle_de_venta(id_seleccionado)
-            for d in detalles: self.detail_tree.insert('', END, values=(d[0], d[1], f"${d[2]:.2f}"))
+            self.detail_tree.cargar_filas(detalles, formatear=lambda d: (d[0], d[1], f"${d[2]:.2f}"))
         
         elif columnas_actuales == ('id', 'fecha', 'proveedor', 'total'):
             self.detail_label.config(text=f"Detalle de Compra #{id_seleccionado}")
@@ -200,17 +300,26 @@ class ReportsView:
             self._configurar_treeview(self.detail_tree, columnas)
             
             detalles = obtener_detalle_de_compra(id_seleccionado)
-            for d in detalles: self.detail_tree.insert('', END, values=(d[0], d[1], f"${d[2]:.2f}", f"${d[3]:.2f}"))
+            self.detail_tree.cargar_filas(detalles, formatear=lambda d: (d[0], d[1], f"${d[2]:.2f}", f"${d[3]:.2f}"))
 
     def mostrar_reporte_ganancias(self):
         self.active_report_method = self.mostrar_reporte_ganancias
         self.limpiar_vistas()
-        
-        fecha_inicio, fecha_fin = self.fecha_inicio_entry.entry.get(), self.fecha_fin_entry.entry.get()
-        reporte_general = obtener_reporte_ganancias(fecha_inicio, fecha_fin)
+        self._ejecutar_reporte(self._consultar_ganancias, self._mostrar_ganancias)
+
+    @staticmethod
+    def _consultar_ganancias(fecha_inicio, fecha_fin):
+        # Hilo del runner: las dos consultas del reporte, sin tocar widgets.
+        reporte_general = reportes.reporte_ganancias(fecha_inicio, fecha_fin)
+        if not reporte_general or reporte_general.get('total_ventas', 0) == 0:
+            return reporte_general, []
+        return reporte_general, reportes.ganancias_por_producto(fecha_inicio, fecha_fin)
+
+    def _mostrar_ganancias(self, resultado):
+        reporte_general, reporte_productos = resultado or (None, [])
         
         if not reporte_general or reporte_general.get('total_ventas', 0) == 0:
-            messagebox.showinfo("Sin Resultados", "No hay datos para calcular ganancias.", parent=self.parent_frame)
+            self._sin_resultados("No hay datos para calcular ganancias.")
             return
             
         total_ventas, ganancia_neta = reporte_general['total_ventas'], reporte_general['ganancia_neta']
@@ -229,6 +338,7 @@ class ReportsView:
         }
         self._configurar_treeview(self.main_tree, columnas)
 
-        reporte_productos = obtener_ganancias_por_producto(fecha_inicio, fecha_fin)
-        for prod in reporte_productos:
-            self.main_tree.insert('', END, values=(prod[0], prod[1], f"${prod[2]:.2f}", f"${prod[3]:.2f}", f"${prod[4]:.2f}"))
\ No newline at end of file
+        self.main_tree.cargar_filas(
+            reporte_productos or [],
+            formatear=lambda p: (p[0], p[1], f"${p[2]:.2f}", f"${p[3]:.2f}", f"${p[4]:.2f}"),
+        )
@@ -56,6 +56,12 @@ class SalesHistoryView:
         
         self.cargar_historial()
 
+    def refrescar(self):
+        """Al volver a la vista después de nuevas ventas o devoluciones."""
+        self.cargar_historial()
+        for item in self.details_tree.get_children():
+            self.details_tree.delete(item)
+
     def cargar_historial(self):
         for item in self.history_tree.get_children():
             self.history_tree.delete(item)
@@ -3,13 +3,13 @@ import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from tkinter import messagebox
 from database import (
-    obtener_proveedores,
     obtener_proveedor_por_id,
     agregar_proveedor,
     actualizar_proveedor,
     desactivar_proveedor,  # ✅ CAMBIADO: antes era eliminar_proveedor
 )
 from base_dialog import BaseDialog
+from catalog_cache import catalogo
 
 
 class SupplierManagementView:
@@ -65,10 +65,13 @@ class SupplierManagementView:
 
         self.cargar_proveedores()
 
+    def refrescar(self):
+        self.cargar_proveedores()
+
     def cargar_proveedores(self):
         for item in self.tree.get_children():
             self.tree.delete(item)
-        for supplier in obtener_proveedores():
+        for supplier in catalogo.proveedores():
             self.tree.insert("", END, values=supplier)
 
     def abrir_formulario(self, proveedor=None):
@@ -1,12 +1,18 @@
 # ticket_generator.py
 import os
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.lib.units import mm
 from database import obtener_info_venta, obtener_detalle_de_venta
 
+
+def cargar_reportlab():
+    """Importa reportlab (lento) recién cuando hace falta; ver main.precargar_modulos."""
+    from reportlab.pdfgen import canvas
+    from reportlab.lib.units import mm
+    return canvas, mm
+
+
 def generar_ticket_pdf(venta_id):
     try:
+        canvas, mm = cargar_reportlab()
         info_venta = obtener_info_venta(venta_id)
         detalles_venta = obtener_detalle_de_venta(venta_id)
 
@@ -2,7 +2,8 @@
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 from tkinter import messagebox
-from database import obtener_usuarios, agregar_usuario, actualizar_contrasena, eliminar_usuario
+from database import obtener_usuarios, eliminar_usuario
+from auth_service import AuthService
 from base_dialog import BaseDialog
 
 class UserManagementView:
@@ -36,6 +37,9 @@ class UserManagementView:
         
         self.cargar_usuarios()
 
+    def refrescar(self):
+        self.cargar_usuarios()
+
     def cargar_usuarios(self):
         for item in self.users_tree.get_children():
             self.users_tree.delete(item)
@@ -44,7 +48,8 @@ class UserManagementView:
 
     def abrir_formulario_usuario(self):
         # --- CORRECCIÓN: Se añade wait_window ---
-        form = UserForm(parent=self.parent_frame, callback_actualizar=self.cargar_usuarios)
+        form = UserForm(parent=self.parent_frame, callback_actualizar=self.cargar_usuarios,
+                        usuario_admin_id=self.usuario_id)
         self.parent_frame.wait_window(form)
 
     def cambiar_contrasena_seleccionada(self):
@@ -71,6 +76,7 @@ class UserManagementView:
             user_id=id_usuario,
             username=nombre_usuario,
             callback_actualizar=self.cargar_usuarios,
+            usuario_admin_id=self.usuario_id,
         )
 
         # 3. Bloqueamos la ventana principal (root_window) hasta que el formulario (form) se cierre.
@@ -129,9 +135,11 @@ class UserManagementView:
 
 
 class UserForm(BaseDialog):
-    def __init__(self, parent, callback_actualizar):
+    def __init__(self, parent, callback_actualizar, usuario_admin_id=None):
         super().__init__(parent, title="Añadir Nuevo Usuario")
         self.callback = callback_actualizar
+        self.usuario_admin_id = usuario_admin_id
+        self.auth = AuthService(self)
         
         form_frame = ttk.Frame(self, padding=20)
         form_frame.pack(expand=True, fill=BOTH)
@@ -149,7 +157,8 @@ class UserForm(BaseDialog):
         self.combo_rol.grid(row=2, column=1, pady=5)
         self.combo_rol.set("usuario") 
         
-        ttk.Button(form_frame, text="Guardar", command=self.guardar, bootstyle="success").grid(row=3, column=0, columnspan=2, pady=15)
+        self.btn_guardar = ttk.Button(form_frame, text="Guardar", command=self.guardar, bootstyle="success")
+        self.btn_guardar.grid(row=3, column=0, columnspan=2, pady=15)
 
     def guardar(self):
         username = self.entry_username.get()
@@ -158,21 +167,26 @@ class UserForm(BaseDialog):
         if not all([username, password, rol]):
             messagebox.showerror("Campos Vacíos", "Todos los campos son obligatorios.", parent=self)
             return
-        # NOTA: La adición de un usuario podría auditarse, pero a menudo no es estrictamente necesario,
-        # ya que la acción se refleja en la propia tabla de usuarios. Por ahora, mantenemos solo la eliminación auditada.
-        resultado = agregar_usuario(username, password, rol)
+        # El hash se calcula en segundo plano; la creación queda auditada
+        if self.auth.crear_usuario(self.usuario_admin_id, username, password, rol, self._usuario_creado):
+            self.btn_guardar.config(state=DISABLED, text="Guardando...")
+
+    def _usuario_creado(self, resultado):
         if resultado is True:
             messagebox.showinfo("Éxito", "Usuario creado.", parent=self)
             self.callback()
             self.destroy()
         else:
-            messagebox.showerror("Error", str(resultado), parent=self)
+            self.btn_guardar.config(state=NORMAL, text="Guardar")
+            messagebox.showerror("Error", str(resultado or "No se pudo crear el usuario."), parent=self)
 
 class PasswordForm(BaseDialog):
-    def __init__(self, parent, user_id, username, callback_actualizar):
+    def __init__(self, parent, user_id, username, callback_actualizar, usuario_admin_id=None):
         super().__init__(parent, title=f"Cambiar Contraseña para '{username}'")
         self.user_id = user_id
         self.callback = callback_actualizar
+        self.usuario_admin_id = usuario_admin_id
+        self.auth = AuthService(self)
         
         form_frame = ttk.Frame(self, padding=20)
         form_frame.pack(expand=True, fill=BOTH)
@@ -181,7 +195,8 @@ class PasswordForm(BaseDialog):
         self.entry_password = ttk.Entry(form_frame, width=30, show="●")
         self.entry_password.grid(row=0, column=1, pady=5)
         
-        ttk.Button(form_frame, text="Actualizar", command=self.actualizar, bootstyle="success").grid(row=1, column=0, columnspan=2, pady=15)
+        self.btn_actualizar = ttk.Button(form_frame, text="Actualizar", command=self.actualizar, bootstyle="success")
+        self.btn_actualizar.grid(row=1, column=0, columnspan=2, pady=15)
 
     def actualizar(self):
         new_password = self.entry_password.get()
@@ -190,12 +205,16 @@ class PasswordForm(BaseDialog):
             return
         if len(new_password) < 4:
             messagebox.showwarning("Contraseña Corta", "Se recomienda al menos 4 caracteres.", parent=self)
-        # NOTA: La actualización de contraseña no genera auditoría en el flujo actual de database.py,
-        # pero si se necesitara, aquí sería el lugar para pasar el usuario_id (el del administrador
-        # que realiza el cambio, que no está disponible directamente en esta clase).
-        if actualizar_contrasena(self.user_id, new_password):
+        # El cambio lo audita database.py con el id del administrador
+        if self.auth.cambiar_contrasena(self.user_id, new_password, self._contrasena_actualizada,
+                                        usuario_admin_id=self.usuario_admin_id):
+            self.btn_actualizar.config(state=DISABLED, text="Guardando...")
+
+    def _contrasena_actualizada(self, resultado):
+        if resultado is True:
             messagebox.showinfo("Éxito", "Contraseña actualizada.", parent=self)
             self.callback()
             self.destroy()
         else:
-            messagebox.showerror("Error", "No se pudo actualizar la contraseña.", parent=self)
\ No newline at end of file
+            self.btn_actualizar.config(state=NORMAL, text="Actualizar")
+            messagebox.showerror("Error", str(resultado or "No se pudo actualizar la contraseña."), parent=self)
@@ -0,0 +1,310 @@
+# virtual_treeview.py
+import re
+import ttkbootstrap as ttk
+
+
+class VirtualTreeview(ttk.Treeview):
+    """
+    Treeview que solo tiene en Tk una ventana acotada de filas.
+
+    Las filas se dibujan por páginas: al acercarse el scroll al final se
+    agrega la página siguiente y, si la ventana pasa de PAGINAS_EN_VENTANA,
+    se borra la primera; al volver hacia arriba pasa lo inverso. Los datos
+    pueden ser una lista de Python (cargar_filas) o una fuente paginada con
+    keyset (cargar_fuente): en ese caso de cada página solo se guarda el
+    cursor, y al volver a ella se la pide de nuevo a la fuente.
+
+    Se usa igual que un ttk.Treeview (heading, column, bind, focus, item...);
+    en lugar de insertar fila por fila, se llama a cargar_filas().
+    """
+
+    TAMANO_PAGINA = 200
+    PAGINAS_EN_VENTANA = 3
+    UMBRAL_SCROLL = 0.9  # fracción del scroll a partir de la cual se mueve la ventana
+
+    def __init__(self, master=None, **kwargs):
+        self._yscroll_usuario = kwargs.pop("yscrollcommand", None)
+        super().__init__(master, yscrollcommand=self._al_desplazar, **kwargs)
+
+        self._filas = []          # todas las filas (solo con cargar_filas)
+        self._formatear = None    # fila -> values mostrados
+        self._etiquetas = None    # (posición, fila) -> tags
+        self._clave = None        # fila -> clave única (para actualizar_fila)
+        self._iids = {}           # clave -> iid de la fila dibujada
+        self._fila_de_iid = {}    # iid -> fila, solo de la ventana
+        self._ventana = []        # páginas dibujadas: lista de listas de iids
+        self._primera_pagina = 0  # número de página de self._ventana[0]
+        self._fuente = None       # fuente(ultima_fila) -> lista con la página siguiente
+        self._cursores = []       # argumento de la fuente para pedir cada página
+        self._total_paginas = None
+        self._movimiento_programado = False
+        self._orden = (None, False)
+        self._textos_encabezado = {}
+
+    # --- yscrollcommand se intercepta para detectar los bordes del scroll ---
+    def configure(self, cnf=None, **kw):
+        if "yscrollcommand" in kw:
+            self._yscroll_usuario = kw.pop("yscrollcommand")
+            kw["yscrollcommand"] = self._al_desplazar
+        return super().configure(cnf, **kw)
+
+    config = configure
+
+    def _al_desplazar(self, primero, ultimo):
+        if self._yscroll_usuario:
+            self._yscroll_usuario(primero, ultimo)
+        if self._movimiento_programado:
+            return
+        if float(ultimo) >= self.UMBRAL_SCROLL and self.hay_mas_filas():
+            self._movimiento_programado = True
+            self.after_idle(self._avanzar)
+        elif float(primero) <= 1 - self.UMBRAL_SCROLL and self._primera_pagina > 0:
+            self._movimiento_programado = True
+            self.after_idle(self._retroceder)
+
+    # --- Carga de datos ---
+    def cargar_filas(self, filas, formatear=None, etiquetas=None, clave=None):
+        """Reemplaza el contenido de la tabla por `filas` (solo se dibuja la primera página)."""
+        self._preparar(formatear, etiquetas, clave)
+        self._filas = list(filas or [])
+        self._habilitar_ordenamiento()
+        self._avanzar()
+
+    def cargar_fuente(self, fuente, formatear=None, etiquetas=None, clave=None):
+        """
+        Igual que cargar_filas, pero las filas se piden a `fuente(ultima_fila)`
+        página a página. La fuente recibe None para la primera página y
+        devuelve una lista vacía cuando no hay más.
+
+        Mientras queden páginas sin traer no se puede ordenar por columna: las
+        filas que faltan no entrarían en el orden. Si la fuente se agota con
+        todo el resultado en la ventana, las filas pasan a tratarse como una
+        lista y el ordenamiento se habilita.
+        """
+        self._preparar(formatear, etiquetas, clave)
+        self._fuente = fuente
+        self._cursores = [None]
+        self._total_paginas = None
+        self._deshabilitar_ordenamiento()
+        self._avanzar()
+
+    def limpiar(self):
+        self.cargar_filas([])
+
+    def _preparar(self, formatear, etiquetas, clave):
+        self.delete(*self.get_children())
+        self._formatear = formatear
+        self._etiquetas = etiquetas
+        self._clave = clave
+        self._iids = {}
+        self._fila_de_iid = {}
+        self._ventana = []
+        self._primera_pagina = 0
+        self._filas = []
+        self._fuente = None
+        self._cursores = []
+        self._total_paginas = None
+        self._restaurar_encabezados()
+        self._orden = (None, False)
+
+    def _existe_pagina(self, numero):
+        if self._fuente is None:
+            return numero * self.TAMANO_PAGINA < len(self._filas)
+        return self._total_paginas is None or numero < self._total_paginas
+
+    def hay_mas_filas(self):
+        return self._existe_pagina(self._primera_pagina + len(self._ventana))
+
+    def fila(self, iid):
+        """Fila original (sin formatear) que corresponde al item `iid`."""
+        return self._fila_de_iid[iid]
+
+    def filas(self):
+        """
+        Con cargar_filas, todas las filas en el orden actual; con una fuente
+        paginada, solo las de la ventana dibujada.
+        """
+        if self._fuente is None:
+            return list(self._filas)
+        return [self._fila_de_iid[iid] for pagina in self._ventana for iid in pagina]
+
+    def _obtener_pagina(self, numero):
+        if self._fuente is None:
+            inicio = numero * self.TAMANO_PAGINA
+            return self._filas[inicio:inicio + self.TAMANO_PAGINA]
+        # Keyset: el cursor de cada página es la última fila de la anterior,
+        # así una página descartada se vuelve a pedir igual que la primera vez.
+        pagina = self._fuente(self._cursores[numero]) or []
+        if numero == len(self._cursores) - 1:
+            if pagina:
+                self._cursores.append(pagina[-1])
+            else:
+                self._total_paginas = numero
+        return pagina
+
+    # --- Ventana de filas dibujadas ---
+    def _avanzar(self):
+        """Dibuja la página siguiente y descarta la primera si sobra."""
+        self._movimiento_programado = False
+        numero = self._primera_pagina + len(self._ventana)
+        if not self._existe_pagina(numero):
+            return
+        arriba = self._fila_superior()
+        filas = self._obtener_pagina(numero)
+        if filas:
+            self._ventana.append(self._dibujar(numero, filas, "end"))
+        if len(self._ventana) > self.PAGINAS_EN_VENTANA:
+            quitadas = self._descartar(self._ventana.pop(0))
+            self._primera_pagina += 1
+            self._mover_a(arriba - quitadas)
+        if self._fuente is not None and self._total_paginas is not None and self._primera_pagina == 0:
+            self._pasar_a_lista()
+        elif self._fuente is not None and 0 < len(filas) < self.TAMANO_PAGINA and not self._movimiento_programado:
+            # Página corta: probablemente la última. Se confirma enseguida
+            # para habilitar el ordenamiento sin esperar al scroll.
+            self._movimiento_programado = True
+            self.after_idle(self._avanzar)
+
+    def _retroceder(self):
+        """Vuelve a dibujar la página anterior a la ventana y descarta la última."""
+        self._movimiento_programado = False
+        if self._primera_pagina == 0:
+            return
+        arriba = self._fila_superior()
+        numero = self._primera_pagina - 1
+        pagina = self._dibujar(numero, self._obtener_pagina(numero), 0)
+        self._ventana.insert(0, pagina)
+        self._primera_pagina = numero
+        if len(self._ventana) > self.PAGINAS_EN_VENTANA:
+            self._descartar(self._ventana.pop())
+        self._mover_a(arriba + len(pagina))
+
+    def _dibujar(self, numero, filas, indice):
+        iids = []
+        for i, fila in enumerate(filas):
+            posicion = numero * self.TAMANO_PAGINA + i
+            valores = self._formatear(fila) if self._formatear else fila
+            tags = self._etiquetas(posicion, fila) if self._etiquetas else ()
+            iid = self.insert("", indice if indice == "end" else indice + i, values=valores, tags=tags)
+            self._fila_de_iid[iid] = fila
+            if self._clave:
+                self._iids[self._clave(fila)] = iid
+            iids.append(iid)
+        return iids
+
+    def _descartar(self, iids):
+        for iid in iids:
+            fila = self._fila_de_iid.pop(iid)
+            if self._clave and self._iids.get(self._clave(fila)) == iid:
+                del self._iids[self._clave(fila)]
+        self.delete(*iids)
+        return len(iids)
+
+    def _fila_superior(self):
+        # Índice del primer item visible, para que la vista no salte al
+        # agregar o quitar filas por encima.
+        return round(float(self.yview()[0]) * len(self.get_children()))
+
+    def _mover_a(self, indice):
+        total = len(self.get_children())
+        if total:
+            self.yview_moveto(max(indice, 0) / total)
+
+    def _pasar_a_lista(self):
+        # Fuente agotada con todas sus filas dibujadas: desde ahora es una
+        # lista común (se puede ordenar) y las páginas se cortan por tamaño.
+        iids = [iid for pagina in self._ventana for iid in pagina]
+        self._filas = [self._fila_de_iid[iid] for iid in iids]
+        self._ventana = [
+            iids[i:i + self.TAMANO_PAGINA] for i in range(0, len(iids), self.TAMANO_PAGINA)
+        ]
+        self._fuente = None
+        self._cursores = []
+        self._total_paginas = None
+        self._habilitar_ordenamiento()
+
+    # --- Actualización puntual ---
+    def actualizar_fila(self, clave, fila=None):
+        """
+        Reemplaza los datos de la fila con esa clave (si se pasa `fila`) y la
+        vuelve a formatear si ya está dibujada. Requiere `clave` en la carga.
+        """
+        if fila is not None and self._fuente is None:
+            for i, actual in enumerate(self._filas):
+                if self._clave(actual) == clave:
+                    self._filas[i] = fila
+                    break
+        iid = self._iids.get(clave)
+        if iid is None or not self.exists(iid):
+            return
+        if fila is None:
+            fila = self._fila_de_iid[iid]
+        self._fila_de_iid[iid] = fila
+        valores = self._formatear(fila) if self._formatear else fila
+        self.item(iid, values=valores)
+
+    # --- Ordenamiento por columna (sin volver a consultar la base) ---
+    def _habilitar_ordenamiento(self):
+        for col in self["columns"]:
+            self.heading(col, command=lambda c=col: self.ordenar_por(c))
+
+    def _deshabilitar_ordenamiento(self):
+        for col in self["columns"]:
+            self.heading(col, command="")
+
+    def _restaurar_encabezados(self):
+        # Solo se quita la flecha si el encabezado no fue reconfigurado después.
+        for col, (texto, con_flecha) in self._textos_encabezado.items():
+            if col in self["columns"] and self.heading(col, "text") == con_flecha:
+                self.heading(col, text=texto)
+        self._textos_encabezado = {}
+
+    @staticmethod
+    def _clave_orden(valor):
+        if isinstance(valor, (int, float)):
+            return (0, valor, "")
+        texto = str(valor)
+        limpio = re.sub(r"[$%\s,]", "", texto)
+        try:
+            return (0, float(limpio), "")
+        except ValueError:
+            return (1, 0, texto.lower())
+
+    def ordenar_por(self, columna):
+        """
+        Ordena las filas por el valor mostrado en `columna`. Un segundo clic
+        invierte el orden. Con una fuente paginada que todavía tiene páginas
+        sin traer no hace nada (el orden quedaría a medias).
+        """
+        columnas = list(self["columns"])
+        if columna not in columnas or self._fuente is not None:
+            return
+        indice = columnas.index(columna)
+        anterior, descendente = self._orden
+        descendente = not descendente if anterior == columna else False
+
+        def valor(fila):
+            valores = self._formatear(fila) if self._formatear else fila
+            return self._clave_orden(valores[indice])
+
+        self._filas.sort(key=valor, reverse=descendente)
+        self._orden = (columna, descendente)
+
+        self._restaurar_encabezados()
+        texto = self.heading(columna, "text")
+        con_flecha = texto + (" ▼" if descendente else " ▲")
+        self._textos_encabezado[columna] = (texto, con_flecha)
+        self.heading(columna, text=con_flecha)
+
+        # Se vuelve al principio con tantas páginas como había dibujadas.
+        paginas = max(len(self._ventana), 1)
+        self.delete(*self.get_children())
+        self._iids = {}
+        self._fila_de_iid = {}
+        self._ventana = []
+        self._primera_pagina = 0
+        for numero in range(paginas):
+            if not self._existe_pagina(numero):
+                break
+            self._ventana.append(self._dibujar(numero, self._obtener_pagina(numero), "end"))
+        self.yview_moveto(0)